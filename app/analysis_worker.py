@@ -0,0 +1,146 @@
+# Analysis worker for uploaded-but-unanalyzed images
+#
+# Claims images through claim_unanalyzed_images() (supabase/analysis_queue.sql)
+# and asks the on-image-upload edge function to re-run analysis for each one.
+# Any number of workers can run at once: claims use FOR UPDATE SKIP LOCKED, so
+# no image is handed to two workers while its lease is live.
+#
+# Reanalysis requests must carry REANALYZE_SECRET, set to the same value as the
+# edge function secret of that name.
+#
+# Usage:
+#     python app/analysis_worker.py [--concurrency 4] [--once]
+import argparse
+import asyncio
+import os
+import socket
+import uuid
+from typing import Any, Dict, List
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class AnalysisWorker:
+    def __init__(
+        self,
+        supabase_url: str,
+        service_role_key: str,
+        reanalyze_secret: str,
+        concurrency: int = 4,
+        lease_seconds: int = 300,
+        max_claims: int = 5,
+        poll_interval: float = 15.0
+    ):
+        self.supabase_url = supabase_url
+        self.headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": "application/json"
+        }
+        self.reanalyze_secret = reanalyze_secret
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.max_claims = max_claims
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+    async def claim(self, client: httpx.AsyncClient) -> List[Dict[str, Any]]:
+        response = await client.post(
+            f"{self.supabase_url}/rest/v1/rpc/claim_unanalyzed_images",
+            headers=self.headers,
+            json={
+                "claim_limit": self.concurrency,
+                "worker_id": self.worker_id,
+                "lease_seconds": self.lease_seconds,
+                "max_claims": self.max_claims
+            }
+        )
+        if response.status_code != 200:
+            raise Exception(f"Claim failed: {response.status_code} - {response.text}")
+        return response.json()
+
+    async def release(self, client: httpx.AsyncClient, image_id: str):
+        await client.post(
+            f"{self.supabase_url}/rest/v1/rpc/release_image_claim",
+            headers=self.headers,
+            json={"target_id": image_id, "worker_id": self.worker_id}
+        )
+
+    async def process(self, client: httpx.AsyncClient, image: Dict[str, Any]) -> bool:
+        """Re-run analysis for one claimed image; releases the claim on failure"""
+        image_id = image["id"]
+        try:
+            response = await client.post(
+                f"{self.supabase_url}/functions/v1/on-image-upload",
+                headers={**self.headers, "X-Reanalyze-Secret": self.reanalyze_secret},
+                json={
+                    "reanalyze": True,
+                    "image_id": image_id,
+                    "record": {"name": image["image_name"]}
+                },
+                # Vision analysis with a low-confidence retry can take a while
+                timeout=float(self.lease_seconds)
+            )
+            if response.status_code == 200:
+                print(f"✅ Analyzed {image_id} (claim #{image['analysis_claims']})")
+                return True
+            print(f"❌ Analysis failed for {image_id}: {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"❌ Analysis error for {image_id}: {e}")
+
+        await self.release(client, image_id)
+        return False
+
+    async def run(self, once: bool = False) -> int:
+        """Claim and process batches until the queue is empty (once) or forever"""
+        processed = 0
+        print(f"🚀 Analysis worker {self.worker_id} started (concurrency {self.concurrency})")
+        async with httpx.AsyncClient() as client:
+            while True:
+                try:
+                    images = await self.claim(client)
+                except Exception as e:
+                    print(f"⚠️ {e}")
+                    images = []
+
+                if images:
+                    results = await asyncio.gather(*(self.process(client, image) for image in images))
+                    processed += sum(results)
+                    continue
+
+                if once:
+                    break
+                await asyncio.sleep(self.poll_interval)
+
+        print(f"🎉 Worker {self.worker_id} finished: {processed} images analyzed")
+        return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run analysis for unanalyzed images")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--lease-seconds", type=int, default=300)
+    parser.add_argument("--max-claims", type=int, default=5)
+    parser.add_argument("--once", action="store_true", help="Exit when no claimable images are left")
+    args = parser.parse_args()
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    reanalyze_secret = os.getenv("REANALYZE_SECRET")
+    if not supabase_url or not service_role_key:
+        raise SystemExit("❌ Supabase config missing")
+    if not reanalyze_secret:
+        raise SystemExit("❌ REANALYZE_SECRET missing (must match the edge function secret)")
+
+    worker = AnalysisWorker(
+        supabase_url,
+        service_role_key,
+        reanalyze_secret,
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+        max_claims=args.max_claims
+    )
+    asyncio.run(worker.run(once=args.once))
@@ -0,0 +1,96 @@
+# Dashboard analytics served from materialized views
+#
+# See supabase/analytics_materialized.sql. The database decides whether a refresh
+# is needed (images changed) and debounces it; this module just calls it on a
+# schedule and keeps the latest snapshot in memory so dashboard loads never touch
+# the images table.
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+class AnalyticsScheduler:
+    def __init__(
+        self,
+        supabase_url: str,
+        service_role_key: str,
+        refresh_interval: float = 30.0,
+        min_refresh_interval: float = 30.0,
+        snapshot_ttl: float = 10.0
+    ):
+        self.rpc_url = f"{supabase_url}/rest/v1/rpc"
+        self.headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": "application/json"
+        }
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.snapshot_ttl = snapshot_ttl
+
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_expires_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Ask the database to refresh the views; returns True if it did"""
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.rpc_url}/refresh_analytics_views",
+                headers=self.headers,
+                json={"min_interval": f"{self.min_refresh_interval} seconds", "force": force},
+                timeout=120.0
+            )
+        if response.status_code != 200:
+            raise Exception(f"Analytics refresh failed: {response.status_code} - {response.text}")
+
+        refreshed = bool(response.json())
+        if refreshed:
+            # Next read picks up the new data
+            self._snapshot_expires_at = 0.0
+        return refreshed
+
+    async def get_snapshot(self) -> Dict[str, Any]:
+        """Return the latest analytics snapshot, re-reading it at most every snapshot_ttl seconds"""
+        if self._snapshot is not None and self._snapshot_expires_at > time.monotonic():
+            return self._snapshot
+
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.rpc_url}/get_analytics_snapshot",
+                headers=self.headers,
+                json={}
+            )
+        if response.status_code != 200:
+            raise Exception(f"Analytics snapshot failed: {response.status_code} - {response.text}")
+
+        snapshot = response.json()
+        snapshot["fetched_at"] = datetime.utcnow().isoformat() + "Z"
+        self._snapshot = snapshot
+        self._snapshot_expires_at = time.monotonic() + self.snapshot_ttl
+        return snapshot
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.refresh():
+                    print("📊 Analytics views refreshed")
+            except Exception as e:
+                print(f"⚠️ Analytics refresh error: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
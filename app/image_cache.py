@@ -0,0 +1,141 @@
+# On-disk LRU cache for images served through /img (see app/main.py)
+#
+# Entries are files named by a hash of their key (object name, plus the width
+# for resized variants). Once the directory holds more than max_bytes the
+# least recently used entries are deleted. The index is kept in memory and
+# rebuilt from the directory on start (hits touch the file's mtime), so the
+# cache survives restarts. Concurrent misses for one key share a single fill.
+#
+# Each entry's strong ETag is a hash of its content, computed when it is
+# written (or on first use after a restart).
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+TMP_SUFFIX = ".tmp"
+
+
+def _file_etag(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # file name -> [size, etag or None], least recently used first
+        self._entries: "OrderedDict[str, List]" = OrderedDict()
+        self._fills: Dict[str, asyncio.Future] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Index the files already in the directory, oldest first"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(TMP_SUFFIX):  # interrupted fill
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._entries.clear()
+        self.size = 0
+        for _, name, size in sorted(files):
+            self._entries[name] = [size, None]
+            self.size += size
+        self._evict()
+        return len(self._entries)
+
+    def _name(self, key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _evict(self, keep: Optional[str] = None):
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            name, (size, _) = next(iter(self._entries.items()))
+            if name == keep:
+                self._entries.move_to_end(name)
+                continue
+            del self._entries[name]
+            self.size -= size
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def _write(self, name: str, tmp_path: str) -> Tuple[int, str]:
+        etag = _file_etag(tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self._path(name))
+        return size, etag
+
+    async def get(self, key: str, fill: Callable[[BinaryIO], Awaitable[None]]) -> Tuple[str, str]:
+        """(path, etag) of the cached entry for key, calling fill with an open
+        file to create it on a miss. Exceptions from fill reach every caller
+        waiting on that key and nothing is cached."""
+        name = self._name(key)
+        entry = self._entries.get(name)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(name)
+            path = self._path(name)
+            if entry[1] is None:
+                entry[1] = await asyncio.to_thread(_file_etag, path)
+            try:
+                os.utime(path)
+            except FileNotFoundError:  # removed behind our back; fill again
+                self._entries.pop(name, None)
+                self.size -= entry[0]
+            else:
+                return path, entry[1]
+
+        pending = self._fills.get(name)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._fills[name] = future
+        tmp_path = f"{self._path(name)}.{os.getpid()}.{time.monotonic_ns()}{TMP_SUFFIX}"
+        try:
+            with open(tmp_path, "wb") as f:
+                await fill(f)
+            size, etag = await asyncio.to_thread(self._write, name, tmp_path)
+            self._entries[name] = [size, etag]
+            self.size += size
+            self._evict(keep=name)
+            result = (self._path(name), etag)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here so lone fills don't log "never retrieved"
+            raise
+        finally:
+            if not future.done():  # cancelled
+                future.cancel()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            del self._fills[name]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
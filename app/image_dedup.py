@@ -0,0 +1,176 @@
+# Near-duplicate detection for uploads
+#
+# Every stored image gets a 64-bit difference hash (dHash) of what was stored,
+# so re-uploads of the same flashcard (re-saved, re-scanned, re-sized) land
+# within a few bits of each other. Hashes are kept in a BK-tree, which answers
+# "anything within N bits?" without comparing against every image.
+#
+# The tree is loaded from images.phash (see supabase/dedup.sql) and extended
+# with each upload. Like the upload job queue it is per-process: uploads made
+# through other processes are picked up on the next load.
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: one bit per horizontally adjacent pair of a 9x8
+    grayscale thumbnail, set where brightness falls from left to right"""
+    pixels = image.convert('L').resize((9, 8), Image.Resampling.BOX).tobytes()
+    value = 0
+    for row in range(8):
+        for x in range(row * 9, row * 9 + 8):
+            value = (value << 1) | (pixels[x] > pixels[x + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed(value: int) -> int:
+    """Unsigned 64-bit hash -> Postgres BIGINT"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed(value: int) -> int:
+    """Postgres BIGINT -> unsigned 64-bit hash"""
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class BKTree:
+    """Metric tree over Hamming distance. Each node holds one hash, every item
+    with that exact hash, and children keyed by their distance to it; a search
+    within `d` only descends into children whose key is within d of the
+    query's distance to the node (triangle inequality)."""
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, item: Any):
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """All (distance, item) within max_distance of value, nearest first"""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = (value ^ node[0]).bit_count()
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for key, child in node[2].items() if low <= key <= high)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def __len__(self):
+        return self.size
+
+
+class DuplicateIndex:
+    """BK-tree of stored images' hashes, loaded from Supabase"""
+
+    def __init__(self, supabase_url: str, service_role_key: str, max_distance: int = 4, page_size: int = 1000):
+        self.images_url = f"{supabase_url}/rest/v1/images"
+        self.headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+            "Content-Type": "application/json"
+        }
+        self.max_distance = max_distance
+        self.page_size = page_size
+
+        self.tree = BKTree()
+        self.loaded = False
+        # Uploads indexed while the first load runs, re-added to the loaded tree
+        self._pending: List[Tuple[int, Dict[str, Any]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Load in the background; uploads are not deduplicated against
+        existing images until loading finishes"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._load_logged())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def load(self) -> int:
+        """Read every stored hash (keyset pagination on id) into a fresh tree"""
+        tree = BKTree()
+        last_id = None
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            while True:
+                params = {
+                    "select": "id,source_name,phash",
+                    "phash": "not.is.null",
+                    "order": "id.asc",
+                    "limit": str(self.page_size),
+                }
+                if last_id:
+                    params["id"] = f"gt.{last_id}"
+                response = await client.get(self.images_url, headers=self.headers, params=params)
+                if response.status_code != 200:
+                    raise Exception(f"Hash load failed: {response.status_code} - {response.text}")
+                rows = response.json()
+                if not rows:
+                    break
+                for row in rows:
+                    tree.add(from_signed(row["phash"]), {"id": row["id"], "source_name": row.get("source_name")})
+                last_id = rows[-1]["id"]
+        for value, item in self._pending:
+            tree.add(value, item)
+        self._pending = []
+        self.tree = tree
+        self.loaded = True
+        return len(tree)
+
+    async def _load_logged(self):
+        try:
+            count = await self.load()
+            print(f"🔎 Duplicate index loaded: {count:,} hashes")
+        except Exception as e:
+            print(f"⚠️ Duplicate index not loaded: {e}")
+
+    def add(self, value: int, source_name: str):
+        """Index a newly stored upload; its image id is not known until the edge function runs"""
+        item = {"id": None, "source_name": source_name}
+        self.tree.add(value, item)
+        if not self.loaded:
+            self._pending.append((value, item))
+
+    def find(self, value: int) -> Optional[Dict[str, Any]]:
+        """Nearest stored image within max_distance, as {"id", "source_name", "distance"}"""
+        matches = self.tree.search(value, self.max_distance)
+        if not matches:
+            return None
+        distance, item = matches[0]
+        return {**item, "distance": distance}
@@ -0,0 +1,181 @@
+# Byte-budget encoder for images sent to the Vision API
+#
+# Tries each candidate format, searches quality for the smallest output that
+# still looks like the resized image (SSIM >= ENCODER_MIN_SSIM), and keeps the
+# smallest candidate, preferring those within ENCODER_TARGET_BYTES. Flat-colour
+# flashcards usually win as palette PNG or WebP; photos as WebP or JPEG.
+#
+# Only formats the Vision API accepts are candidates (so no AVIF).
+import io
+import os
+from array import array
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageMath, features
+
+ENCODER_FORMATS = tuple(
+    f.strip().upper() for f in os.getenv("ENCODER_FORMATS", "webp,png,jpeg").split(",") if f.strip()
+)
+ENCODER_TARGET_BYTES = int(os.getenv("ENCODER_TARGET_BYTES", str(100 * 1024)))
+ENCODER_MIN_SSIM = float(os.getenv("ENCODER_MIN_SSIM", "0.95"))
+ENCODER_QUALITY_RANGE = (30, 90)
+# Quality search stops once the bracket is this narrow
+ENCODER_QUALITY_STEP = 5
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+# Display derivatives (gallery thumbnails, previews) are never analysed, so they
+# skip the search and always use one format, which keeps their names predictable
+DISPLAY_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+DISPLAY_QUALITY = int(os.getenv("DISPLAY_QUALITY", "70"))
+
+
+def multiply(a: Image.Image, b: Image.Image) -> Image.Image:
+    if hasattr(ImageMath, "lambda_eval"):
+        return ImageMath.lambda_eval(lambda args: args["a"] * args["b"], a=a, b=b)
+    return ImageMath.eval("a * b", a=a, b=b)  # Pillow < 10.3
+
+
+def ssim(a: Image.Image, b: Image.Image, window: int = 8) -> float:
+    """Mean SSIM over non-overlapping windows of two same-size grayscale images.
+
+    Window statistics come from BOX downscales of float images, so only the
+    per-window formula runs in Python.
+    """
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    columns, rows = a.size[0] // window, a.size[1] // window
+    if not columns or not rows:
+        return 1.0
+    crop = (0, 0, columns * window, rows * window)
+    fa, fb = a.convert('F').crop(crop), b.convert('F').crop(crop)
+
+    def window_means(image):
+        return array('f', image.resize((columns, rows), Image.Resampling.BOX).tobytes())
+
+    mean_a, mean_b = window_means(fa), window_means(fb)
+    mean_aa, mean_bb = window_means(multiply(fa, fa)), window_means(multiply(fb, fb))
+    mean_ab = window_means(multiply(fa, fb))
+
+    total = 0.0
+    for mx, my, mxx, myy, mxy in zip(mean_a, mean_b, mean_aa, mean_bb, mean_ab):
+        vx, vy, cov = mxx - mx * mx, myy - my * my, mxy - mx * my
+        total += ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return total / (columns * rows)
+
+
+def _encode(image: Image.Image, fmt: str, quality: Optional[int]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    buffer.seek(0)
+    return buffer
+
+
+def _score(reference: Image.Image, buffer: io.BytesIO) -> float:
+    with Image.open(buffer) as decoded:
+        score = ssim(reference, decoded.convert('L'))
+    buffer.seek(0)
+    return score
+
+
+def _palette_candidate(image: Image.Image, reference: Image.Image, min_ssim: float):
+    # Exact when the image has few colours (typical flashcards); otherwise a
+    # 256-colour quantization that has to pass the SSIM check like any lossy format
+    if image.getcolors(256) is not None:
+        buffer = _encode(image.convert('P', palette=Image.Palette.ADAPTIVE, colors=256), "PNG", None)
+        return buffer, 1.0
+    buffer = _encode(image.quantize(256, method=Image.Quantize.FASTOCTREE), "PNG", None)
+    score = _score(reference, buffer)
+    return (buffer, score) if score >= min_ssim else None
+
+
+def _quality_candidate(image: Image.Image, fmt: str, reference: Image.Image, min_ssim: float):
+    """Lowest quality whose output still meets min_ssim (binary search)"""
+    low, high = ENCODER_QUALITY_RANGE
+    best = None
+    buffer = _encode(image, fmt, high)
+    score = _score(reference, buffer)
+    if score < min_ssim:
+        return None
+    best = (buffer, score, high)
+    while high - low > ENCODER_QUALITY_STEP:
+        quality = (low + high) // 2
+        buffer = _encode(image, fmt, quality)
+        score = _score(reference, buffer)
+        if score >= min_ssim:
+            best = (buffer, score, quality)
+            high = quality
+        else:
+            low = quality
+    return best
+
+
+def encode_for_vision(
+    image: Image.Image,
+    formats: Iterable[str] = ENCODER_FORMATS,
+    target_bytes: int = ENCODER_TARGET_BYTES,
+    min_ssim: float = ENCODER_MIN_SSIM,
+    fallback_quality: int = 75
+) -> Tuple[io.BytesIO, Dict[str, Any]]:
+    """
+    Encode an RGB image as the smallest candidate meeting min_ssim.
+
+    Returns (buffer, info) where info has format, content_type, extension,
+    quality, ssim, bytes and within_target. Falls back to JPEG at
+    fallback_quality if no candidate reaches min_ssim.
+    """
+    reference = image.convert('L')
+    candidates = []
+    for fmt in formats:
+        if fmt not in CONTENT_TYPES or (fmt == "WEBP" and not features.check("webp")):
+            continue
+        if fmt == "PNG":
+            result = _palette_candidate(image, reference, min_ssim)
+            if result:
+                candidates.append((result[0], fmt, None, result[1]))
+        else:
+            result = _quality_candidate(image, fmt, reference, min_ssim)
+            if result:
+                candidates.append((result[0], fmt, result[2], result[1]))
+
+    if candidates:
+        sizes = [(c[0].getbuffer().nbytes, c) for c in candidates]
+        within = [item for item in sizes if item[0] <= target_bytes]
+        size, (buffer, fmt, quality, score) = min(within or sizes, key=lambda item: item[0])
+    else:
+        fmt, quality = "JPEG", fallback_quality
+        buffer = _encode(image, fmt, quality)
+        score = None
+        size = buffer.getbuffer().nbytes
+
+    return buffer, {
+        "format": fmt,
+        "content_type": CONTENT_TYPES[fmt],
+        "extension": EXTENSIONS[fmt],
+        "quality": quality,
+        "ssim": round(score, 4) if score is not None else None,
+        "bytes": size,
+        "within_target": size <= target_bytes,
+    }
+
+
+def encode_for_display(image: Image.Image, quality: int = DISPLAY_QUALITY) -> io.BytesIO:
+    """Encode an RGB image as DISPLAY_FORMAT for browsers"""
+    return _encode(image, DISPLAY_FORMAT, quality)
+
+
+def detect_format(stream) -> Optional[str]:
+    """Image format of a stream from its header (e.g. 'JPEG'), or None"""
+    try:
+        stream.seek(0)
+        with Image.open(stream) as image:
+            return image.format
+    except Exception:
+        return None
+    finally:
+        stream.seek(0)
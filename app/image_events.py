@@ -0,0 +1,296 @@
+# Live image events for GET /api/events (Server-Sent Events)
+#
+# Open galleries learn about new images and finished analyses without
+# reloading. Changed image ids come from one of two sources (see
+# supabase/image_events.sql):
+#
+#   NotifyListener: LISTEN image_events on a direct Postgres connection
+#                   (DATABASE_URL, needs asyncpg)
+#   ChangePoller:   polls images.analysis_updated_at through PostgREST, one
+#                   query per interval for all browsers, only while any are
+#                   connected; the stand-in when there is no direct connection
+#
+# The broker collects ids for a moment, loads the changed rows once (whatever
+# the number of subscribers) and fans the result out to every open stream.
+# Recent events are kept so a reconnecting browser (Last-Event-ID) gets what
+# it missed; a browser that can't be caught up is sent "resync" instead.
+import asyncio
+import json
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+
+try:
+    import asyncpg
+except ImportError:  # only needed for LISTEN/NOTIFY
+    asyncpg = None
+
+IMAGE_EVENTS_CHANNEL = "image_events"
+
+Event = Tuple[str, str, Dict[str, Any]]  # (event id, event name, data)
+
+
+def format_sse(event_id: Optional[str], event: str, data: Dict[str, Any]) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.lagged = False
+
+
+class ImageEventBroker:
+    def __init__(
+        self,
+        loader: Callable[[List[str]], Awaitable[List[Dict[str, Any]]]],
+        replay: int = 256,
+        queue_size: int = 256,
+        batch_delay: float = 0.2
+    ):
+        self.loader = loader  # changed ids -> "image" event payloads
+        self.queue_size = queue_size
+        self.batch_delay = batch_delay
+        # Event ids are "<epoch>-<n>"; the epoch tells a reconnect after a
+        # restart apart from one we can replay
+        self._epoch = uuid.uuid4().hex[:8]
+        self._counter = 0
+        self._recent: "deque[Event]" = deque(maxlen=replay)
+        self._subscribers: Set[Subscriber] = set()
+        self._pending: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.has_subscribers = asyncio.Event()
+        self.published = 0
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[Subscriber, List[Event]]:
+        """A new subscriber and the events to send it first: those after
+        last_event_id, or a resync when they are no longer known"""
+        subscriber = Subscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        self.has_subscribers.set()
+        backlog: List[Event] = []
+        if last_event_id:
+            ids = [event[0] for event in self._recent]
+            if last_event_id in ids:
+                backlog = list(self._recent)[ids.index(last_event_id) + 1:]
+            else:
+                backlog = [(None, "resync", {"reason": "missed events"})]
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        if not self._subscribers:
+            self.has_subscribers.clear()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> str:
+        self._counter += 1
+        item = (f"{self._epoch}-{self._counter}", event, data)
+        self._recent.append(item)
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Too slow to keep up: its stream ends with a resync
+                subscriber.lagged = True
+                self.unsubscribe(subscriber)
+        return item[0]
+
+    def resync(self, reason: str):
+        """Tell every subscriber that events may have been lost"""
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait((None, "resync", {"reason": reason}))
+            except asyncio.QueueFull:
+                subscriber.lagged = True
+                self.unsubscribe(subscriber)
+
+    def notify(self, image_ids: Iterable[str]):
+        """Changed image ids; loaded and published together shortly after"""
+        self._pending.update(image_ids)
+        if self._pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(self.batch_delay)
+        while self._pending:
+            ids = list(self._pending)
+            self._pending.clear()
+            if not self._subscribers:
+                continue  # nobody to tell
+            try:
+                payloads = await self.loader(ids)
+            except Exception as e:
+                print(f"⚠️ Image events: loading {len(ids)} changed images failed: {e}")
+                self.resync("load failed")
+                continue
+            for payload in payloads:
+                self.publish("image", payload)
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"subscribers": len(self._subscribers), "published": self.published}
+
+
+class NotifyListener:
+    """LISTEN on a direct Postgres connection, reconnecting with backoff.
+    on_change, if given, also receives each changed id, or None after a
+    reconnect (changes may have been missed)"""
+
+    def __init__(
+        self,
+        dsn: str,
+        broker: ImageEventBroker,
+        channel: str = IMAGE_EVENTS_CHANNEL,
+        on_change: Optional[Callable[[Optional[List[str]]], None]] = None
+    ):
+        if asyncpg is None:
+            raise RuntimeError("asyncpg is required for DATABASE_URL (pip install asyncpg)")
+        self.dsn = dsn
+        self.broker = broker
+        self.channel = channel
+        self.on_change = on_change
+        self._task: Optional[asyncio.Task] = None
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            image_id = json.loads(payload)["id"]
+        except (ValueError, KeyError, TypeError):
+            print(f"⚠️ Image events: bad notification payload {payload!r}")
+            return
+        if self.on_change:
+            self.on_change([image_id])
+        self.broker.notify([image_id])
+
+    async def _run(self):
+        delay = 1.0
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.get_running_loop().create_future()
+                connection.add_termination_listener(lambda _: closed.done() or closed.set_result(None))
+                await connection.add_listener(self.channel, self._on_notification)
+                print(f"📡 Image events: listening on {self.channel}")
+                if connected_before:
+                    # Anything written while disconnected was not heard
+                    if self.on_change:
+                        self.on_change(None)
+                    self.broker.resync("reconnected")
+                connected_before = True
+                delay = 1.0
+                await closed
+                print("⚠️ Image events: database connection closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Image events: LISTEN failed: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ChangePoller:
+    """Polls analysis_updated_at through PostgREST while anyone is subscribed"""
+
+    # Rows are stamped with their transaction's start time, so one committing
+    # slightly late can carry a timestamp below the last one seen; each poll
+    # looks this far back and skips (id, timestamp) pairs already reported
+    OVERLAP = timedelta(seconds=10)
+    BATCH = 500
+
+    def __init__(self, supabase_url: str, service_role_key: str, broker: ImageEventBroker, interval: float = 2.0):
+        self.url = f"{supabase_url}/rest/v1/images"
+        self.headers = {
+            "apikey": service_role_key,
+            "Authorization": f"Bearer {service_role_key}",
+        }
+        self.broker = broker
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _latest(self, client: httpx.AsyncClient) -> datetime:
+        resp = await client.get(self.url, headers=self.headers, params={
+            "select": "analysis_updated_at", "order": "analysis_updated_at.desc", "limit": "1"
+        })
+        resp.raise_for_status()
+        rows = resp.json()
+        return datetime.fromisoformat(rows[0]["analysis_updated_at"]) if rows else datetime.fromtimestamp(0).astimezone()
+
+    async def _changes(self, client: httpx.AsyncClient, since: datetime) -> List[Dict[str, Any]]:
+        resp = await client.get(self.url, headers=self.headers, params={
+            "select": "id,analysis_updated_at",
+            "analysis_updated_at": f"gt.{(since - self.OVERLAP).isoformat()}",
+            "order": "analysis_updated_at.asc",
+            "limit": str(self.BATCH)
+        })
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _run(self):
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            while True:
+                await self.broker.has_subscribers.wait()
+                try:
+                    # Changes made while nobody was watching are not replayed
+                    since = await self._latest(client)
+                    seen = {row["id"]: row["analysis_updated_at"] for row in await self._changes(client, since)}
+                    while self.broker.has_subscribers.is_set():
+                        await asyncio.sleep(self.interval)
+                        rows = await self._changes(client, since)
+                        changed = [row["id"] for row in rows if seen.get(row["id"]) != row["analysis_updated_at"]]
+                        for row in rows:
+                            seen[row["id"]] = row["analysis_updated_at"]
+                        if rows:
+                            since = max(since, datetime.fromisoformat(rows[-1]["analysis_updated_at"]))
+                            floor = since - self.OVERLAP
+                            seen = {k: v for k, v in seen.items() if datetime.fromisoformat(v) > floor}
+                        if changed:
+                            self.broker.notify(changed)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Image events: change poll failed: {e}")
+                    self.broker.resync("poll failed")
+                    await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,603 @@
+# Image processing for uploads
+#
+# Shrinks uploads before they reach Supabase Storage so the Vision API sees
+# small images (see analyze_tokens.py for the token model).
+import io
+import os
+import resource
+import sys
+import uuid
+from array import array
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from image_encoding import (
+    CONTENT_TYPES,
+    DISPLAY_FORMAT,
+    ENCODER_MIN_SSIM,
+    ENCODER_TARGET_BYTES,
+    EXTENSIONS,
+    detect_format,
+    encode_for_display,
+    encode_for_vision,
+    multiply,
+)
+from image_dedup import dhash
+from pre_analysis import pre_analyze
+from vision_budget import plan_vision_resize, vision_image_tokens
+
+
+# Limits checked against the header before anything is decoded. A JPEG over
+# UPLOAD_MAX_PIXELS is still accepted if decoder draft scaling (down to 1/8)
+# brings it within budget; anything else over budget is rejected.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(40_000_000)))
+# When an image can't be resized, the original is stored only if it is this
+# small and within the Vision API's 2048px box; otherwise the upload fails
+UPLOAD_FALLBACK_MAX_BYTES = int(os.getenv("UPLOAD_FALLBACK_MAX_BYTES", str(1024 * 1024)))
+FALLBACK_MAX_SIDE = 2048
+
+# Pillow's decompression-bomb guard stays on for every decode in the process
+# (uploads, sheets, the /img proxy): images over DECODE_MAX_PIXELS (twice
+# MAX_IMAGE_PIXELS) are refused on open. It sits above UPLOAD_MAX_PIXELS so an
+# oversized JPEG upload can still be draft-scaled into budget; the upload paths
+# check UPLOAD_MAX_PIXELS themselves once the draft size is known.
+DECODE_MAX_PIXELS = int(os.getenv("DECODE_MAX_PIXELS", str(4 * UPLOAD_MAX_PIXELS)))
+Image.MAX_IMAGE_PIXELS = DECODE_MAX_PIXELS // 2
+
+
+class ImageRejected(Exception):
+    """Upload refused before or instead of being stored"""
+
+    def __init__(self, message: str, status_code: int = 422):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def too_large(error: Image.DecompressionBombError) -> ImageRejected:
+    """Pillow's bomb guard refused to open an image"""
+    return ImageRejected(f"Image too large: {error}", status_code=413)
+
+
+def stream_size(stream) -> int:
+    """Size of a seekable stream in bytes, without reading it"""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def peak_rss_mb() -> float:
+    """Process high-water resident set size in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def fit_within(size, max_width=512, max_height=512):
+    """Target size for an image of `size`, keeping its aspect ratio within the box"""
+    width, height = size
+    aspect_ratio = width / height
+    
+    if width <= max_width and height <= max_height:
+        return width, height
+    
+    if aspect_ratio > 1:  # Landscape
+        new_width = min(width, max_width)
+        new_height = int(new_width / aspect_ratio)
+    else:  # Portrait
+        new_height = min(height, max_height)
+        new_width = int(new_height * aspect_ratio)
+    
+    # Ensure we don't exceed maximum dimensions
+    if new_width > max_width:
+        new_width = max_width
+        new_height = int(new_width / aspect_ratio)
+    if new_height > max_height:
+        new_height = max_height
+        new_width = int(new_height * aspect_ratio)
+    
+    return max(new_width, 1), max(new_height, 1)
+
+
+# Fast path: JPEGs are decoded at 1/2, 1/4 or 1/8 scale via draft(), then cut
+# down with cheap integer reduce() until within this factor of the target, and
+# only the last step uses LANCZOS. Lower values are faster but softer;
+# benchmark_resize.py reports the SSIM against the full-decode path.
+RESIZE_REDUCING_GAP = 2.0
+
+# Uploads already within the target box are stored untouched when they are in
+# a format the Vision API reads, need no rotation, and are no larger than a
+# re-encode would be (roughly this many bytes per pixel at quality 75).
+PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}
+PASSTHROUGH_MODES = {"RGB", "RGBA", "L", "LA", "P"}
+PASSTHROUGH_MAX_BYTES_PER_PIXEL = 0.75
+# The upload page names the JPEGs it downscales <stem>.client-resized.jpg.
+# They are small enough to pass through, but have already been through one
+# lossy encode, so they always go to encode_for_vision() instead.
+CLIENT_RESIZED_SUFFIX = ".client-resized"
+
+EXIF_ORIENTATION = 0x0112
+# Orientations that swap width and height once applied
+EXIF_TRANSPOSED = {5, 6, 7, 8}
+
+# Display derivatives, made from the same decode as the vision image: a grid
+# thumbnail and an optional larger preview (max side in px, 0 = off). They are
+# stored as derivatives/<kind>/<stem of the uploaded object name>, so the
+# gallery can find them from images.source_name.
+DERIVATIVE_SIZES = {
+    kind: side for kind, side in (
+        ("thumb", int(os.getenv("UPLOAD_THUMB_MAX_SIDE", "256"))),
+        ("preview", int(os.getenv("UPLOAD_PREVIEW_MAX_SIDE", "0"))),
+    ) if side > 0
+}
+DERIVATIVE_PREFIX = "derivatives"
+
+
+def derivative_name(source_name: str, kind: str) -> str:
+    """Storage name of an upload's display derivative"""
+    stem = os.path.splitext(source_name)[0]
+    return f"{DERIVATIVE_PREFIX}/{kind}/{stem}{EXTENSIONS[DISPLAY_FORMAT]}"
+
+
+def make_derivatives(image: Image.Image, sizes: Dict[str, int]) -> Dict[str, io.BytesIO]:
+    """Encode display derivatives of a decoded RGB image. Largest first, each
+    resized from the one before, so the full image is resampled only once"""
+    derivatives = {}
+    for kind, side in sorted(sizes.items(), key=lambda item: -item[1]):
+        size = fit_within(image.size, side, side)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+        derivatives[kind] = encode_for_display(image)
+    return derivatives
+
+
+def resize_to_width(image_file, width: int) -> io.BytesIO:
+    """Display variant of a stored image at most `width` px wide (never
+    enlarged), encoded as DISPLAY_FORMAT"""
+    with Image.open(image_file) as image:
+        target = fit_within(image.size, width, image.height)
+        image.draft('RGB', (int(target[0] * RESIZE_REDUCING_GAP), int(target[1] * RESIZE_REDUCING_GAP)))
+        image = image.convert('RGB')
+        size = fit_within(image.size, width, image.height)
+        if size != image.size:
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+        return encode_for_display(image)
+
+
+def can_pass_through(image, original_bytes, orientation, max_width=512, max_height=512):
+    """True if an opened (not yet decoded) image can be stored as uploaded"""
+    width, height = image.size
+    return (
+        width <= max_width and height <= max_height
+        and image.format in PASSTHROUGH_FORMATS
+        and image.mode in PASSTHROUGH_MODES
+        and getattr(image, "n_frames", 1) == 1
+        and orientation == 1
+        and original_bytes <= width * height * PASSTHROUGH_MAX_BYTES_PER_PIXEL
+    )
+
+
+def client_resized(filename: Optional[str]) -> bool:
+    """True if the upload page downscaled and re-encoded this file before sending it"""
+    return os.path.splitext(filename or "")[0].lower().endswith(CLIENT_RESIZED_SUFFIX)
+
+
+def can_fall_back(image_file, original_bytes: int) -> bool:
+    """True if an image that failed to resize is still safe to store as uploaded"""
+    if original_bytes > UPLOAD_FALLBACK_MAX_BYTES:
+        return False
+    try:
+        image_file.seek(0)
+        with Image.open(image_file) as image:
+            return (
+                image.format in PASSTHROUGH_FORMATS
+                and max(image.size) <= FALLBACK_MAX_SIDE
+            )
+    except Exception:
+        return False
+    finally:
+        image_file.seek(0)
+
+
+def resize_image_for_vision_api(image_file, max_width=512, max_height=512, quality=75, fast=True, target_size=None,
+                                encoder=True, derivatives=None, passthrough=True):
+    """
+    Resize image to reduce token costs for OpenAI Vision API.
+    
+    AGGRESSIVE SIZING FOR TOKEN COST TESTING:
+    Target: ~512x512 or smaller to minimize token usage
+    This should reduce image tokens from 8000+ to 200-500 tokens
+    
+    With fast=False every image is fully decoded and resampled in one LANCZOS
+    pass (the original behaviour, kept for benchmarking).
+    
+    Small uploads that pass can_pass_through() are returned as image_file
+    itself, without decoding; passthrough=False always re-encodes. EXIF
+    orientation is applied before resizing.
+    target_size, if given, is the exact output size (in display orientation)
+    and replaces the max_width/max_height box.
+    
+    The output is encoded by encode_for_vision() (smallest of WebP / palette
+    PNG / JPEG that keeps its SSIM); encoder=False writes JPEG at `quality`.
+    
+    derivatives ({kind: max side}, see DERIVATIVE_SIZES) switches to upload
+    pipeline mode: the image is always decoded, even to pass it through, and
+    the return value is (output, extras) with the display copies and the
+    measurements of the stored image, see stored_image_extras(). When the
+    original is stored as a fallback, extras are empty.
+    
+    Raises ImageRejected if the image exceeds the pixel budget, or cannot be
+    resized and is not small enough to store as is (can_fall_back()).
+    """
+    original_bytes = stream_size(image_file)
+    
+    def result(output, extras=None):
+        return output if derivatives is None else (output, extras or stored_image_extras())
+    
+    try:
+        # Decode straight from the (spooled) upload file; it is never read into memory as a whole
+        image_file.seek(0)
+        image = Image.open(image_file)  # reads the header only
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        if target_size:
+            max_width, max_height = target_size
+        
+        passthrough = passthrough and can_pass_through(image, original_bytes, orientation, max_width, max_height)
+        if passthrough and derivatives is None:
+            print(f"⏭️ Image passed through: {image.format} {image.size}, {original_bytes:,} bytes")
+            image_file.seek(0)
+            return result(image_file)
+        
+        # Sizes are worked out in display orientation, the decoder works in stored orientation
+        transposed = orientation in EXIF_TRANSPOSED
+        original_size = image.size[::-1] if transposed else image.size
+        target_size = target_size or fit_within(original_size, max_width, max_height)
+        
+        # The decode has to serve the largest output asked of it
+        largest = max(
+            [target_size] + [fit_within(original_size, side, side) for side in (derivatives or {}).values()],
+            key=lambda size: size[0] * size[1]
+        )
+        
+        over_budget = image.size[0] * image.size[1] > UPLOAD_MAX_PIXELS
+        if image.format == 'JPEG' and largest != original_size and (fast or over_budget):
+            # Let the decoder skip detail we'd throw away anyway
+            draft_size = (int(largest[0] * RESIZE_REDUCING_GAP), int(largest[1] * RESIZE_REDUCING_GAP))
+            image.draft('RGB', draft_size[::-1] if transposed else draft_size)
+        
+        if image.size[0] * image.size[1] > UPLOAD_MAX_PIXELS:
+            raise ImageRejected(
+                f"Image too large: {original_size[0]}x{original_size[1]} exceeds the "
+                f"{UPLOAD_MAX_PIXELS:,} pixel limit", status_code=413
+            )
+        
+        # Largest buffer this request holds: the decoded frame (after any draft scaling)
+        decoded_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        
+        if orientation != 1:
+            image = ImageOps.exif_transpose(image)
+        
+        # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        display = make_derivatives(image, derivatives) if derivatives else {}
+        if passthrough:
+            print(f"⏭️ Image passed through: {original_size}, {original_bytes:,} bytes, decoded for derivatives only")
+            image_file.seek(0)
+            return result(image_file, stored_image_extras(image, display))
+        
+        if image.size != target_size:
+            # Resize the image
+            image = image.resize(
+                target_size,
+                Image.Resampling.LANCZOS,
+                reducing_gap=RESIZE_REDUCING_GAP if fast else None
+            )
+            
+        # Save to bytes buffer
+        if encoder:
+            output_buffer, encoding = encode_for_vision(image, fallback_quality=quality)
+            print(f"🗜️ Encoded as {encoding['format']}"
+                  f"{' q' + str(encoding['quality']) if encoding['quality'] else ''}: "
+                  f"{encoding['bytes']:,} bytes, SSIM {encoding['ssim']}"
+                  f"{'' if encoding['within_target'] else ' (over byte target)'}")
+        else:
+            output_buffer = io.BytesIO()
+            image.save(output_buffer, format='JPEG', quality=quality, optimize=True)
+            output_buffer.seek(0)
+        
+        new_size = image.size
+        output_bytes = output_buffer.getbuffer().nbytes
+        compression_ratio = output_bytes / original_bytes if original_bytes else 0
+        image_file.seek(0)  # Reset file pointer
+        
+        print(f"🖼️ Image resized: {original_size} -> {new_size}, compression: {compression_ratio:.2f}")
+        print(f"🧠 Peak memory: ~{(decoded_bytes + output_bytes) / (1024 * 1024):.1f} MB for this image, "
+              f"process peak RSS {peak_rss_mb():.0f} MB")
+        
+        return result(output_buffer, stored_image_extras(image, display) if derivatives is not None else None)
+        
+    except ImageRejected as e:
+        print(f"🛑 Image rejected: {e}")
+        raise
+    except Image.DecompressionBombError as e:
+        print(f"🛑 Image rejected: {e}")
+        raise too_large(e)
+    except Exception as e:
+        print(f"❌ Image resize error: {e}")
+        # Return original file if resize fails, but never a large one
+        if can_fall_back(image_file, original_bytes):
+            image_file.seek(0)
+            return result(image_file)
+        if isinstance(e, UnidentifiedImageError):
+            raise ImageRejected("Not a recognised image file")
+        raise ImageRejected(f"Could not process image: {e}")
+
+
+def stored_image_extras(image: Optional[Image.Image] = None, display: Optional[Dict[str, BinaryIO]] = None) -> Dict[str, Any]:
+    """What the upload pipeline needs beyond the encoded image: display
+    derivatives ({kind: buffer}), the dHash and the local pre-analysis of the
+    image as stored. Empty when there is no decoded image"""
+    if image is None:
+        return {"derivatives": {}, "phash": None, "pre_analysis": None}
+    return {"derivatives": display or {}, "phash": dhash(image), "pre_analysis": pre_analyze(image)}
+
+
+def apply_pre_analysis(plan: Optional[Dict[str, Any]], pre: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Adjust a vision plan for the pre-analysis verdict: simple cards drop to
+    low detail, skipped ones are predicted to cost nothing"""
+    if not plan or not pre or not pre["vision_action"]:
+        return plan
+    if pre["vision_action"] == "skip":
+        print("🫥 Blank card: Vision analysis will be skipped")
+        return {**plan, "tiles": 0, "predicted_image_tokens": 0}
+    if pre["vision_action"] == "low" and plan["detail"] != "low":
+        print(f"🔽 Simple card ({pre['component_count']} item, {', '.join(pre['colors'])}): low detail")
+        tokens, tiles = vision_image_tokens(plan["width"], plan["height"], "low")
+        return {**plan, "detail": "low", "tiles": tiles, "predicted_image_tokens": tokens}
+    return plan
+
+
+def display_size(image_file) -> Optional[Tuple[int, int]]:
+    """Image size after EXIF orientation, read from the header only"""
+    try:
+        image_file.seek(0)
+        image = Image.open(image_file)
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        return image.size[::-1] if orientation in EXIF_TRANSPOSED else image.size
+    except Exception:
+        return None
+    finally:
+        image_file.seek(0)
+
+
+def prepare_image_upload(
+    image_file,
+    original_filename: str,
+    content_type: str = "image/jpeg",
+    token_budget: Optional[int] = None,
+    detail: str = "auto",
+    derivatives: Dict[str, int] = DERIVATIVE_SIZES
+) -> Dict[str, Any]:
+    """
+    Resize an uploaded image for the Vision API and pick its storage name.
+    
+    Returns a prepared upload: {"body", "filename", "content_type", "vision",
+    "derivatives", "phash", "pre_analysis"}. body is a seekable stream
+    positioned at 0: the encoded output, or image_file itself if the image was
+    passed through or cannot be resized. The upload is never copied into
+    memory. derivatives are (storage_name, body, content_type) display copies
+    made from the same decode (see DERIVATIVE_SIZES); phash (app/image_dedup.py)
+    and pre_analysis (app/pre_analysis.py) describe the stored image and are
+    None if it could not be decoded.
+    
+    With a token_budget the output size comes from plan_vision_resize() and
+    vision describes it, adjusted by the pre-analysis; otherwise the fixed
+    512x512 box is used and vision is None.
+    
+    Files the upload page already downscaled (client_resized()) are never
+    passed through, so they get the same encoder as everything else.
+    
+    Raises ImageRejected for uploads over UPLOAD_MAX_BYTES or the pixel
+    budget, and for unreadable images too large to store unresized.
+    """
+    # Get original file size for debugging
+    original_size_bytes = stream_size(image_file)
+    original_size_mb = original_size_bytes / (1024 * 1024)
+    
+    print(f"📏 Original file size: {original_size_bytes:,} bytes ({original_size_mb:.2f} MB)")
+    if original_size_bytes > UPLOAD_MAX_BYTES:
+        raise ImageRejected(
+            f"File too large: {original_size_mb:.1f} MB exceeds the "
+            f"{UPLOAD_MAX_BYTES / (1024 * 1024):g} MB limit", status_code=413
+        )
+    
+    plan = None
+    size = display_size(image_file) if token_budget is not None else None
+    if size:
+        plan = plan_vision_resize(size, token_budget, detail)
+        print(f"🎯 Vision plan: {plan['width']}x{plan['height']} {plan['detail']} detail, "
+              f"{plan['tiles']} tiles, ~{plan['predicted_image_tokens']} image tokens (budget {token_budget})")
+    
+    # Resize image to reduce Vision API token costs
+    target_size = (plan["width"], plan["height"]) if plan else None
+    body, extras = resize_image_for_vision_api(image_file, target_size=target_size, derivatives=derivatives,
+                                               passthrough=not client_resized(original_filename))
+    # Content type and extension follow the bytes actually stored
+    stored_format = detect_format(body)
+    if body is image_file:
+        # Passed through, or small enough to store although it could not be resized
+        print("↪️ Using original upload")
+    else:
+        final_size_bytes = stream_size(body)
+        final_size_mb = final_size_bytes / (1024 * 1024)
+        reduction_ratio = (original_size_bytes - final_size_bytes) / original_size_bytes * 100 if original_size_bytes else 0
+        
+        print(f"💾 Resized image size: {final_size_bytes:,} bytes ({final_size_mb:.2f} MB)")
+        print(f"📉 Size reduction: {reduction_ratio:.1f}%")
+        
+        # 🚨 WARN ABOUT POTENTIALLY HIGH TOKEN USAGE
+        if final_size_mb > 5:
+            print(f"🚨 WARNING: Large image file ({final_size_mb:.1f} MB) may cause high token usage!")
+        elif final_size_mb > 2:
+            print(f"⚠️ Moderate size image ({final_size_mb:.1f} MB) - may use more tokens")
+        else:
+            print(f"✅ Good size for Vision API ({final_size_mb:.1f} MB)")
+    body.seek(0)
+    
+    if stored_format in CONTENT_TYPES:
+        content_type = CONTENT_TYPES[stored_format]
+        file_ext = EXTENSIONS[stored_format]
+    else:
+        # Generate UUID filename with original extension
+        file_ext = os.path.splitext(original_filename)[1].lower()
+    filename = f"{uuid.uuid4()}{file_ext}"
+    
+    return prepared_upload(body, filename, content_type, plan, extras)
+
+
+def prepared_upload(body: BinaryIO, filename: str, content_type: str, plan: Optional[Dict[str, Any]],
+                    extras: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "body": body,
+        "filename": filename,
+        "content_type": content_type,
+        "vision": apply_pre_analysis(plan, extras["pre_analysis"]),
+        "derivatives": [
+            (derivative_name(filename, kind), buffer, CONTENT_TYPES[DISPLAY_FORMAT])
+            for kind, buffer in extras["derivatives"].items()
+        ],
+        "phash": extras["phash"],
+        "pre_analysis": extras["pre_analysis"],
+    }
+
+
+# Flashcard sheets: one page holding a rows x cols grid of cards. The split
+# lines are snapped to the most uniform row/column (the gutter or cut line)
+# within this fraction of the page of each even split.
+SHEET_MAX_CELLS = 16
+SHEET_GUTTER_SEARCH = 0.08
+# Gutter detection works on a grayscale copy no larger than this
+SHEET_DETECT_MAX_SIDE = 1024
+
+
+def open_sheet(image_file, rows: int, cols: int, token_budget: Optional[int] = None, detail: str = "auto"):
+    """
+    Decode a flashcard sheet once, in display orientation and RGB, at no more
+    resolution than its cards need. Applies the same byte and pixel budgets as
+    single uploads; raises ImageRejected.
+    """
+    original_bytes = stream_size(image_file)
+    if original_bytes > UPLOAD_MAX_BYTES:
+        raise ImageRejected(
+            f"File too large: {original_bytes / (1024 * 1024):.1f} MB exceeds the "
+            f"{UPLOAD_MAX_BYTES / (1024 * 1024):g} MB limit", status_code=413
+        )
+    try:
+        image_file.seek(0)
+        image = Image.open(image_file)
+    except UnidentifiedImageError:
+        raise ImageRejected("Not a recognised image file")
+    except Image.DecompressionBombError as e:
+        raise too_large(e)
+    
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    transposed = orientation in EXIF_TRANSPOSED
+    sheet_size = image.size[::-1] if transposed else image.size
+    
+    # Size one card would be stored at; decode the sheet at RESIZE_REDUCING_GAP times that
+    cell_size = (max(sheet_size[0] // cols, 1), max(sheet_size[1] // rows, 1))
+    if token_budget is not None:
+        plan = plan_vision_resize(cell_size, token_budget, detail)
+        cell_target = (plan["width"], plan["height"])
+    else:
+        cell_target = fit_within(cell_size)
+    if image.format == 'JPEG' and cell_target != cell_size:
+        draft_size = (int(cell_target[0] * cols * RESIZE_REDUCING_GAP), int(cell_target[1] * rows * RESIZE_REDUCING_GAP))
+        image.draft('RGB', draft_size[::-1] if transposed else draft_size)
+    
+    if image.size[0] * image.size[1] > UPLOAD_MAX_PIXELS:
+        raise ImageRejected(
+            f"Image too large: {sheet_size[0]}x{sheet_size[1]} exceeds the "
+            f"{UPLOAD_MAX_PIXELS:,} pixel limit", status_code=413
+        )
+    
+    try:
+        if orientation != 1:
+            image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+    except Exception as e:
+        raise ImageRejected(f"Could not process image: {e}")
+    finally:
+        image_file.seek(0)
+    
+    print(f"📄 Sheet decoded: {sheet_size} -> {image.size} for a {rows}x{cols} grid")
+    return image
+
+
+def _snap_split_lines(profile_mean, profile_sq, parts: int) -> list:
+    """Interior split positions along one axis, each snapped to the lowest-variance line near its even split"""
+    length = len(profile_mean)
+    search = max(int(length * SHEET_GUTTER_SEARCH), 1)
+    lines = []
+    for i in range(1, parts):
+        center = round(i * length / parts)
+        window = range(max(center - search, 1), min(center + search, length - 1) + 1)
+        lines.append(min(
+            window,
+            key=lambda p: (profile_sq[p] - profile_mean[p] ** 2, abs(p - center))
+        ))
+    return lines
+
+
+def find_sheet_grid(image, rows: int, cols: int, detect: bool = True):
+    """Column and row boundaries (including 0 and the full size) of a sheet's card grid"""
+    width, height = image.size
+    xs = [round(i * width / cols) for i in range(1, cols)]
+    ys = [round(i * height / rows) for i in range(1, rows)]
+    
+    if detect:
+        gray = image.convert('L')
+        gray.thumbnail((SHEET_DETECT_MAX_SIDE, SHEET_DETECT_MAX_SIDE), Image.Resampling.BOX)
+        scale_x, scale_y = width / gray.size[0], height / gray.size[1]
+        values = gray.convert('F')
+        squares = multiply(values, values)
+        
+        def profile(image_f, size):
+            return array('f', image_f.resize(size, Image.Resampling.BOX).tobytes())
+        
+        # Per-column and per-row mean and mean of squares, so variance = E[x^2] - E[x]^2
+        columns = (gray.size[0], 1)
+        rows_size = (1, gray.size[1])
+        xs = [round(x * scale_x) for x in _snap_split_lines(profile(values, columns), profile(squares, columns), cols)]
+        ys = [round(y * scale_y) for y in _snap_split_lines(profile(values, rows_size), profile(squares, rows_size), rows)]
+    
+    return [0, *xs, width], [0, *ys, height]
+
+
+def split_sheet(image, rows: int, cols: int, detect: bool = True):
+    """Crop a decoded sheet into cards; returns [(position, row, col, card_image)] in reading order"""
+    xs, ys = find_sheet_grid(image, rows, cols, detect)
+    cards = []
+    for row in range(rows):
+        for col in range(cols):
+            box = (xs[col], ys[row], xs[col + 1], ys[row + 1])
+            cards.append((row * cols + col, row, col, image.crop(box)))
+    return cards
+
+
+def prepare_card_upload(card, token_budget: Optional[int] = None, detail: str = "auto",
+                        derivatives: Dict[str, int] = DERIVATIVE_SIZES):
+    """Resize and encode one already-decoded card; returns a prepared upload like prepare_image_upload()"""
+    display = make_derivatives(card, derivatives)
+    plan = plan_vision_resize(card.size, token_budget, detail) if token_budget is not None else None
+    target_size = (plan["width"], plan["height"]) if plan else fit_within(card.size)
+    if card.size != target_size:
+        card = card.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+    body, encoding = encode_for_vision(card)
+    filename = f"{uuid.uuid4()}{encoding['extension']}"
+    return prepared_upload(body, filename, encoding["content_type"], plan, stored_image_extras(card, display))
@@ -0,0 +1,122 @@
+# In-process caches of images data, and their invalidation
+#
+# Nothing in PostgREST tells the app when a row changes, so whatever rewrites
+# images rows (the edge function after its insert and analysis update, or the
+# image_events NOTIFY trigger when DATABASE_URL is set) reports the ids to
+# POST /internal/invalidate. Every registered cache then drops the entries
+# built from those ids, and the registry's version goes up. Responses that
+# cover many images (/api/images pages, facet counts) carry the version in
+# their cache keys and ETags, so nothing from before the change is served
+# again. TTLs then only bound how stale data gets when a report is lost.
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class ImageDataCache:
+    """Size-bounded TTL cache whose entries are tagged with the image ids they
+    were built from. A ttl of 0 disables it."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expires_at, image ids, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Set[str], Any]]" = OrderedDict()
+        self._by_image: Dict[str, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, image_ids: Iterable[str] = ()):
+        if self.ttl <= 0:
+            return
+        self._drop(key)
+        ids = set(image_ids)
+        self._entries[key] = (time.monotonic() + self.ttl, ids, value)
+        for image_id in ids:
+            self._by_image.setdefault(image_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for image_id in entry[1]:
+            keys = self._by_image.get(image_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_image[image_id]
+
+    def evict_images(self, image_ids: Iterable[str]) -> int:
+        keys = set()
+        for image_id in image_ids:
+            keys.update(self._by_image.get(image_id, ()))
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        self._by_image.clear()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+class CacheRegistry:
+    def __init__(self):
+        # Versions restart after a restart; the epoch keeps ETags handed out
+        # by an earlier process from matching
+        self._epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.invalidated_at: Optional[float] = None
+        self._caches: List[ImageDataCache] = []
+
+    def cache(self, name: str, ttl: float, max_entries: int = 1024) -> ImageDataCache:
+        cache = ImageDataCache(name, ttl, max_entries)
+        self._caches.append(cache)
+        return cache
+
+    def invalidate(self, image_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Drop what was built from image_ids (everything when None) and bump
+        the version"""
+        ids = None if image_ids is None else list(image_ids)
+        evicted = {
+            cache.name: cache.clear() if ids is None else cache.evict_images(ids)
+            for cache in self._caches
+        }
+        self.version += 1
+        self.invalidated_at = time.time()
+        return {"version": self.tag, "evicted": evicted}
+
+    @property
+    def tag(self) -> str:
+        return f"{self._epoch}.{self.version}"
+
+    def etag(self, *parts: Any) -> str:
+        """Weak ETag for a response derived from the current data version"""
+        suffix = "-".join(str(part) for part in parts if part is not None)
+        return f'W/"{self.tag}{"-" + suffix if suffix else ""}"'
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.tag,
+            "invalidated_at": self.invalidated_at,
+            "caches": {cache.name: cache.stats() for cache in self._caches},
+        }
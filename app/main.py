@@ -1,18 +1,54 @@
+import asyncio
+import base64
+import hmac
+import io
+import json
+import mimetypes
 import os
+import re
+import shutil
+import tempfile
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from urllib.parse import quote
 from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse
+from starlette.requests import ClientDisconnect
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
 import httpx
-from PIL import Image
-import io
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from question_generator import QuestionGenerator, QuestionSet
+from analytics import AnalyticsScheduler
+from image_processing import (
+    CLIENT_RESIZED_SUFFIX,
+    DERIVATIVE_SIZES,
+    SHEET_MAX_CELLS,
+    UPLOAD_MAX_BYTES,
+    ImageRejected,
+    derivative_name,
+    open_sheet,
+    prepare_card_upload,
+    prepare_image_upload,
+    resize_to_width,
+    split_sheet,
+    stream_size,
+)
+from image_cache import DiskCache
+from image_dedup import DuplicateIndex, to_signed
+from image_events import ChangePoller, ImageEventBroker, NotifyListener, format_sse
+from invalidation import CacheRegistry
+from image_encoding import CONTENT_TYPES, DISPLAY_FORMAT
+from upload_jobs import UploadJobManager
+from upload_sessions import SessionError, UploadSessionManager
+from vision_budget import resolve_vision_settings, vision_resize_bounds
 
 load_dotenv()
 
@@ -21,72 +57,216 @@ SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_BUCKET_NAME = os.getenv("SUPABASE_BUCKET_NAME", "images")
 
-app = FastAPI()
+# Columns read from the hot images row. Never use select=* here: the embedding is
+# 1536 floats and raw model responses live in image_analysis_raw.
+IMAGE_LIST_COLUMNS = "id,image_name,image_url,source_name,description,confidence,tags,prompt_tokens,completion_tokens,total_tokens,analysis_attempts,created_at"
+# Facet counts change only when an analysis is written, so they are cached
+# (for longer once writes are reported to /internal/invalidate, see below)
+FACET_TYPES = ["category", "mood", "setting", "color", "shape", "letter", "number", "word", "object", "people", "animal"]
+
+# /api/images?limit= pages, newest first (keyset on created_at, id; see
+# supabase/gallery_pagination.sql). Without limit every image is returned.
+IMAGES_PAGE_MAX = 200
+
+# /api/detailed: table pages for the detailed view, rendered here and sorted in
+# Postgres (see supabase/detailed_view.sql). Sort name -> images column.
+DETAILED_SORTS = {"created_at": "created_at", "confidence": "confidence", "tokens": "total_tokens"}
+DETAILED_PAGE_SIZE = 50
+DETAILED_PAGE_MAX = 200
+
+IMAGE_DETAIL_COLUMNS = "id,image_name,image_url,description,confidence,tags,question_context,question_context_version,created_at"
+
+# Display derivatives the gallery asks for; each *_url falls back to the full image
+DERIVATIVE_KINDS = ("thumb", "preview")
+
+# Asynchronous uploads: spooled to disk, resized and stored by an in-process pool
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "upload-spool"))
+UPLOAD_ASYNC_DEFAULT = os.getenv("UPLOAD_ASYNC_DEFAULT", "false").lower() == "true"
+ANALYSIS_WAIT_TIMEOUT = float(os.getenv("ANALYSIS_WAIT_TIMEOUT", "300"))
+ANALYSIS_POLL_INTERVAL = float(os.getenv("ANALYSIS_POLL_INTERVAL", "3"))
+# Batch uploads: at most this many files per request and concurrent storage writes
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "50"))
+UPLOAD_STORAGE_CONCURRENCY = int(os.getenv("UPLOAD_STORAGE_CONCURRENCY", "8"))
+# Default upload vision settings (see app/vision_budget.py): economy, standard or detailed
+VISION_PRESET = os.getenv("VISION_PRESET", "economy")
+# Flashcard sheet grid used by /upload/sheet when rows/cols are not given
+SHEET_ROWS = int(os.getenv("SHEET_ROWS", "2"))
+SHEET_COLS = int(os.getenv("SHEET_COLS", "2"))
+# Stored objects are streamed to Storage in chunks of this size
+UPLOAD_STREAM_CHUNK_SIZE = int(os.getenv("UPLOAD_STREAM_CHUNK_SIZE", str(256 * 1024)))
+# Starlette spools the whole multipart body to a temp file before a handler
+# runs, so form uploads are refused on Content-Length first. This much is
+# allowed on top of the files for boundaries, part headers and other fields.
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+# Resumable uploads (app/upload_sessions.py): suggested chunk size, and how long
+# an untouched session is kept before its spooled bytes are deleted
+UPLOAD_SESSION_CHUNK_SIZE = int(os.getenv("UPLOAD_SESSION_CHUNK_SIZE", str(2 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+# Upload page (static/upload.js, settings from /api/upload-config): files sent at
+# once, size above which a file goes through a resumable session, and the
+# quality of the JPEG it pre-resizes uploads to
+UPLOAD_CLIENT_CONCURRENCY = int(os.getenv("UPLOAD_CLIENT_CONCURRENCY", "4"))
+UPLOAD_RESUMABLE_THRESHOLD = int(os.getenv("UPLOAD_RESUMABLE_THRESHOLD", str(8 * 1024 * 1024)))
+UPLOAD_CLIENT_QUALITY = float(os.getenv("UPLOAD_CLIENT_QUALITY", "0.92"))
+
+# Materialized analytics refresh (see supabase/analytics_materialized.sql)
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "30"))
+ANALYTICS_SCHEDULER_ENABLED = os.getenv("ANALYTICS_SCHEDULER_ENABLED", "true").lower() == "true"
+
+# Near-duplicate uploads (app/image_dedup.py, supabase/dedup.sql) within
+# DEDUP_MAX_DISTANCE of 64 hash bits: "copy" stores the upload but copies the
+# earlier image's analysis instead of calling the Vision API, "link" stores
+# nothing and returns the earlier image, "reject" refuses with 409, "off" skips
+# the check (hashes are still recorded)
+DEDUP_MODE = os.getenv("DEDUP_MODE", "copy").lower()
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "4"))
+
+# Image proxy (/img/{image_name}, app/image_cache.py): Storage objects and their
+# ?w= resized variants are served from a size-bounded on-disk LRU cache with
+# strong ETags, so the gallery needs no per-request signed URLs
+IMAGE_PROXY_ENABLED = os.getenv("IMAGE_PROXY_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "image-cache"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# ?w= is rounded up to one of these so each image has only a few cached variants
+IMAGE_PROXY_WIDTHS = sorted(int(w) for w in os.getenv("IMAGE_PROXY_WIDTHS", "128,256,512,1024").split(",") if w.strip())
+# Stored objects are never overwritten (every upload gets a new name)
+IMAGE_PROXY_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The only object names the proxy serves: uploads (<uuid>.<ext>, named by the
+# edge function) and their display derivatives. Anything else, such as ../
+# or an encoded path, would be fetched with the service role key.
+STORAGE_OBJECT_NAME = re.compile(
+    r"(?:derivatives/[a-z]+/)?[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}\.[A-Za-z0-9]{1,5}"
+)
+# Connections kept open by the shared Storage client
+STORAGE_MAX_CONNECTIONS = int(os.getenv("STORAGE_MAX_CONNECTIONS", "20"))
+
+# Live image events (/api/events, app/image_events.py, supabase/image_events.sql).
+# With DATABASE_URL (a direct Postgres connection string) changes arrive by
+# LISTEN/NOTIFY; without it one PostgREST poll every IMAGE_EVENTS_POLL_INTERVAL
+# seconds stands in, shared by all open streams
+IMAGE_EVENTS_ENABLED = os.getenv("IMAGE_EVENTS_ENABLED", "true").lower() == "true"
+DATABASE_URL = os.getenv("DATABASE_URL")
+IMAGE_EVENTS_POLL_INTERVAL = float(os.getenv("IMAGE_EVENTS_POLL_INTERVAL", "2"))
+# Comment lines sent on idle streams so proxies don't close them
+IMAGE_EVENTS_HEARTBEAT = 15.0
+
+# Cache invalidation (POST /internal/invalidate, app/invalidation.py). The edge
+# function reports the images it writes, authenticated with INVALIDATE_SECRET;
+# with DATABASE_URL the image_events NOTIFY trigger reports them as well.
+# Only then are the caches below long-lived and /api/images answered with
+# ETags, since nothing else would tell them a row changed.
+# The caches live in each worker process, and a POST reaches only one of them:
+# with several workers, set DATABASE_URL (every worker LISTENs) or the other
+# workers serve stale pages and 304s until their TTLs run out.
+INVALIDATE_SECRET = os.getenv("INVALIDATE_SECRET")
+INVALIDATION_ENABLED = bool(INVALIDATE_SECRET or (DATABASE_URL and IMAGE_EVENTS_ENABLED))
+_default_cache_ttl = "3600" if INVALIDATION_ENABLED else "0"
+# /api/images pages; without the image proxy they carry signed URLs valid for
+# SIGNED_URL_EXPIRES seconds. Pages are then tied to a SIGNED_URL_WINDOW long
+# time window, part of their cache key and ETag, so neither the server nor a
+# revalidating browser keeps a page's URLs past half their lifetime.
+SIGNED_URL_EXPIRES = 3600
+SIGNED_URL_WINDOW = SIGNED_URL_EXPIRES // 2
+IMAGES_CACHE_TTL = float(os.getenv("IMAGES_CACHE_TTL", _default_cache_ttl))
+if not IMAGE_PROXY_ENABLED:
+    IMAGES_CACHE_TTL = min(IMAGES_CACHE_TTL, float(SIGNED_URL_WINDOW))
+# IMAGE_DETAIL_COLUMNS rows read for question generation (analysed rows only)
+IMAGE_ROW_CACHE_TTL = float(os.getenv("IMAGE_ROW_CACHE_TTL", _default_cache_ttl))
+FACETS_CACHE_TTL = float(os.getenv("FACETS_CACHE_TTL", "3600" if INVALIDATION_ENABLED else "60"))
+
+mimetypes.add_type("image/webp", ".webp")
+
+image_cache = DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_PROXY_ENABLED else None
+
+# Responses covering many images are keyed by caches.tag, so any invalidation
+# retires them; image_rows entries are evicted per image
+caches = CacheRegistry()
+images_page_cache = caches.cache("images_pages", IMAGES_CACHE_TTL, max_entries=256)
+image_row_cache = caches.cache("image_rows", IMAGE_ROW_CACHE_TTL, max_entries=4096)
+facets_cache = caches.cache("facets", FACETS_CACHE_TTL, max_entries=64)
+# Pooled client for Storage reads, opened with the app
+storage_client: Optional[httpx.AsyncClient] = None
+
+duplicate_index = None
+if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY and DEDUP_MODE in ("copy", "link", "reject"):
+    duplicate_index = DuplicateIndex(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, max_distance=DEDUP_MAX_DISTANCE)
+
+analytics_scheduler = None
+if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY:
+    analytics_scheduler = AnalyticsScheduler(
+        SUPABASE_URL,
+        SUPABASE_SERVICE_ROLE_KEY,
+        refresh_interval=ANALYTICS_REFRESH_INTERVAL,
+        min_refresh_interval=ANALYTICS_REFRESH_INTERVAL
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global storage_client
+    storage_client = httpx.AsyncClient(
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=STORAGE_MAX_CONNECTIONS, max_keepalive_connections=STORAGE_MAX_CONNECTIONS)
+    )
+    if image_cache:
+        count = await asyncio.to_thread(image_cache.load)
+        print(f"🗄️ Image cache: {count:,} entries, {image_cache.size / (1024 * 1024):.1f} MB in {IMAGE_CACHE_DIR}")
+    if analytics_scheduler and ANALYTICS_SCHEDULER_ENABLED:
+        analytics_scheduler.start()
+    upload_jobs.start()
+    if duplicate_index:
+        duplicate_index.start()
+    if image_event_source:
+        image_event_source.start()
+    if INVALIDATE_SECRET and not isinstance(image_event_source, NotifyListener) and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print("⚠️ Cache invalidation reaches only the worker that receives it; set DATABASE_URL when running several workers")
+    yield
+    if image_event_source:
+        await image_event_source.stop()
+    if image_events:
+        await image_events.stop()
+    await upload_jobs.stop()
+    if duplicate_index:
+        await duplicate_index.stop()
+    await storage_client.aclose()
+    upload_executor.shutdown(wait=False)
+    if analytics_scheduler:
+        await analytics_scheduler.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+def form_upload_limit(path: str) -> Optional[int]:
+    """Largest Content-Length accepted for a multipart upload route, None for other routes"""
+    if path in ("/upload", "/upload/sheet"):
+        return UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD
+    if path == "/upload/batch":
+        return UPLOAD_BATCH_MAX_FILES * UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD
+    return None
+
+@app.middleware("http")
+async def refuse_oversized_forms(request: Request, call_next):
+    """413 before the form is parsed (and spooled) when the declared body is too large.
+    Chunked requests without a Content-Length are still checked per file by the handlers"""
+    limit = form_upload_limit(request.url.path) if request.method == "POST" else None
+    if limit is not None:
+        try:
+            declared = int(request.headers.get("content-length", ""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"success": False, "error": f"Request too large (max {UPLOAD_MAX_BYTES / (1024 * 1024):g} MB per file)"}
+            )
+    return await call_next(request)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-def resize_image_for_vision_api(image_file, max_width=512, max_height=512, quality=75):
-    """
-    Resize image to reduce token costs for OpenAI Vision API.
-    
-    AGGRESSIVE SIZING FOR TOKEN COST TESTING:
-    Target: ~512x512 or smaller to minimize token usage
-    This should reduce image tokens from 8000+ to 200-500 tokens
-    """
-    try:
-        # Open the image
-        image = Image.open(image_file)
-        original_size = image.size
-        
-        # Convert to RGB if necessary (handles RGBA, grayscale, etc.)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Calculate new size maintaining aspect ratio
-        width, height = image.size
-        aspect_ratio = width / height
-        
-        if width > max_width or height > max_height:
-            if aspect_ratio > 1:  # Landscape
-                new_width = min(width, max_width)
-                new_height = int(new_width / aspect_ratio)
-            else:  # Portrait
-                new_height = min(height, max_height)
-                new_width = int(new_height * aspect_ratio)
-            
-            # Ensure we don't exceed maximum dimensions
-            if new_width > max_width:
-                new_width = max_width
-                new_height = int(new_width / aspect_ratio)
-            if new_height > max_height:
-                new_height = max_height
-                new_width = int(new_height * aspect_ratio)
-            
-            # Resize the image
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-        # Save to bytes buffer
-        output_buffer = io.BytesIO()
-        image.save(output_buffer, format='JPEG', quality=quality, optimize=True)
-        output_buffer.seek(0)
-        
-        new_size = image.size
-        compression_ratio = len(output_buffer.getvalue()) / len(image_file.read())
-        image_file.seek(0)  # Reset file pointer
-        
-        print(f"🖼️ Image resized: {original_size} -> {new_size}, compression: {compression_ratio:.2f}")
-        
-        return output_buffer
-        
-    except Exception as e:
-        print(f"❌ Image resize error: {e}")
-        # Return original file if resize fails
-        image_file.seek(0)
-        return image_file
 
 @app.get("/")
 def root():
-    return {"message": "Image Recognition API", "routes": {"upload": "/upload", "gallery": "/gallery", "api": "/api/images"}}
+    return {"message": "Image Recognition API", "routes": {"upload": "/upload", "batch_upload": "/upload/batch", "sheet_upload": "/upload/sheet", "gallery": "/gallery", "api": "/api/images", "facets": "/api/facets", "analytics": "/api/analytics", "events": "/api/events"}}
 
 @app.get("/upload", response_class=HTMLResponse)
 def upload_form(request: Request):
@@ -100,11 +280,241 @@ def gallery_page(request: Request):
 def detailed_view(request: Request):
     return templates.TemplateResponse("detailed_view.html", {"request": request})
 
+def iter_stream(body: BinaryIO, chunk_size: int = UPLOAD_STREAM_CHUNK_SIZE):
+    """Async chunk iterator so httpx streams a file body instead of buffering it.
+    File reads run in a thread so a body on disk never blocks the event loop"""
+    async def chunks():
+        body.seek(0)
+        if isinstance(body, io.BytesIO):
+            while chunk := body.read(chunk_size):
+                yield chunk
+            return
+        while chunk := await asyncio.to_thread(body.read, chunk_size):
+            yield chunk
+    return chunks()
+
+async def upload_to_storage(filename: str, body, content_type: str, client: Optional[httpx.AsyncClient] = None):
+    """Store an object in the images bucket; body is bytes or a seekable stream.
+    Returns (success, error_text)"""
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            return await upload_to_storage(filename, body, content_type, own_client)
+
+    upload_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{filename}"
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "Content-Type": content_type
+    }
+    if not isinstance(body, (bytes, bytearray)):
+        headers["Content-Length"] = str(stream_size(body))
+        body = iter_stream(body)
+    resp = await client.post(upload_url, headers=headers, content=body)
+    if resp.status_code == 200:
+        print(f"✅ Upload successful: {filename}")
+        return True, None
+    print(f"❌ Upload failed: {resp.status_code} - {resp.text}")
+    return False, resp.text
+
+async def record_vision_plan(filename: str, plan: Dict[str, Any], client: httpx.AsyncClient):
+    """Save the resize plan for an object before it is stored, so the edge
+    function can send the planned detail mode and copy the predicted tokens"""
+    resp = await client.post(
+        f"{SUPABASE_URL}/rest/v1/upload_vision_plans",
+        headers={
+            "apikey": SUPABASE_SERVICE_ROLE_KEY,
+            "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal"
+        },
+        json={"source_name": filename, **plan}
+    )
+    if resp.status_code not in (200, 201, 204):
+        # Analysis still runs without a plan, just at the default detail
+        print(f"⚠️ Could not record vision plan for {filename}: {resp.status_code} - {resp.text}")
+
+async def store_upload(filename: str, body, content_type: str, plan: Optional[Dict[str, Any]],
+                       client: Optional[httpx.AsyncClient] = None, derivatives=()):
+    """Record the vision plan (if any) and store the object, with its display
+    derivatives alongside; returns (success, error_text) for the object itself"""
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            return await store_upload(filename, body, content_type, plan, own_client, derivatives)
+    if plan:
+        await record_vision_plan(filename, plan, client)
+    stored, *extras = await asyncio.gather(
+        upload_to_storage(filename, body, content_type, client),
+        *(upload_to_storage(name, extra, extra_type, client) for name, extra, extra_type in derivatives)
+    )
+    for (name, _, _), (success, _) in zip(derivatives, extras):
+        if not success:
+            # The gallery falls back to the full image
+            print(f"⚠️ Derivative {name} not stored")
+    return stored
+
+async def record_upload_hash(filename: str, phash: int, duplicate: Optional[Dict[str, Any]], client: httpx.AsyncClient):
+    """Save an object's hash, and the image it duplicates, before it is stored;
+    the edge function copies them onto the images row"""
+    resp = await client.post(
+        f"{SUPABASE_URL}/rest/v1/upload_hashes",
+        headers={
+            "apikey": SUPABASE_SERVICE_ROLE_KEY,
+            "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal"
+        },
+        json={
+            "source_name": filename,
+            "phash": to_signed(phash),
+            "duplicate_of": duplicate["id"] if duplicate else None,
+            "duplicate_of_source": duplicate["source_name"] if duplicate else None,
+            "duplicate_distance": duplicate["distance"] if duplicate else None
+        }
+    )
+    if resp.status_code not in (200, 201, 204):
+        # The upload is analysed as a new image
+        print(f"⚠️ Could not record hash for {filename}: {resp.status_code} - {resp.text}")
+
+async def record_pre_analysis(filename: str, pre: Dict[str, Any], client: httpx.AsyncClient):
+    """Save an object's local pre-analysis before it is stored; the edge
+    function copies it onto the images row and skips Vision for blank cards"""
+    resp = await client.post(
+        f"{SUPABASE_URL}/rest/v1/upload_pre_analysis",
+        headers={
+            "apikey": SUPABASE_SERVICE_ROLE_KEY,
+            "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal"
+        },
+        json={"source_name": filename, "pre_analysis": pre, "vision_action": pre["vision_action"]}
+    )
+    if resp.status_code not in (200, 201, 204):
+        # The upload is analysed by the Vision API as usual
+        print(f"⚠️ Could not record pre-analysis for {filename}: {resp.status_code} - {resp.text}")
+
+async def store_prepared(prepared: Dict[str, Any], client: Optional[httpx.AsyncClient] = None) -> Dict[str, Any]:
+    """Check the output of prepare_image_upload()/prepare_card_upload() against
+    earlier uploads and store it according to DEDUP_MODE. Returns
+    {"success", "filename", "vision", "pre_analysis", "duplicate_of", "error"};
+    filename is None when the upload was linked to an earlier image instead of
+    stored. Raises ImageRejected (409) for duplicates when DEDUP_MODE is reject"""
+    filename, phash, pre = prepared["filename"], prepared["phash"], prepared["pre_analysis"]
+    duplicate = duplicate_index.find(phash) if duplicate_index and phash is not None else None
+    if duplicate:
+        original = duplicate["id"] or duplicate["source_name"]
+        print(f"♊ Near-duplicate of {original} ({duplicate['distance']} bits apart)")
+        if DEDUP_MODE == "reject":
+            raise ImageRejected(f"Duplicate of an existing image ({original})", status_code=409)
+        if DEDUP_MODE == "link":
+            return {"success": True, "filename": None, "vision": None, "pre_analysis": None,
+                    "duplicate_of": duplicate, "error": None}
+    
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            return await store_prepared(prepared, own_client)
+    registrations = []
+    if phash is not None:
+        registrations.append(record_upload_hash(filename, phash, duplicate, client))
+    if pre is not None:
+        registrations.append(record_pre_analysis(filename, pre, client))
+    await asyncio.gather(*registrations)
+    success, error = await store_upload(filename, prepared["body"], prepared["content_type"], prepared["vision"],
+                                        client, prepared["derivatives"])
+    if success and duplicate_index and phash is not None and not duplicate:
+        duplicate_index.add(phash, filename)
+    return {
+        "success": success,
+        "filename": filename if success else None,
+        "vision": prepared["vision"],
+        "pre_analysis": pre,
+        "duplicate_of": duplicate,
+        "error": error
+    }
+
+def resolve_upload_settings(vision_preset: Optional[str], token_budget: Optional[int], detail: Optional[str]):
+    """Upload settings -> (token_budget, detail); raises ValueError on bad input"""
+    return resolve_vision_settings(vision_preset, token_budget, detail, default_preset=VISION_PRESET)
+
+async def wait_for_analysis(jobs: UploadJobManager, job_id: str, filename: str):
+    """Poll for the images row the edge function creates for this upload"""
+    deadline = time.monotonic() + ANALYSIS_WAIT_TIMEOUT
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(ANALYSIS_POLL_INTERVAL)
+            try:
+                resp = await client.get(
+                    f"{SUPABASE_URL}/rest/v1/images",
+                    headers={
+                        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+                        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+                    },
+                    params={"source_name": f"eq.{filename}", "select": "id,tags", "limit": "1"}
+                )
+            except httpx.HTTPError as e:
+                print(f"⚠️ Analysis status check failed for {filename}: {e}")
+                continue
+            rows = resp.json() if resp.status_code == 200 else []
+            if rows and rows[0].get("tags"):
+                await jobs.update(job_id, status="analyzed", image_id=rows[0]["id"])
+                return
+            if rows and not jobs.jobs[job_id]["image_id"]:
+                await jobs.update(job_id, image_id=rows[0]["id"])
+    await jobs.update(job_id, status="analysis_pending")
+
+async def process_upload_job(jobs: UploadJobManager, job):
+    """Resize a spooled upload on the worker pool, store it, then track its analysis"""
+    loop = asyncio.get_running_loop()
+    # Finalized resumable uploads count towards the session metrics once stored
+    session = job.get("upload_session")
+    try:
+        with open(job["spool_path"], "rb") as spooled:
+            prepared = await loop.run_in_executor(
+                upload_executor, prepare_image_upload,
+                spooled, job["original_filename"], job["content_type"], job["token_budget"], job["detail"]
+            )
+            stored = await store_prepared(prepared)
+    except Exception:
+        if session:
+            upload_sessions.record_result(session, False)
+        raise
+    if session:
+        upload_sessions.record_result(session, stored["success"])
+    if not stored["success"]:
+        await jobs.update(job["job_id"], status="failed", error=stored["error"])
+        return
+    duplicate = stored["duplicate_of"]
+    if stored["filename"] is None:
+        # Linked to an earlier upload: follow that one's analysis instead
+        if duplicate["id"]:
+            await jobs.update(job["job_id"], status="analyzed", image_id=duplicate["id"], duplicate_of=duplicate)
+            return
+        await jobs.update(job["job_id"], status="stored", filename=duplicate["source_name"], duplicate_of=duplicate)
+        jobs.spawn(wait_for_analysis(jobs, job["job_id"], duplicate["source_name"]))
+        return
+    await jobs.update(job["job_id"], status="stored", filename=stored["filename"], vision=stored["vision"],
+                      duplicate_of=duplicate)
+    jobs.spawn(wait_for_analysis(jobs, job["job_id"], stored["filename"]))
+
+upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+upload_jobs = UploadJobManager(process_upload_job, workers=UPLOAD_WORKERS)
+
 @app.post("/upload")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(
+    file: UploadFile = File(...),
+    async_upload: bool = UPLOAD_ASYNC_DEFAULT,
+    vision_preset: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    detail: Optional[str] = None
+):
+    """Upload one image. vision_preset (economy/standard/detailed), token_budget
+    and detail control how large it is stored for the Vision API"""
     if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
         return {"error": "Supabase config missing"}
     
+    try:
+        token_budget, detail = resolve_upload_settings(vision_preset, token_budget, detail)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    
     if not file.filename:
         return {"error": "No filename provided"}
     
@@ -114,68 +524,605 @@ async def upload_image(file: UploadFile = File(...)):
     
     print(f"📤 Processing upload: {file.filename} ({file.content_type})")
     
-    # Get original file size for debugging
-    original_data = await file.read()
-    original_size_bytes = len(original_data)
-    original_size_mb = original_size_bytes / (1024 * 1024)
+    # The form is already spooled (refuse_oversized_forms catches declared sizes
+    # earlier); refuse oversized files before copying or decoding them
+    if stream_size(file.file) > UPLOAD_MAX_BYTES:
+        return JSONResponse(
+            status_code=413,
+            content={"success": False, "error": f"File too large (max {UPLOAD_MAX_BYTES / (1024 * 1024):g} MB)"}
+        )
     
-    print(f"📏 Original file size: {original_size_bytes:,} bytes ({original_size_mb:.2f} MB)")
+    if async_upload:
+        # Spool to disk and hand off; the request ends as soon as the bytes are safe
+        os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+        spool_path = os.path.join(UPLOAD_SPOOL_DIR, f"{uuid.uuid4().hex}.upload")
+        with open(spool_path, "wb") as spooled:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, spooled)
+        return submit_upload_job(spool_path, file.filename, file.content_type, token_budget, detail)
     
-    # Reset file pointer for resizing
-    file.file.seek(0)
+    return await upload_pipeline(file.file, file.filename, file.content_type, token_budget, detail)
+
+def submit_upload_job(spool_path: str, filename: str, content_type: str,
+                      token_budget: Optional[int], detail: str,
+                      upload_session: Optional[Dict[str, Any]] = None) -> JSONResponse:
+    """Queue a spooled upload for the worker pool; 202 with the job's status URL"""
+    job = upload_jobs.submit(spool_path, filename, content_type, token_budget=token_budget, detail=detail,
+                             upload_session=upload_session)
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "status_url": f"/api/uploads/{job['job_id']}"
+        }
+    )
+
+async def upload_pipeline(body: BinaryIO, filename: str, content_type: str,
+                          token_budget: Optional[int], detail: str):
+    """Resize and store one upload; the /upload response"""
+    try:
+        prepared = await asyncio.get_running_loop().run_in_executor(
+            upload_executor, prepare_image_upload,
+            body, filename, content_type, token_budget, detail
+        )
+        stored = await store_prepared(prepared)
+    except ImageRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error": str(e)})
+    if stored["success"]:
+        return {
+            "success": True,
+            "filename": stored["filename"],
+            "vision": stored["vision"],
+            "pre_analysis": stored["pre_analysis"],
+            "duplicate_of": stored["duplicate_of"]
+        }
+    return {"success": False, "error": stored["error"]}
+
+upload_sessions = UploadSessionManager(
+    os.path.join(UPLOAD_SPOOL_DIR, "sessions"), max_bytes=UPLOAD_MAX_BYTES, ttl=UPLOAD_SESSION_TTL
+)
+
+def session_error(e: SessionError) -> JSONResponse:
+    content = {"success": False, "error": str(e)}
+    if e.offset is not None:
+        content["offset"] = e.offset
+    return JSONResponse(status_code=e.status_code, content=content)
+
+@app.post("/upload/sessions")
+async def create_upload_session(
+    filename: str,
+    size: int,
+    content_type: str,
+    vision_preset: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    detail: Optional[str] = None
+):
+    """Start a resumable upload of `size` bytes (see app/upload_sessions.py).
+    Vision settings are as for /upload and apply when the session is finalized"""
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return {"error": "Supabase config missing"}
+    try:
+        token_budget, detail = resolve_upload_settings(vision_preset, token_budget, detail)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if not content_type.startswith('image/'):
+        return JSONResponse(status_code=400, content={"error": "Only image files are allowed"})
+    try:
+        session = await asyncio.to_thread(
+            upload_sessions.create, filename, content_type, size,
+            {"token_budget": token_budget, "detail": detail}
+        )
+    except SessionError as e:
+        return session_error(e)
+    print(f"📦 Resumable upload started: {filename} ({size:,} bytes, session {session['upload_id']})")
+    return JSONResponse(
+        status_code=201,
+        content={
+            **upload_sessions.public(session),
+            "chunk_size": UPLOAD_SESSION_CHUNK_SIZE,
+            "upload_url": f"/upload/sessions/{session['upload_id']}"
+        }
+    )
+
+@app.get("/api/upload-config")
+async def get_upload_config(vision_preset: Optional[str] = None):
+    """Settings for the upload page. max_side/max_short_side bound everything
+    the server keeps of an upload (Vision image and display derivatives), so
+    the browser can downscale to them before sending"""
+    try:
+        token_budget, detail = resolve_upload_settings(vision_preset, None, None)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    max_side, max_short_side = vision_resize_bounds(token_budget, detail)
+    # A derivative larger than the Vision image needs more of the original
+    derivative_side = max(DERIVATIVE_SIZES.values(), default=0)
+    if derivative_side > max_side:
+        max_side, max_short_side = derivative_side, None
+    elif max_short_side is not None and derivative_side > max_short_side:
+        max_short_side = derivative_side
+    return {
+        "vision_preset": vision_preset or VISION_PRESET,
+        "max_side": max_side,
+        "max_short_side": max_short_side,
+        "quality": UPLOAD_CLIENT_QUALITY,
+        "resized_suffix": CLIENT_RESIZED_SUFFIX,
+        "max_bytes": UPLOAD_MAX_BYTES,
+        "concurrency": UPLOAD_CLIENT_CONCURRENCY,
+        "resumable_threshold": UPLOAD_RESUMABLE_THRESHOLD,
+        "resumable_chunk_size": UPLOAD_SESSION_CHUNK_SIZE,
+    }
+
+@app.get("/api/upload-sessions/stats")
+async def get_upload_session_stats():
+    """Resumable upload success rate and bytes transferred per completed upload"""
+    return upload_sessions.stats()
+
+@app.get("/upload/sessions/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """Current offset of a resumable upload; resume by PUTting from there"""
+    try:
+        return upload_sessions.public(upload_sessions.get(upload_id))
+    except SessionError as e:
+        return session_error(e)
+
+@app.put("/upload/sessions/{upload_id}")
+async def put_upload_chunk(request: Request, upload_id: str, offset: int):
+    """Append the request body to a resumable upload at `offset`"""
+    try:
+        session = await upload_sessions.write(upload_id, offset, request.stream())
+    except SessionError as e:
+        return session_error(e)
+    except ClientDisconnect:
+        # The bytes that arrived are kept; the client resumes from GET's offset
+        return JSONResponse(status_code=400, content={"error": "Client disconnected"})
+    return upload_sessions.public(session)
+
+@app.post("/upload/sessions/{upload_id}/finalize")
+async def finalize_upload_session(upload_id: str, async_upload: bool = UPLOAD_ASYNC_DEFAULT):
+    """Process a completely received upload once; responds like /upload"""
+    try:
+        session = await upload_sessions.finalize(upload_id)
+    except SessionError as e:
+        return session_error(e)
+    settings = session["settings"]
+    print(f"📤 Processing resumable upload: {session['filename']} "
+          f"({session['size']:,} bytes, {session['bytes_received']:,} received)")
+
+    if async_upload:
+        # The job records the session's result once it has run
+        return submit_upload_job(session["spool_path"], session["filename"], session["content_type"],
+                                 settings["token_budget"], settings["detail"], upload_session=session)
+    result = None
+    try:
+        with open(session["spool_path"], "rb") as spooled:
+            result = await upload_pipeline(spooled, session["filename"], session["content_type"],
+                                           settings["token_budget"], settings["detail"])
+    finally:
+        os.remove(session["spool_path"])
+        upload_sessions.record_result(session, isinstance(result, dict) and result["success"])
+    return result
+
+@app.delete("/upload/sessions/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """Abandon a resumable upload and delete its spooled bytes"""
+    try:
+        upload_sessions.abort(upload_id)
+    except SessionError as e:
+        return session_error(e)
+    return {"success": True}
+
+@app.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    vision_preset: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    detail: Optional[str] = None
+):
+    """Upload many images in one request; resizes run on the worker pool and
+    storage writes run concurrently, bounded by UPLOAD_STORAGE_CONCURRENCY.
+    Vision settings are the same as /upload and apply to every file"""
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return {"error": "Supabase config missing"}
     
-    # Resize image to reduce Vision API token costs
     try:
-        resized_image = resize_image_for_vision_api(file.file)
-        data = resized_image.getvalue()
-        final_size_bytes = len(data)
-        final_size_mb = final_size_bytes / (1024 * 1024)
-        reduction_ratio = (original_size_bytes - final_size_bytes) / original_size_bytes * 100
-        
-        print(f"💾 Resized image size: {final_size_bytes:,} bytes ({final_size_mb:.2f} MB)")
-        print(f"📉 Size reduction: {reduction_ratio:.1f}%")
-        
-        # 🚨 WARN ABOUT POTENTIALLY HIGH TOKEN USAGE
-        if final_size_mb > 5:
-            print(f"🚨 WARNING: Large image file ({final_size_mb:.1f} MB) may cause high token usage!")
-        elif final_size_mb > 2:
-            print(f"⚠️ Moderate size image ({final_size_mb:.1f} MB) - may use more tokens")
+        token_budget, detail = resolve_upload_settings(vision_preset, token_budget, detail)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Too many files in one batch (max {UPLOAD_BATCH_MAX_FILES})"}
+        )
+    
+    print(f"📤 Processing batch upload: {len(files)} files")
+    loop = asyncio.get_running_loop()
+    storage_slots = asyncio.Semaphore(UPLOAD_STORAGE_CONCURRENCY)
+    
+    async def handle(file: UploadFile, client: httpx.AsyncClient):
+        result = {"original_filename": file.filename, "success": False}
+        if not file.filename:
+            result["error"] = "No filename provided"
+            return result
+        if not file.content_type or not file.content_type.startswith('image/'):
+            result["error"] = "Only image files are allowed"
+            return result
+        try:
+            prepared = await loop.run_in_executor(
+                upload_executor, prepare_image_upload,
+                file.file, file.filename, file.content_type, token_budget, detail
+            )
+            async with storage_slots:
+                stored = await store_prepared(prepared, client)
+        except Exception as e:
+            print(f"❌ Batch upload error for {file.filename}: {e}")
+            result["error"] = str(e)
+            return result
+        result["success"] = stored["success"]
+        if stored["success"]:
+            result["filename"] = stored["filename"]
+            result["vision"] = stored["vision"]
+            result["pre_analysis"] = stored["pre_analysis"]
+            result["duplicate_of"] = stored["duplicate_of"]
         else:
-            print(f"✅ Good size for Vision API ({final_size_mb:.1f} MB)")
-            
-    except Exception as resize_error:
-        print(f"⚠️ Resize failed, using original: {resize_error}")
-        data = original_data
+            result["error"] = stored["error"]
+        return result
     
-    # Generate UUID filename with original extension
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    filename = f"{uuid.uuid4()}{file_ext}"
+    async with httpx.AsyncClient(
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=UPLOAD_STORAGE_CONCURRENCY)
+    ) as client:
+        results = await asyncio.gather(*(handle(file, client) for file in files))
     
-    async with httpx.AsyncClient() as client:
-        upload_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{filename}"
-        headers = {
+    successful = sum(1 for r in results if r["success"])
+    print(f"✅ Batch upload finished: {successful}/{len(results)} stored")
+    return {
+        "success": successful == len(results),
+        "total": len(results),
+        "successful": successful,
+        "failed": len(results) - successful,
+        "results": results
+    }
+
+async def record_sheet_cards(sheet_id: str, rows: int, cols: int, cards, client: httpx.AsyncClient):
+    """Register each card's object name with its sheet before the card is stored"""
+    resp = await client.post(
+        f"{SUPABASE_URL}/rest/v1/upload_sheet_cards",
+        headers={
+            "apikey": SUPABASE_SERVICE_ROLE_KEY,
             "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-            "Content-Type": "image/jpeg"  # Always JPEG after resize
-        }
-        resp = await client.post(upload_url, headers=headers, content=data)
-        if resp.status_code == 200:
-            print(f"✅ Upload successful: {filename}")
-            return {"success": True, "filename": filename}
-        print(f"❌ Upload failed: {resp.status_code} - {resp.text}")
-        return {"success": False, "error": resp.text}
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal"
+        },
+        json=[
+            {"source_name": filename, "sheet_id": sheet_id, "sheet_position": position,
+             "sheet_rows": rows, "sheet_cols": cols}
+            for position, filename in cards
+        ]
+    )
+    if resp.status_code not in (200, 201, 204):
+        print(f"⚠️ Could not record sheet {sheet_id}: {resp.status_code} - {resp.text}")
+
+async def forget_sheet_card(filename: str, client: httpx.AsyncClient):
+    """Drop the registration of a card that was not stored after all"""
+    try:
+        resp = await client.delete(
+            f"{SUPABASE_URL}/rest/v1/upload_sheet_cards",
+            headers={
+                "apikey": SUPABASE_SERVICE_ROLE_KEY,
+                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+                "Prefer": "return=minimal"
+            },
+            params={"source_name": f"eq.{filename}"}
+        )
+        if resp.status_code not in (200, 204):
+            print(f"⚠️ Could not remove sheet card {filename}: {resp.status_code} - {resp.text}")
+    except httpx.HTTPError as e:
+        print(f"⚠️ Could not remove sheet card {filename}: {e}")
+
+@app.post("/upload/sheet")
+async def upload_sheet(
+    file: UploadFile = File(...),
+    rows: int = SHEET_ROWS,
+    cols: int = SHEET_COLS,
+    detect: bool = True,
+    vision_preset: Optional[str] = None,
+    token_budget: Optional[int] = None,
+    detail: Optional[str] = None
+):
+    """Split a full flashcard sheet into its rows x cols cards and upload each
+    as its own image, linked by a shared sheet_id. With detect=true the split
+    lines snap to the gutters between cards; vision settings apply per card"""
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return {"error": "Supabase config missing"}
+    
+    if not file.content_type or not file.content_type.startswith('image/'):
+        return {"error": "Only image files are allowed"}
+    
+    if rows < 1 or cols < 1 or rows * cols > SHEET_MAX_CELLS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Grid must have between 1 and {SHEET_MAX_CELLS} cards"}
+        )
+    
+    try:
+        token_budget, detail = resolve_upload_settings(vision_preset, token_budget, detail)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    
+    print(f"📤 Processing sheet upload: {file.filename} ({rows}x{cols})")
+    loop = asyncio.get_running_loop()
+    
+    def decode_and_split():
+        return split_sheet(open_sheet(file.file, rows, cols, token_budget, detail), rows, cols, detect)
+    
+    try:
+        cards = await loop.run_in_executor(upload_executor, decode_and_split)
+    except ImageRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error": str(e)})
+    
+    # Cards are resized and encoded in parallel on the upload pool; a card that
+    # fails is reported in its result without failing the others
+    prepared = await asyncio.gather(*(
+        loop.run_in_executor(upload_executor, prepare_card_upload, card, token_budget, detail)
+        for _, _, _, card in cards
+    ), return_exceptions=True)
+    
+    sheet_id = str(uuid.uuid4())
+    storage_slots = asyncio.Semaphore(UPLOAD_STORAGE_CONCURRENCY)
+    
+    async def store(card, upload, client):
+        position, row, col, _ = card
+        result = {"position": position, "row": row, "col": col, "success": False}
+        if isinstance(upload, Exception):
+            print(f"❌ Sheet {sheet_id} card {position}: {upload}")
+            result["error"] = str(upload)
+            return result
+        try:
+            async with storage_slots:
+                # The edge function looks the card up when its object arrives
+                await record_sheet_cards(sheet_id, rows, cols, [(position, upload["filename"])], client)
+                stored = await store_prepared(upload, client)
+        except Exception as e:
+            if not isinstance(e, ImageRejected):
+                print(f"❌ Sheet {sheet_id} card {position}: {e}")
+            stored = {"success": False, "filename": None, "error": str(e)}
+        if stored["filename"] is None:
+            # Failed, rejected or linked to an earlier image: nothing was stored under this name
+            await forget_sheet_card(upload["filename"], client)
+        result["success"] = stored["success"]
+        if stored["success"]:
+            result.update(filename=stored["filename"], vision=stored["vision"],
+                          pre_analysis=stored["pre_analysis"], duplicate_of=stored["duplicate_of"])
+        else:
+            result["error"] = stored["error"]
+        return result
+    
+    async with httpx.AsyncClient(
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=UPLOAD_STORAGE_CONCURRENCY)
+    ) as client:
+        results = await asyncio.gather(*(store(card, upload, client) for card, upload in zip(cards, prepared)))
+    
+    successful = sum(1 for r in results if r["success"])
+    print(f"✅ Sheet {sheet_id} finished: {successful}/{len(results)} cards stored")
+    return {
+        "success": successful == len(results),
+        "sheet_id": sheet_id,
+        "rows": rows,
+        "cols": cols,
+        "results": results
+    }
+
+@app.get("/api/uploads/{job_id}")
+async def get_upload_status(job_id: str):
+    """Get the status of an asynchronous upload job"""
+    job = upload_jobs.get(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Upload job not found"})
+    return job
+
+@app.get("/api/uploads/{job_id}/wait")
+async def wait_upload_status(job_id: str, since: int = 0, timeout: float = 25.0):
+    """Long-poll an upload job until its version passes `since`, it finishes, or timeout"""
+    job = await upload_jobs.wait(job_id, since_version=since, timeout=min(max(timeout, 0.0), 60.0))
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Upload job not found"})
+    return job
+
+async def sign_storage_urls(paths: List[str], client: httpx.AsyncClient, expires_in: int = SIGNED_URL_EXPIRES) -> Dict[str, str]:
+    """Signed URLs for many objects in one request; objects that don't exist
+    (or a failed request) are left out"""
+    if not paths:
+        return {}
+    resp = await client.post(
+        f"{SUPABASE_URL}/storage/v1/object/sign/{SUPABASE_BUCKET_NAME}",
+        headers={
+            "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+            "apikey": SUPABASE_SERVICE_ROLE_KEY,
+            "Content-Type": "application/json"
+        },
+        json={"expiresIn": expires_in, "paths": paths}
+    )
+    if resp.status_code != 200:
+        print(f"⚠️ Could not sign URLs: {resp.status_code} - {resp.text}")
+        return {}
+    return {
+        item["path"]: f"{SUPABASE_URL}/storage/v1{item['signedURL']}"
+        for item in resp.json() if item.get("signedURL") and not item.get("error")
+    }
+
+class StorageFetchError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+async def fetch_storage_object(image_name: str, out: BinaryIO):
+    """Stream an object from Storage into out; raises StorageFetchError"""
+    if not STORAGE_OBJECT_NAME.fullmatch(image_name):
+        raise StorageFetchError(f"Invalid image name: {image_name!r}", 404)
+    object_path = "/".join(quote(segment, safe="") for segment in image_name.split("/"))
+    url = f"{SUPABASE_URL}/storage/v1/object/{quote(SUPABASE_BUCKET_NAME, safe='')}/{object_path}"
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+    }
+    async with storage_client.stream("GET", url, headers=headers) as resp:
+        if resp.status_code != 200:
+            await resp.aread()
+            # Storage answers 400 for some missing objects
+            status = 404 if resp.status_code in (400, 404) else 502
+            raise StorageFetchError(f"Storage read failed: {resp.status_code} - {resp.text}", status)
+        async for chunk in resp.aiter_bytes(UPLOAD_STREAM_CHUNK_SIZE):
+            out.write(chunk)
+
+async def render_image_variant(image_name: str, width: int, out: BinaryIO):
+    """Write a resized variant of a cached Storage object into out"""
+    original, _ = await image_cache.get(image_name, lambda f: fetch_storage_object(image_name, f))
+    loop = asyncio.get_running_loop()
+    try:
+        buffer = await loop.run_in_executor(upload_executor, resize_to_width, original, width)
+    except Exception as e:
+        raise StorageFetchError(f"Could not resize {image_name}: {e}", 422)
+    out.write(buffer.getbuffer())
+
+def proxy_width(width: int) -> int:
+    """Smallest configured proxy width >= width (the largest if none is)"""
+    return next((w for w in IMAGE_PROXY_WIDTHS if w >= width), IMAGE_PROXY_WIDTHS[-1])
+
+def proxy_url(image_name: str, width: Optional[int] = None) -> str:
+    url = f"/img/{quote(image_name)}"
+    return f"{url}?w={proxy_width(width)}" if width else url
+
+@app.get("/img/{image_name:path}")
+async def proxy_image(request: Request, image_name: str, w: Optional[int] = None):
+    """Serve a Storage object, or a variant at most ?w= px wide, from the disk cache"""
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return JSONResponse(status_code=500, content={"error": "Supabase config missing"})
+    if image_cache is None:
+        return JSONResponse(status_code=404, content={"error": "Image proxy disabled"})
+    if w is not None and w <= 0:
+        return JSONResponse(status_code=400, content={"error": "w must be positive"})
+    # Checked before the cache is touched; fetch_storage_object checks again
+    if not STORAGE_OBJECT_NAME.fullmatch(image_name):
+        return JSONResponse(status_code=404, content={"error": "Image not found"})
+
+    try:
+        if w:
+            width = proxy_width(w)
+            path, etag = await image_cache.get(
+                f"{image_name}?w={width}", lambda f: render_image_variant(image_name, width, f)
+            )
+            media_type = CONTENT_TYPES[DISPLAY_FORMAT]
+        else:
+            path, etag = await image_cache.get(image_name, lambda f: fetch_storage_object(image_name, f))
+            media_type = mimetypes.guess_type(image_name)[0] or "application/octet-stream"
+    except StorageFetchError as e:
+        if e.status_code != 404:
+            print(f"⚠️ Image proxy: {e}")
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    except httpx.HTTPError as e:
+        print(f"⚠️ Image proxy: Storage unreachable: {e}")
+        return JSONResponse(status_code=502, content={"error": f"Storage unreachable: {e}"})
+
+    headers = {"ETag": etag, "Cache-Control": IMAGE_PROXY_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+def encode_page_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_page_cursor(cursor: str):
+    """(created_at, id) of the last row of the previous page; raises ValueError"""
+    try:
+        created_at, image_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        datetime.fromisoformat(created_at)
+        uuid.UUID(image_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return created_at, image_id
+
+def content_range_total(response: httpx.Response) -> Optional[int]:
+    """Total row count of a PostgREST response requested with Prefer: count=exact"""
+    try:
+        return int(response.headers.get("content-range", "").rsplit("/", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+async def count_images(client: httpx.AsyncClient, headers: Dict[str, str], **filters) -> Optional[int]:
+    """Row count from PostgREST's Content-Range, without reading the rows"""
+    resp = await client.get(
+        f"{SUPABASE_URL}/rest/v1/images",
+        headers={**headers, "Prefer": "count=exact"},
+        params={"select": "id", "limit": "1", **filters}
+    )
+    return content_range_total(resp)
+
+async def add_display_urls(images: List[Dict[str, Any]], client: httpx.AsyncClient):
+    """Set display_url and the derivative *_url fields of image rows"""
+    if image_cache is not None:
+        # Proxied URLs are stable, so browsers cache them across loads;
+        # derivative sizes come from the proxy's ?w= variants
+        for image in images:
+            image['display_url'] = proxy_url(image['image_name'])
+            for kind in DERIVATIVE_KINDS:
+                side = DERIVATIVE_SIZES.get(kind)
+                image[f"{kind}_url"] = proxy_url(image['image_name'], side) if side else image['display_url']
+        return
+
+    # Signed URLs for each image and its derivatives, in one request
+    derivative_paths = {
+        image["id"]: {kind: derivative_name(image["source_name"], kind) for kind in DERIVATIVE_KINDS}
+        for image in images if image.get("source_name")
+    }
+    signed = await sign_storage_urls(
+        [image["image_name"] for image in images]
+        + [path for paths in derivative_paths.values() for path in paths.values()],
+        client
+    )
+    for image in images:
+        # Fallback to original URL (works if bucket is public)
+        image['display_url'] = signed.get(image['image_name']) or image['image_url']
+        # Uploads from before derivatives existed have none; use the full image
+        paths = derivative_paths.get(image["id"], {})
+        for kind in DERIVATIVE_KINDS:
+            image[f"{kind}_url"] = signed.get(paths.get(kind)) or image['display_url']
 
 @app.get("/api/images")
-async def get_images():
-    """Get all images with their AI analysis data"""
+async def get_images(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Get images with their AI analysis data, newest first.
+
+    With limit, one page of at most IMAGES_PAGE_MAX images plus next_cursor
+    (null on the last page) to pass as cursor for the next; stats are only
+    computed for the first page. Without limit, every image.
+
+    When writes are reported to /internal/invalidate, responses carry an ETag
+    for the current data version and If-None-Match is answered with 304.
+    """
     if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
         return JSONResponse(
             status_code=500,
             content={"error": "Supabase config missing"}
         )
     
+    signing_window = None if IMAGE_PROXY_ENABLED else int(time.time() // SIGNED_URL_WINDOW)
+    etag_headers = {}
+    if INVALIDATION_ENABLED:
+        etag = caches.etag("images", signing_window, limit, cursor)
+        etag_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=etag_headers)
+    page_key = (caches.tag, signing_window, limit, cursor)
+    cached = images_page_cache.get(page_key)
+    if cached is not None:
+        return JSONResponse(cached, headers=etag_headers)
+    
     try:
         async with httpx.AsyncClient() as client:
-            # Get all images
             images_url = f"{SUPABASE_URL}/rest/v1/images"
             headers = {
                 "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
@@ -183,11 +1130,22 @@ async def get_images():
                 "Content-Type": "application/json"
             }
             
-            # Query with ordering by created_at descending
+            # Newest first; id breaks ties so pages never overlap or skip rows
             params = {
-                "select": "id,image_name,image_url,description,confidence,tags,prompt_tokens,completion_tokens,total_tokens,analysis_attempts,created_at",
-                "order": "created_at.desc"
+                "select": IMAGE_LIST_COLUMNS,
+                "order": "created_at.desc,id.desc"
             }
+            if limit is not None:
+                params["limit"] = str(max(1, min(limit, IMAGES_PAGE_MAX)))
+            if cursor:
+                try:
+                    created_at, image_id = decode_page_cursor(cursor)
+                except ValueError as e:
+                    return JSONResponse(status_code=400, content={"error": str(e)})
+                # The lte bound gives Postgres an index range to start from;
+                # the or() then drops the previous page's tail within it
+                params["created_at"] = f"lte.{created_at}"
+                params["or"] = f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{image_id}))'
             
             resp = await client.get(images_url, headers=headers, params=params)
             
@@ -198,44 +1156,389 @@ async def get_images():
                 )
             
             images = resp.json()
+            await add_display_urls(images, client)
             
-            # Generate signed URLs for each image if bucket is private
-            for image in images:
-                # Try to create a signed URL for display
-                signed_url_endpoint = f"{SUPABASE_URL}/storage/v1/object/sign/{SUPABASE_BUCKET_NAME}/{image['image_name']}"
-                sign_payload = {"expiresIn": 3600}  # 1 hour
-                
-                sign_resp = await client.post(
-                    signed_url_endpoint,
-                    headers=headers,
-                    json=sign_payload
+            if limit is None:
+                analyzed = len([img for img in images if img.get("tags")])
+                stats = {"total": len(images), "analyzed": analyzed}
+            elif not cursor:
+                total, analyzed = await asyncio.gather(
+                    count_images(client, headers),
+                    count_images(client, headers, tags="not.is.null")
                 )
-                
-                if sign_resp.status_code == 200:
-                    sign_data = sign_resp.json()
-                    # Update the image URL to use signed URL for display
-                    image['display_url'] = f"{SUPABASE_URL}/storage/v1{sign_data['signedURL']}"
-                else:
-                    # Fallback to original URL (works if bucket is public)
-                    image['display_url'] = image['image_url']
+                stats = {"total": total, "analyzed": analyzed}
+            else:
+                stats = None
+            if stats:
+                stats["searchable"] = stats["analyzed"]  # Assuming if tags exist, embedding exists
             
-            # Get stats
-            stats = {
-                "total": len(images),
-                "analyzed": len([img for img in images if img.get("tags")]),
-                "searchable": len([img for img in images if img.get("tags")])  # Assuming if tags exist, embedding exists
-            }
-            
-            return {
+            result = {
                 "images": images,
                 "stats": stats
             }
+            if limit is not None:
+                full_page = len(images) == int(params["limit"])
+                result["next_cursor"] = encode_page_cursor(images[-1]) if full_page else None
+            if page_key[0] == caches.tag:  # not invalidated while loading
+                images_page_cache.set(page_key, result, [image["id"] for image in images])
+            return JSONResponse(result, headers=etag_headers)
+            
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Failed to fetch images: {str(e)}"}
+        )
+
+async def load_event_images(image_ids: List[str]) -> List[Dict[str, Any]]:
+    """Rows for changed images, shaped like /api/images entries, as event payloads"""
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(
+            f"{SUPABASE_URL}/rest/v1/images",
+            headers={
+                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+                "apikey": SUPABASE_SERVICE_ROLE_KEY
+            },
+            params={"select": IMAGE_LIST_COLUMNS, "id": f"in.({','.join(image_ids)})"}
+        )
+        resp.raise_for_status()
+        images = resp.json()
+        await add_display_urls(images, client)
+    return [{"id": image["id"], "analyzed": bool(image.get("tags")), "image": image} for image in images]
+
+image_events = None
+image_event_source = None
+if SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY and IMAGE_EVENTS_ENABLED:
+    image_events = ImageEventBroker(load_event_images)
+    if DATABASE_URL:
+        image_event_source = NotifyListener(DATABASE_URL, image_events, on_change=caches.invalidate)
+    else:
+        image_event_source = ChangePoller(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, image_events,
+                                          interval=IMAGE_EVENTS_POLL_INTERVAL)
+
+@app.get("/api/events")
+async def image_event_stream(request: Request):
+    """Server-Sent Events: "image" with an /api/images entry whenever an image
+    is added or its analysis is written, "resync" when events may have been
+    missed (reload what is shown). Reconnects resume after Last-Event-ID."""
+    if image_events is None:
+        return JSONResponse(status_code=503, content={"error": "Live events are disabled"})
+    subscriber, backlog = image_events.subscribe(request.headers.get("last-event-id"))
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            for event in backlog:
+                yield format_sse(*event)
+            while True:
+                if subscriber.lagged and subscriber.queue.empty():
+                    # Dropped for falling behind; the browser reloads and reconnects
+                    yield format_sse(None, "resync", {"reason": "too slow"})
+                    return
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), IMAGE_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(*event)
+        finally:
+            image_events.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # don't let nginx hold events back
+    })
+
+@app.post("/internal/invalidate")
+async def invalidate_caches(request: Request):
+    """Called after images rows are written: {"image_ids": [...]} evicts those
+    images from every cache, {"all": true} empties them (after a backfill).
+    Either way the data version used in cache keys and ETags goes up.
+    Authenticated with "Authorization: Bearer <INVALIDATE_SECRET>"."""
+    if not INVALIDATE_SECRET:
+        return JSONResponse(status_code=503, content={"error": "INVALIDATE_SECRET is not configured"})
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), INVALIDATE_SECRET.encode()):
+        return JSONResponse(status_code=401, content={"error": "Invalid invalidation token"})
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Body must be JSON"})
+    if not isinstance(body, dict):
+        return JSONResponse(status_code=400, content={"error": "Body must be a JSON object"})
+
+    if body.get("all") is True:
+        result = caches.invalidate()
+        print(f"🧹 Invalidated all caches (version {result['version']})")
+        if image_events:
+            image_events.resync("invalidated")
+        return result
+
+    image_ids = body.get("image_ids")
+    if not isinstance(image_ids, list) or not image_ids:
+        return JSONResponse(status_code=400, content={"error": "Pass image_ids (a non-empty list) or all: true"})
+    try:
+        image_ids = list(dict.fromkeys(str(uuid.UUID(str(image_id))) for image_id in image_ids))
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "image_ids must be UUIDs"})
+
+    result = caches.invalidate(image_ids)
+    print(f"🧹 Invalidated {len(image_ids)} image(s) (version {result['version']})")
+    if image_events:
+        # Duplicates of what the NOTIFY trigger or poller reports are merged
+        # by the broker's batching
+        image_events.notify(image_ids)
+    return result
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Entries, hits and misses per cache, and the current data version"""
+    return caches.stats()
+
+def search_words(query: Optional[str]) -> List[str]:
+    """Lowercase words of a search query; letters and digits only, so they are
+    safe inside PostgREST filters and carry no LIKE wildcards"""
+    return list(dict.fromkeys(re.findall(r"[^\W_]+", (query or "").lower())))
+
+def upload_date_label(created_at: str) -> str:
+    try:
+        return datetime.fromisoformat(created_at).strftime("%b %d, %y, %H:%M UTC")
+    except (TypeError, ValueError):
+        return created_at or "-"
+
+@app.get("/api/detailed")
+async def get_detailed_page(
+    page: int = 1,
+    page_size: int = DETAILED_PAGE_SIZE,
+    sort: str = "created_at",
+    order: str = "desc",
+    category: Optional[str] = None,
+    q: Optional[str] = None
+):
+    """One page of the detailed view's table as pre-rendered rows.
+
+    Args:
+        page: 1-based page number
+        page_size: Rows per page (1-DETAILED_PAGE_MAX)
+        sort: created_at, confidence or tokens (total tokens)
+        order: desc or asc; images without a value sort as the lowest
+        category: Only images with this tags.category
+        q: Search words, all of which must appear in the image's search_text
+    """
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Supabase config missing"}
+        )
+    
+    if sort not in DETAILED_SORTS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid sort: {sort}. Valid sorts: {', '.join(DETAILED_SORTS)}"}
+        )
+    if order not in ("asc", "desc"):
+        return JSONResponse(status_code=400, content={"error": "order must be asc or desc"})
+    page = max(1, page)
+    page_size = max(1, min(page_size, DETAILED_PAGE_MAX))
+    
+    # Matches the (column, id) indexes: NULLs last descending, first ascending
+    column = DETAILED_SORTS[sort]
+    nulls = "" if column == "created_at" else (".nullslast" if order == "desc" else ".nullsfirst")
+    params = {
+        "select": IMAGE_LIST_COLUMNS,
+        "order": f"{column}.{order}{nulls},id.{order}",
+        "limit": str(page_size),
+        "offset": str((page - 1) * page_size)
+    }
+    if category:
+        params["tags->>category"] = f"eq.{category}"
+    words = search_words(q)
+    if words:
+        params["and"] = "(" + ",".join(f"search_text.ilike.*{word}*" for word in words) + ")"
+    
+    try:
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(
+                f"{SUPABASE_URL}/rest/v1/images",
+                headers={
+                    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+                    "apikey": SUPABASE_SERVICE_ROLE_KEY,
+                    "Prefer": "count=exact"
+                },
+                params=params
+            )
+            
+            total = content_range_total(resp)
+            if resp.status_code == 416:
+                images = []  # page past the end
+            elif resp.status_code in (200, 206):
+                images = resp.json()
+            else:
+                return JSONResponse(
+                    status_code=resp.status_code,
+                    content={"error": f"Database error: {resp.text}"}
+                )
             
+            await add_display_urls(images, client)
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"Failed to fetch images: {str(e)}"}
         )
+    
+    for image in images:
+        image["created_label"] = upload_date_label(image.get("created_at"))
+    return {
+        "rows_html": templates.get_template("detailed_rows.html").render(images=images),
+        "count": len(images),
+        "page": page,
+        "page_size": page_size,
+        "pages": max(1, -(-total // page_size)) if total is not None else None,
+        "total": total,
+        "sort": sort,
+        "order": order
+    }
+
+@app.get("/api/facets")
+async def get_facets(types: str | None = None, limit: int = 50):
+    """
+    Get tag counts per facet from the normalized image_tags table
+    
+    Args:
+        types: Optional comma-separated list of facet types (e.g. "category,mood")
+        limit: Maximum values returned per facet (1-500)
+    """
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Supabase config missing"}
+        )
+    
+    types_list = FACET_TYPES
+    if types:
+        types_list = [t.strip() for t in types.split(",") if t.strip()]
+        invalid_types = [t for t in types_list if t not in FACET_TYPES]
+        if invalid_types:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Invalid facet types: {', '.join(invalid_types)}. Valid types: {', '.join(FACET_TYPES)}"}
+            )
+    
+    if limit < 1 or limit > 500:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "limit must be between 1 and 500"}
+        )
+    
+    cache_key = (caches.tag, tuple(sorted(types_list)), limit)
+    cached = facets_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/image_tag_facets",
+                headers={
+                    "apikey": SUPABASE_SERVICE_ROLE_KEY,
+                    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+                    "Content-Type": "application/json"
+                },
+                json={"facet_types": types_list, "limit_per_type": limit}
+            )
+            
+            if response.status_code != 200:
+                return JSONResponse(
+                    status_code=response.status_code,
+                    content={"error": f"Database error: {response.text}"}
+                )
+            
+            facets = {facet_type: [] for facet_type in types_list}
+            for row in response.json():
+                facets.setdefault(row["tag_type"], []).append({
+                    "value": row["tag_value"],
+                    "count": row["frequency"]
+                })
+            
+            data = {
+                "facets": facets,
+                "generated_at": datetime.utcnow().isoformat() + "Z"
+            }
+            if cache_key[0] == caches.tag:
+                facets_cache.set(cache_key, data)
+            return data
+            
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Failed to fetch facets: {str(e)}"}
+        )
+
+@app.get("/api/analytics")
+async def get_analytics():
+    """Get dashboard analytics from the materialized views, with their refresh time"""
+    if not analytics_scheduler:
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Supabase config missing"}
+        )
+    
+    try:
+        return await analytics_scheduler.get_snapshot()
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Failed to fetch analytics: {str(e)}"}
+        )
+
+@app.post("/api/analytics/refresh")
+async def refresh_analytics(force: bool = False):
+    """Trigger a (debounced) refresh of the materialized analytics views"""
+    if not analytics_scheduler:
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Supabase config missing"}
+        )
+    
+    try:
+        refreshed = await analytics_scheduler.refresh(force=force)
+        return {"refreshed": refreshed}
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Failed to refresh analytics: {str(e)}"}
+        )
+
+async def fetch_image_details(client: httpx.AsyncClient, image_ids: List[str]) -> Tuple[int, List[Dict[str, Any]]]:
+    """(status code, IMAGE_DETAIL_COLUMNS rows in image_ids order). Analysed
+    rows are cached until their image is invalidated; pending ones are read
+    every time so a finished analysis is seen even if its report is lost."""
+    rows = {}
+    missing = []
+    for image_id in dict.fromkeys(image_ids):
+        row = image_row_cache.get(image_id)
+        if row is None:
+            missing.append(image_id)
+        else:
+            rows[image_id] = row
+    if missing:
+        tag = caches.tag
+        id_list = ",".join(f'"{image_id}"' for image_id in missing)
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/images",
+            headers={
+                "apikey": SUPABASE_SERVICE_ROLE_KEY,
+                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+            },
+            params={"select": IMAGE_DETAIL_COLUMNS, "id": f"in.({id_list})"}
+        )
+        if response.status_code != 200:
+            return response.status_code, []
+        for row in response.json():
+            rows[row["id"]] = row
+            if row.get("tags") and tag == caches.tag:
+                image_row_cache.set(row["id"], row, [row["id"]])
+    # Copies, so callers can annotate them without touching the cache
+    return 200, [dict(rows[image_id]) for image_id in dict.fromkeys(image_ids) if image_id in rows]
 
 @app.post("/api/generate-questions/{image_id}")
 async def generate_questions(
@@ -289,22 +1592,14 @@ async def generate_questions(
         
         # Fetch image data from Supabase
         async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/images",
-                headers={
-                    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-                },
-                params={"id": f"eq.{image_id}", "select": "*"}
-            )
+            status_code, images = await fetch_image_details(client, [image_id])
             
-            if response.status_code != 200:
+            if status_code != 200:
                 return JSONResponse(
                     status_code=500,
-                    content={"error": f"Failed to fetch image data: {response.status_code}"}
+                    content={"error": f"Failed to fetch image data: {status_code}"}
                 )
             
-            images = response.json()
             if not images:
                 return JSONResponse(
                     status_code=404,
@@ -433,25 +1728,14 @@ async def generate_questions_multi(
         
         # Fetch all image data from Supabase
         async with httpx.AsyncClient() as client:
-            # Build proper query for multiple IDs
-            id_list = ",".join(f'"{img_id}"' for img_id in image_ids)
-            
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/images",
-                headers={
-                    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-                },
-                params={"select": "*", "id": f"in.({id_list})"}
-            )
+            status_code, images = await fetch_image_details(client, image_ids)
             
-            if response.status_code != 200:
+            if status_code != 200:
                 return JSONResponse(
                     status_code=500,
-                    content={"error": f"Failed to fetch image data: {response.status_code}"}
+                    content={"error": f"Failed to fetch image data: {status_code}"}
                 )
             
-            images = response.json()
             if len(images) != len(image_ids):
                 found_ids = [img['id'] for img in images]
                 missing_ids = [id for id in image_ids if id not in found_ids]
@@ -504,19 +1788,13 @@ async def questions_page(request: Request, image_id: str):
         
         # Fetch image data
         async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{SUPABASE_URL}/rest/v1/images",
-                headers={
-                    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-                },
-                params={"id": f"eq.{image_id}", "select": "*"}
-            )
+            status_code, images = await fetch_image_details(client, [image_id])
             
-            if response.status_code == 200:
-                images = response.json()
+            if status_code == 200:
                 if images:
                     image_data = images[0]
+                    if image_cache is not None:
+                        image_data["display_url"] = proxy_url(image_data["image_name"])
                     return templates.TemplateResponse("questions.html", {
                         "request": request,
                         "image": image_data
@@ -0,0 +1,173 @@
+# Local pre-analysis of upload images, before the Vision API sees them
+#
+# Cheap Pillow-only measurements on the resized image: a quantized palette
+# named with the prompt's colour words, the background colour (dominant colour
+# of the border), how much of the card differs from the background, and a
+# count of connected foreground regions. The result is stored on the images
+# row (images.pre_analysis, see supabase/pre_analysis.sql) and decides how the
+# card is analysed:
+#
+#   skip: blank card; the edge function writes a minimal analysis from these
+#         measurements instead of calling the Vision API
+#   low:  a single flat item on a plain background; analysed at low detail
+#
+# Everything runs on a copy no larger than PREANALYSIS_MAX_SIDE.
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageFilter
+
+PREANALYSIS_VERSION = 1
+PREANALYSIS_MAX_SIDE = 128
+PREANALYSIS_PALETTE_SIZE = 8
+# Palette entries below this share of the pixels are dropped as noise
+PREANALYSIS_MIN_SHARE = 0.02
+# A pixel is foreground when it differs this much from the background colour
+# (0-255, luminance of the per-channel difference)
+PREANALYSIS_FOREGROUND_DELTA = 40
+# Regions smaller than this share of the image are not counted as items
+PREANALYSIS_MIN_COMPONENT = 0.002
+# Cards with less foreground than this are blank
+PREANALYSIS_BLANK_FOREGROUND = float(os.getenv("PREANALYSIS_BLANK_FOREGROUND", "0.005"))
+PREANALYSIS_SKIP_BLANK = os.getenv("PREANALYSIS_SKIP_BLANK", "true").lower() == "true"
+PREANALYSIS_DOWNGRADE_SIMPLE = os.getenv("PREANALYSIS_DOWNGRADE_SIMPLE", "true").lower() == "true"
+
+# Colours whose channels differ by less than this are neutrals, named by
+# lightness alone
+NEUTRAL_CHROMA = 32
+
+# Reference shades for the chromatic colour words the Vision prompt uses;
+# several per word so light and dark variants land on the right name
+NAMED_COLORS: List[Tuple[str, Tuple[int, int, int]]] = [
+    ("red", (220, 40, 40)), ("red", (150, 20, 30)),
+    ("orange", (245, 140, 30)), ("orange", (230, 100, 20)),
+    ("yellow", (245, 220, 40)), ("yellow", (255, 240, 120)),
+    ("green", (40, 160, 60)), ("green", (20, 100, 40)), ("green", (140, 200, 80)),
+    ("blue", (40, 80, 220)), ("blue", (20, 40, 130)), ("blue", (90, 170, 240)),
+    ("purple", (130, 60, 170)), ("purple", (80, 30, 110)), ("purple", (180, 130, 220)),
+    ("pink", (240, 130, 180)), ("pink", (250, 190, 210)), ("pink", (220, 50, 130)),
+    ("brown", (130, 80, 40)), ("brown", (90, 55, 30)), ("brown", (190, 140, 90)),
+]
+
+
+def color_name(rgb: Tuple[int, int, int]) -> str:
+    """Prompt colour word for an RGB colour: black/gray/white by lightness for
+    neutrals, otherwise the nearest reference shade (weighted RGB distance)"""
+    r, g, b = rgb
+    if max(rgb) - min(rgb) < NEUTRAL_CHROMA:
+        lightness = (max(rgb) + min(rgb)) / 2
+        return "black" if lightness < 64 else "white" if lightness > 208 else "gray"
+
+    def distance(reference):
+        rr, rg, rb = reference[1]
+        return 2 * (r - rr) ** 2 + 4 * (g - rg) ** 2 + 3 * (b - rb) ** 2
+
+    return min(NAMED_COLORS, key=distance)[0]
+
+
+def _hex(rgb: Tuple[int, int, int]) -> str:
+    return "#%02x%02x%02x" % rgb
+
+
+def _palette(image: Image.Image) -> List[Dict[str, Any]]:
+    quantized = image.quantize(PREANALYSIS_PALETTE_SIZE, method=Image.Quantize.MEDIANCUT)
+    colors = quantized.getpalette()[:PREANALYSIS_PALETTE_SIZE * 3]
+    total = image.size[0] * image.size[1]
+    entries = {}
+    for count, index in quantized.getcolors(PREANALYSIS_PALETTE_SIZE):
+        rgb = tuple(colors[index * 3:index * 3 + 3])
+        name = color_name(rgb)
+        # Shades that share a name are merged; the most common shade represents them
+        entry = entries.setdefault(name, {"color": name, "rgb": _hex(rgb), "share": 0.0, "_top": 0})
+        entry["share"] += count / total
+        if count > entry["_top"]:
+            entry.update(rgb=_hex(rgb), _top=count)
+    palette = [
+        {"color": e["color"], "rgb": e["rgb"], "share": round(e["share"], 3)}
+        for e in entries.values() if e["share"] >= PREANALYSIS_MIN_SHARE
+    ]
+    return sorted(palette, key=lambda e: -e["share"])
+
+
+def _background(image: Image.Image) -> Tuple[int, int, int]:
+    """Most common colour of the 1px border, after a coarse quantization"""
+    width, height = image.size
+    border = Image.new('RGB', (2 * (width + height), 1))
+    border.paste(image.crop((0, 0, width, 1)), (0, 0))
+    border.paste(image.crop((0, height - 1, width, height)), (width, 0))
+    border.paste(image.crop((0, 0, 1, height)).transpose(Image.Transpose.ROTATE_90), (2 * width, 0))
+    border.paste(image.crop((width - 1, 0, width, height)).transpose(Image.Transpose.ROTATE_90), (2 * width + height, 0))
+    quantized = border.quantize(4, method=Image.Quantize.MEDIANCUT)
+    _, index = max(quantized.getcolors(4))
+    return tuple(quantized.getpalette()[index * 3:index * 3 + 3])
+
+
+def _components(mask: Image.Image, min_size: int) -> int:
+    """Number of 4-connected foreground regions of at least min_size pixels"""
+    width, height = mask.size
+    pixels = bytearray(mask.tobytes())
+    count = 0
+    for start in range(len(pixels)):
+        if not pixels[start]:
+            continue
+        pixels[start] = 0
+        size = 0
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            size += 1
+            x = index % width
+            for neighbour in (
+                index - width if index >= width else -1,
+                index + width if index + width < len(pixels) else -1,
+                index - 1 if x > 0 else -1,
+                index + 1 if x + 1 < width else -1,
+            ):
+                if neighbour >= 0 and pixels[neighbour]:
+                    pixels[neighbour] = 0
+                    queue.append(neighbour)
+        if size >= min_size:
+            count += 1
+    return count
+
+
+def pre_analyze(image: Image.Image) -> Dict[str, Any]:
+    """Measure an RGB image; returns the dict stored as images.pre_analysis"""
+    small = image.convert('RGB')
+    if max(small.size) > PREANALYSIS_MAX_SIDE:
+        small = small.copy()
+        small.thumbnail((PREANALYSIS_MAX_SIDE, PREANALYSIS_MAX_SIDE), Image.Resampling.BOX)
+    total = small.size[0] * small.size[1]
+
+    background = _background(small)
+    difference = ImageChops.difference(small, Image.new('RGB', small.size, background)).convert('L')
+    mask = difference.point(lambda v: 255 if v > PREANALYSIS_FOREGROUND_DELTA else 0)
+    foreground = mask.histogram()[255] / total
+    # Close small gaps so letters in a word and outlined shapes count once
+    components = _components(mask.filter(ImageFilter.MaxFilter(3)),
+                             max(int(total * PREANALYSIS_MIN_COMPONENT), 4))
+
+    palette = _palette(small)
+    result = {
+        "version": PREANALYSIS_VERSION,
+        "palette": palette,
+        "colors": [entry["color"] for entry in palette],
+        "background_color": color_name(background),
+        "background_rgb": _hex(background),
+        "foreground_ratio": round(foreground, 4),
+        "component_count": components,
+        "is_blank": foreground < PREANALYSIS_BLANK_FOREGROUND,
+    }
+    result["vision_action"] = vision_action(result)
+    return result
+
+
+def vision_action(pre: Dict[str, Any]) -> Optional[str]:
+    """"skip", "low" or None (analyse as planned) for a pre-analysis result"""
+    if pre["is_blank"]:
+        return "skip" if PREANALYSIS_SKIP_BLANK else None
+    # One flat-coloured item on a plain background: low detail sees it just as well
+    if PREANALYSIS_DOWNGRADE_SIMPLE and pre["component_count"] <= 1 and len(pre["colors"]) <= 2:
+        return "low"
+    return None
@@ -0,0 +1,102 @@
+# Normalized question context for educational flashcards
+#
+# The edge function stores the Vision API tags as camelCase JSONB. Question
+# generation needs a flat, snake_case view of those tags, so it is computed once
+# when the analysis is saved and stored in images.question_context.
+#
+# Keep QUESTION_CONTEXT_VERSION and the field map in sync with
+# buildQuestionContext() in supabase/functions/on-image-upload/index.ts.
+# Bump the version whenever the shape changes and run
+# backfill_question_context.py to rewrite older rows.
+from typing import Any, Dict
+
+QUESTION_CONTEXT_VERSION = 1
+
+# snake_case context key -> (camelCase tag key, default)
+QUESTION_CONTEXT_FIELDS = {
+    "colors": ("colors", []),
+    "shapes": ("shapes", []),
+    "letters": ("letters", []),
+    "numbers": ("numbers", []),
+    "words": ("words", []),
+    "objects": ("objects", []),
+    "people": ("people", []),
+    "animals": ("animals", []),
+    "shape_colors": ("shapeColors", []),
+    "shape_contents": ("shapeContents", []),
+    "nested_elements": ("nestedElements", []),
+    "text_color": ("textColor", ""),
+    "text_vs_semantic_mismatch": ("textVsSemanticMismatch", ""),
+    "text_location": ("textLocation", ""),
+    "object_colors": ("objectColors", []),
+    "object_positions": ("objectPositions", []),
+    "items_inside_shapes": ("itemsInsideShapes", []),
+    "overlapping_items": ("overlappingItems", []),
+    "relative_positions": ("relativePositions", []),
+    "color_word_mismatches": ("colorWordMismatches", []),
+    "highlighted_elements": ("highlightedElements", []),
+    "background_color": ("backgroundColor", "white"),
+    "has_colored_background": ("hasColoredBackground", "false"),
+    "total_items": ("totalItems", "0"),
+    "letter_count": ("letterCount", "0"),
+    "number_count": ("numberCount", "0"),
+    "object_count": ("objectCount", "0"),
+    "shape_count": ("shapeCount", "0"),
+    "category": ("category", "mixed"),
+    "question_types": ("questionTypes", []),
+}
+
+
+def default_question_context(description: str = "") -> Dict[str, Any]:
+    """Return a context with every field set to its default"""
+    context = {"description": description}
+    for key, (_, default) in QUESTION_CONTEXT_FIELDS.items():
+        context[key] = list(default) if isinstance(default, list) else default
+    return context
+
+
+def build_question_context(tags: Any, description: Any) -> Dict[str, Any]:
+    """Normalize camelCase analysis tags into the full question context"""
+    if not isinstance(tags, dict):
+        tags = {}
+    if not isinstance(description, str):
+        description = str(description) if description is not None else ''
+
+    context = default_question_context(description)
+    for key, (tag_key, default) in QUESTION_CONTEXT_FIELDS.items():
+        value = tags.get(tag_key)
+        if not value:
+            continue
+        # List fields must stay lists so prompt builders can slice them
+        if isinstance(default, list) and not isinstance(value, list):
+            continue
+        context[key] = value
+    return context
+
+
+def compact_question_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop fields that still hold their default value before storing.
+
+    The description is not stored; it already lives in images.description.
+    """
+    compact = {}
+    for key, (_, default) in QUESTION_CONTEXT_FIELDS.items():
+        value = context.get(key)
+        if value and value != default:
+            compact[key] = value
+    return compact
+
+
+def load_question_context(image_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return the full question context for an image row.
+
+    Uses the stored question_context when it is at the current version and
+    falls back to normalizing the raw tags otherwise.
+    """
+    stored = image_data.get('question_context')
+    if isinstance(stored, dict) and image_data.get('question_context_version') == QUESTION_CONTEXT_VERSION:
+        context = default_question_context(image_data.get('description') or '')
+        context.update(stored)
+        return context
+    return build_question_context(image_data.get('tags') or {}, image_data.get('description') or '')
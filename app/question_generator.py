@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from question_context import build_question_context, load_question_context
 
 load_dotenv()
 
@@ -95,9 +96,9 @@ class QuestionGenerator:
         print(f"🏷️ Tags extracted: {type(tags)}, content: {str(tags)[:200]}...")
         print(f"📝 Description: {description[:100]}...")
         
-        # Build context for question generation
+        # Use the stored normalized context, rebuilding from tags only for stale rows
         try:
-            context = self._build_question_context(tags, description)
+            context = load_question_context(image_data)
             print(f"✅ Context built successfully: {len(context)} keys")
         except Exception as context_error:
             print(f"❌ Error building context: {context_error}")
@@ -244,69 +245,9 @@ class QuestionGenerator:
     
     def _build_question_context(self, tags: Dict, description: str) -> Dict[str, Any]:
         """Extract key elements for question generation"""
-        # Handle both old flat structure and new nested structure
-        
-        print(f"🔧 Building context from tags: {type(tags)}")
-        if not isinstance(tags, dict):
-            print(f"⚠️ Tags is not a dict, using empty dict instead. Got: {type(tags)}")
-            tags = {}
-        
-        if not isinstance(description, str):
-            print(f"⚠️ Description is not a string, converting. Got: {type(description)}")
-            description = str(description) if description is not None else ''
-        
-        # Try to extract from current flat structure (as used in Edge Function)
-        try:
-            context = {
-                "description": description,
-                "colors": tags.get('colors', []) or [],
-                "shapes": tags.get('shapes', []) or [],
-                "letters": tags.get('letters', []) or [],
-                "numbers": tags.get('numbers', []) or [],
-                "words": tags.get('words', []) or [],
-                "objects": tags.get('objects', []) or [],
-                "people": tags.get('people', []) or [],
-                "animals": tags.get('animals', []) or [],
-                "shape_colors": tags.get('shapeColors', []) or [],
-                "shape_contents": tags.get('shapeContents', []) or [],
-                "nested_elements": tags.get('nestedElements', []) or [],
-                "text_color": tags.get('textColor', '') or '',
-                "text_vs_semantic_mismatch": tags.get('textVsSemanticMismatch', '') or '',
-                "text_location": tags.get('textLocation', '') or '',
-                "object_colors": tags.get('objectColors', []) or [],
-                "object_positions": tags.get('objectPositions', []) or [],
-                "items_inside_shapes": tags.get('itemsInsideShapes', []) or [],
-                "overlapping_items": tags.get('overlappingItems', []) or [],
-                "relative_positions": tags.get('relativePositions', []) or [],
-                "color_word_mismatches": tags.get('colorWordMismatches', []) or [],
-                "highlighted_elements": tags.get('highlightedElements', []) or [],
-                "background_color": tags.get('backgroundColor', 'white') or 'white',
-                "has_colored_background": tags.get('hasColoredBackground', 'false') or 'false',
-                "total_items": tags.get('totalItems', '0') or '0',
-                "letter_count": tags.get('letterCount', '0') or '0',
-                "number_count": tags.get('numberCount', '0') or '0',
-                "object_count": tags.get('objectCount', '0') or '0',
-                "shape_count": tags.get('shapeCount', '0') or '0',
-                "category": tags.get('category', 'mixed') or 'mixed',
-                "question_types": tags.get('questionTypes', []) or []
-            }
-            print(f"✅ Context built with {len(context)} fields")
-            return context
-        except Exception as e:
-            print(f"❌ Error building context: {e}")
-            # Return a safe fallback context
-            return {
-                "description": description,
-                "colors": [], "shapes": [], "letters": [], "numbers": [], "words": [],
-                "objects": [], "people": [], "animals": [], "shape_colors": [],
-                "shape_contents": [], "nested_elements": [], "text_color": "",
-                "text_vs_semantic_mismatch": "", "text_location": "", "object_colors": [],
-                "object_positions": [], "items_inside_shapes": [], "overlapping_items": [],
-                "relative_positions": [], "color_word_mismatches": [], "highlighted_elements": [],
-                "background_color": "white", "has_colored_background": "false",
-                "total_items": "0", "letter_count": "0", "number_count": "0",
-                "object_count": "0", "shape_count": "0", "category": "mixed", "question_types": []
-            }
+        context = build_question_context(tags, description)
+        print(f"✅ Context built with {len(context)} fields")
+        return context
     
     def _get_empty_multi_context(self) -> Dict[str, Any]:
         """Return empty multi-image context when processing fails"""
@@ -368,26 +309,19 @@ class QuestionGenerator:
                         print(f"⚠️ Image {i} is not a dict: {type(image_data)}")
                         continue
                         
-                    tags = image_data.get('tags', {}) or {}
-                    description = image_data.get('description', '') or ''
+                    image_context = load_question_context(image_data)
+                    description = image_context['description']
                     descriptions.append(description)
                     
                     print(f"📝 Processing image {i+1}: {description[:50]}...")
                     
-                    # Extract elements for this image with safe access
-                    colors = tags.get('colors', []) or []
-                    shapes = tags.get('shapes', []) or []
-                    letters = tags.get('letters', []) or []
-                    numbers = tags.get('numbers', []) or []
-                    objects = tags.get('objects', []) or []
-                    category = tags.get('category', 'mixed') or 'mixed'
-                    
-                    # Ensure they're lists
-                    if not isinstance(colors, list): colors = []
-                    if not isinstance(shapes, list): shapes = []
-                    if not isinstance(letters, list): letters = []
-                    if not isinstance(numbers, list): numbers = []
-                    if not isinstance(objects, list): objects = []
+                    # Normalized context guarantees list fields are lists
+                    colors = image_context['colors']
+                    shapes = image_context['shapes']
+                    letters = image_context['letters']
+                    numbers = image_context['numbers']
+                    objects = image_context['objects']
+                    category = image_context['category']
                     
                     # Add to aggregated sets
                     all_colors.update(colors)
@@ -0,0 +1,153 @@
+# In-process job queue for asynchronous uploads
+#
+# /upload?async_upload=true spools the request body to disk, submits a job here
+# and returns 202 straight away. A bounded pool of worker tasks runs the
+# resize + store handler for each job and records its progress, which clients
+# read from /api/uploads/{job_id} (or long-poll via /api/uploads/{job_id}/wait).
+#
+# Job state lives in memory, so it is per-process and lost on restart.
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Status progression: queued -> processing -> stored -> analyzed, or failed at
+# any step. analysis_pending is final when analysis did not finish in time.
+JOB_FINAL_STATUSES = {"analyzed", "failed", "analysis_pending"}
+
+
+class UploadJobManager:
+    def __init__(
+        self,
+        handler: Callable[["UploadJobManager", Dict[str, Any]], Awaitable[None]],
+        workers: int = 4,
+        job_ttl: float = 3600.0
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.job_ttl = job_ttl
+
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._changed: Optional[asyncio.Condition] = None
+        self._background = set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._background)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def spawn(self, coro):
+        """Run follow-up work (e.g. waiting for analysis) without holding a worker"""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def submit(self, spool_path: str, original_filename: str, content_type: str, **fields) -> Dict[str, Any]:
+        """Register a spooled upload and queue it for processing"""
+        if not self._tasks:
+            self.start()
+        self._evict_expired()
+
+        now = datetime.utcnow().isoformat() + "Z"
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "original_filename": original_filename,
+            "content_type": content_type,
+            "spool_path": spool_path,
+            "filename": None,
+            "image_id": None,
+            "vision": None,
+            "duplicate_of": None,
+            "error": None,
+            "version": 1,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            **fields
+        }
+        self.jobs[job["job_id"]] = job
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    async def update(self, job_id: str, **fields):
+        """Update a job and wake any long-polling readers"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        job.update(fields)
+        job["version"] += 1
+        job["updated_at"] = datetime.utcnow().isoformat() + "Z"
+        if job["status"] in JOB_FINAL_STATUSES and job["finished_at"] is None:
+            job["finished_at"] = time.monotonic()
+        async with self._changed:
+            self._changed.notify_all()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        return {k: v for k, v in job.items() if k not in ("spool_path", "finished_at", "upload_session")}
+
+    async def wait(self, job_id: str, since_version: int = 0, timeout: float = 25.0) -> Optional[Dict[str, Any]]:
+        """Long-poll: return once the job is newer than since_version, final, or timeout passes"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        if self._changed is None:
+            return self.get(job_id)
+
+        def ready():
+            current = self.jobs.get(job_id)
+            return current is None or current["version"] > since_version or current["finished_at"] is not None
+
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(ready), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job:
+                    await self.update(job_id, status="processing")
+                    await self.handler(self, job)
+            except Exception as e:
+                print(f"❌ Upload job {job_id} failed: {e}")
+                await self.update(job_id, status="failed", error=str(e))
+            finally:
+                if job and job.get("spool_path"):
+                    try:
+                        os.remove(job["spool_path"])
+                    except OSError:
+                        pass
+                self._queue.task_done()
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.job_ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["finished_at"] is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
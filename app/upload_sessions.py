@@ -0,0 +1,204 @@
+# Resumable chunked uploads
+#
+# For large originals over unreliable connections, instead of one multipart
+# POST that restarts from zero when it breaks:
+#
+#   POST   /upload/sessions                  create a session for `size` bytes
+#   PUT    /upload/sessions/{id}?offset=N    append bytes at offset N
+#   GET    /upload/sessions/{id}             current offset, to resume after a disconnect
+#   POST   /upload/sessions/{id}/finalize    run the upload pipeline once
+#   DELETE /upload/sessions/{id}             abandon
+#
+# Chunks are appended to a spool file; its length is the session's offset, so
+# bytes that arrived before a connection dropped are kept and the client
+# resumes from there. Session metadata sits next to the spool file as JSON, so
+# sessions survive a restart. Sessions untouched for the TTL are deleted.
+#
+# Like the upload job queue this is per-process: run a single worker, or route
+# all requests for a session to the same one.
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+
+SPOOL_SUFFIX = ".part"
+META_SUFFIX = ".json"
+
+
+class SessionError(Exception):
+    """A session request that can't be honoured; status_code is the HTTP status"""
+
+    def __init__(self, message: str, status_code: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class UploadSessionManager:
+    def __init__(self, spool_dir: str, max_bytes: int, ttl: float = 86400.0):
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Counters since start: whether uploads finish, and how many bytes
+        # (retransmissions included) it took
+        self.metrics = {
+            "created": 0,
+            "completed": 0,
+            "failed": 0,
+            "abandoned": 0,
+            "bytes_received": 0,
+            "completed_bytes_received": 0,
+            "completed_bytes": 0,
+        }
+
+    def _spool_path(self, upload_id: str) -> str:
+        return os.path.join(self.spool_dir, upload_id + SPOOL_SUFFIX)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.spool_dir, upload_id + META_SUFFIX)
+
+    def _save(self, session: Dict[str, Any]):
+        tmp_path = self._meta_path(session["upload_id"]) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(session, f)
+        os.replace(tmp_path, self._meta_path(session["upload_id"]))
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        # Ids are hex uuids; anything else can't name a session (or a path)
+        try:
+            uuid.UUID(hex=upload_id)
+            with open(self._meta_path(upload_id)) as f:
+                session = json.load(f)
+        except (ValueError, OSError):
+            raise SessionError("Upload session not found", 404)
+        try:
+            session["offset"] = os.path.getsize(self._spool_path(upload_id))
+        except OSError:
+            raise SessionError("Upload session not found", 404)
+        return session
+
+    def _remove(self, upload_id: str):
+        for path in (self._spool_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._locks.pop(upload_id, None)
+
+    def public(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in session.items() if k not in ("settings", "bytes_received")}
+
+    def expire(self) -> int:
+        """Delete sessions untouched for longer than the TTL"""
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        cutoff = time.time() - self.ttl
+        expired = 0
+        for entry in os.scandir(self.spool_dir):
+            if not entry.name.endswith(META_SUFFIX):
+                continue
+            upload_id = entry.name[:-len(META_SUFFIX)]
+            spool = self._spool_path(upload_id)
+            touched = max(entry.stat().st_mtime, os.path.getmtime(spool) if os.path.exists(spool) else 0)
+            lock = self._locks.get(upload_id)
+            if touched < cutoff and not (lock and lock.locked()):
+                self._remove(upload_id)
+                expired += 1
+        self.metrics["abandoned"] += expired
+        return expired
+
+    def create(self, filename: str, content_type: str, size: int, settings: Dict[str, Any]) -> Dict[str, Any]:
+        if size <= 0:
+            raise SessionError("size must be positive")
+        if size > self.max_bytes:
+            raise SessionError(f"File too large (max {self.max_bytes / (1024 * 1024):g} MB)", 413)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.expire()
+
+        session = {
+            "upload_id": uuid.uuid4().hex,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "offset": 0,
+            "bytes_received": 0,
+            "settings": settings,
+            "created_at": time.time(),
+        }
+        open(self._spool_path(session["upload_id"]), "wb").close()
+        self._save(session)
+        self.metrics["created"] += 1
+        return session
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        return self._load(upload_id)
+
+    async def write(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Append a chunk that starts at offset. A mismatched offset is refused
+        with 409 and the current offset, so the client can resume from it.
+        Bytes received before the chunk's stream broke are kept."""
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        if lock.locked():
+            # A previous attempt at this chunk may still be draining after a disconnect
+            raise SessionError("Another chunk is being written to this session", 409, self._load(upload_id)["offset"])
+        async with lock:
+            session = self._load(upload_id)
+            if offset != session["offset"]:
+                raise SessionError(f"Expected offset {session['offset']}", 409, session["offset"])
+
+            received = 0
+            try:
+                with open(self._spool_path(upload_id), "ab") as spool:
+                    async for chunk in chunks:
+                        if session["offset"] + len(chunk) > session["size"]:
+                            raise SessionError(f"Chunk runs past the declared size of {session['size']} bytes",
+                                               413, session["offset"])
+                        spool.write(chunk)
+                        session["offset"] += len(chunk)
+                        received += len(chunk)
+            finally:
+                session["bytes_received"] += received
+                self.metrics["bytes_received"] += received
+                self._save(session)
+            return session
+
+    async def finalize(self, upload_id: str) -> Dict[str, Any]:
+        """Claim a complete session for processing. Returns the session with
+        spool_path; the caller owns (and removes) the spool file from here on"""
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            session = self._load(upload_id)
+            if session["offset"] != session["size"]:
+                raise SessionError(f"Upload incomplete: {session['offset']} of {session['size']} bytes",
+                                   409, session["offset"])
+            spool_path = os.path.join(self.spool_dir, f"{upload_id}.upload")
+            os.replace(self._spool_path(upload_id), spool_path)
+            self._remove(upload_id)
+        return {**session, "spool_path": spool_path}
+
+    def record_result(self, session: Dict[str, Any], success: bool):
+        if success:
+            self.metrics["completed"] += 1
+            self.metrics["completed_bytes"] += session["size"]
+            self.metrics["completed_bytes_received"] += session["bytes_received"]
+        else:
+            self.metrics["failed"] += 1
+
+    def abort(self, upload_id: str):
+        self._load(upload_id)
+        self._remove(upload_id)
+        self.metrics["abandoned"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        m = self.metrics
+        finished = m["completed"] + m["failed"] + m["abandoned"]
+        return {
+            **m,
+            "success_rate": round(m["completed"] / finished, 4) if finished else None,
+            "bytes_per_completed_upload": round(m["completed_bytes_received"] / m["completed"]) if m["completed"] else None,
+            # 1.0 means no byte was sent twice
+            "transfer_overhead": round(m["completed_bytes_received"] / m["completed_bytes"], 4) if m["completed_bytes"] else None,
+        }
@@ -0,0 +1,118 @@
+# Token-budget resize planning for the OpenAI Vision API
+#
+# Vision input is billed per 512x512 tile (see analyze_tokens.py):
+#   low detail:  a flat 85 tokens; the model sees at most 512x512
+#   high detail: the image is fit within 2048x2048, its shortest side scaled
+#                down to 768, then 170 tokens per 512 tile + 85
+#
+# plan_vision_resize() picks the largest output size whose tile count fits a
+# token budget and that fills its last tile row/column exactly, so no tokens
+# are spent on a sliver of a tile. The chosen detail mode is stored with the
+# upload (upload_vision_plans) and sent with the Vision request.
+import math
+from typing import Any, Dict, Optional, Tuple
+
+TILE_SIZE = 512
+BASE_TOKENS = 85
+TOKENS_PER_TILE = 170
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+
+VISION_DETAILS = ("auto", "low", "high")
+
+# Named budgets for upload settings. "economy" keeps the historical fixed
+# 512x512 resize; "auto" detail falls back to low whenever the image would fit
+# in a single tile anyway, since low detail then sees the same pixels.
+VISION_PRESETS = {
+    "economy": {"token_budget": BASE_TOKENS, "detail": "low"},
+    "standard": {"token_budget": BASE_TOKENS + 2 * TOKENS_PER_TILE, "detail": "auto"},
+    "detailed": {"token_budget": BASE_TOKENS + 4 * TOKENS_PER_TILE, "detail": "high"},
+}
+
+
+def high_detail_scaled_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the Vision API tiles an image at in high detail mode"""
+    scale = min(1.0, HIGH_DETAIL_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    return int(width * scale), int(height * scale)
+
+
+def vision_image_tokens(width: int, height: int, detail: str = "high") -> Tuple[int, int]:
+    """Predicted (image_tokens, tiles) for an image sent at the given detail"""
+    if detail == "low":
+        return BASE_TOKENS, 0
+    width, height = high_detail_scaled_size(width, height)
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return TOKENS_PER_TILE * tiles + BASE_TOKENS, tiles
+
+
+def plan_vision_resize(size: Tuple[int, int], token_budget: int, detail: str = "auto") -> Dict[str, Any]:
+    """
+    Choose output dimensions and detail mode for an image of `size` (display
+    orientation) so its predicted image tokens stay within token_budget.
+    Never upscales.
+    """
+    width, height = size
+    max_tiles = (token_budget - BASE_TOKENS) // TOKENS_PER_TILE
+
+    scale = min(1.0, TILE_SIZE / max(width, height))
+    single_tile = (max(int(width * scale), 1), max(int(height * scale), 1))
+    if detail == "low" or (detail == "auto" and max_tiles <= 1):
+        return _plan(single_tile, "low", token_budget)
+
+    # Try every tile grid within budget; fill the grid along the constraining
+    # side so the last tile row/column is used fully, and keep the largest result
+    best = single_tile
+    grid_limit = HIGH_DETAIL_MAX_SIDE // TILE_SIZE
+    for tiles_x in range(1, grid_limit + 1):
+        for tiles_y in range(1, max(max_tiles, 1) // tiles_x + 1):
+            scale = min(1.0, tiles_x * TILE_SIZE / width, tiles_y * TILE_SIZE / height)
+            target = high_detail_scaled_size(max(int(width * scale), 1), max(int(height * scale), 1))
+            if vision_image_tokens(*target)[1] > max(max_tiles, 1):
+                continue
+            if target[0] * target[1] > best[0] * best[1]:
+                best = target
+
+    if detail == "auto" and vision_image_tokens(*best)[1] <= 1:
+        return _plan(best, "low", token_budget)
+    return _plan(best, "high", token_budget)
+
+
+def vision_resize_bounds(token_budget: int, detail: str = "auto") -> Tuple[int, Optional[int]]:
+    """(max long side, max short side or None) that contains every output
+    plan_vision_resize() can choose for these settings, whatever the input"""
+    max_tiles = (token_budget - BASE_TOKENS) // TOKENS_PER_TILE
+    if detail == "low" or (detail == "auto" and max_tiles <= 1):
+        return TILE_SIZE, None
+    return min(HIGH_DETAIL_MAX_SIDE, max(max_tiles, 1) * TILE_SIZE), HIGH_DETAIL_SHORT_SIDE
+
+
+def _plan(target: Tuple[int, int], detail: str, token_budget: int) -> Dict[str, Any]:
+    tokens, tiles = vision_image_tokens(*target, detail=detail)
+    return {
+        "width": target[0],
+        "height": target[1],
+        "detail": detail,
+        "tiles": tiles,
+        "predicted_image_tokens": tokens,
+        "token_budget": token_budget,
+    }
+
+
+def resolve_vision_settings(preset: Optional[str], token_budget: Optional[int], detail: Optional[str],
+                            default_preset: str = "economy") -> Tuple[int, str]:
+    """Merge a named preset with explicit overrides; raises ValueError on bad input"""
+    preset = preset or default_preset
+    if preset not in VISION_PRESETS:
+        raise ValueError(f"Unknown vision preset '{preset}' (choose from {', '.join(VISION_PRESETS)})")
+    if detail is not None and detail not in VISION_DETAILS:
+        raise ValueError(f"Unknown detail '{detail}' (choose from {', '.join(VISION_DETAILS)})")
+    if token_budget is not None and token_budget < BASE_TOKENS:
+        raise ValueError(f"token_budget must be at least {BASE_TOKENS}")
+
+    settings = VISION_PRESETS[preset]
+    return (
+        token_budget if token_budget is not None else settings["token_budget"],
+        detail or settings["detail"],
+    )
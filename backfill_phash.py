@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Backfill images.phash for rows stored before uploads were hashed, so the
+duplicate index (app/image_dedup.py) covers the whole library.
+
+Reads unhashed rows in id order with keyset pagination, downloads each stored
+image, hashes it on a thread pool and writes each batch back with a single
+PostgREST upsert. Rows whose object can't be read are reported and skipped.
+
+Usage:
+    python backfill_phash.py [--batch-size 200] [--concurrency 8] [--dry-run]
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+
+import httpx
+from dotenv import load_dotenv
+from PIL import Image
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from image_dedup import dhash, to_signed
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+SUPABASE_BUCKET_NAME = os.getenv("SUPABASE_BUCKET_NAME", "images")
+
+
+def hash_image(data: bytes) -> int:
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('RGB', (64, 64))  # JPEGs decode at 1/8 scale; plenty for a 9x8 hash
+        return dhash(image)
+
+
+async def backfill(batch_size: int, concurrency: int, dry_run: bool):
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        print("❌ Supabase config missing")
+        return
+
+    images_url = f"{SUPABASE_URL}/rest/v1/images"
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Content-Type": "application/json",
+    }
+    downloads = asyncio.Semaphore(concurrency)
+
+    async def hash_row(client: httpx.AsyncClient, row):
+        async with downloads:
+            resp = await client.get(
+                f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{row['image_name']}",
+                headers=headers
+            )
+        if resp.status_code != 200:
+            print(f"⚠️ Skipped {row['id']}: download failed ({resp.status_code})")
+            return None
+        try:
+            phash = await asyncio.to_thread(hash_image, resp.content)
+        except Exception as e:
+            print(f"⚠️ Skipped {row['id']}: {e}")
+            return None
+        return {"id": row["id"], "phash": to_signed(phash)}
+
+    last_id = None
+    total = hashed = 0
+    async with httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=concurrency)) as client:
+        while True:
+            params = {
+                "select": "id,image_name",
+                "phash": "is.null",
+                "order": "id.asc",
+                "limit": str(batch_size),
+            }
+            if last_id:
+                params["id"] = f"gt.{last_id}"
+
+            resp = await client.get(images_url, headers=headers, params=params)
+            if resp.status_code != 200:
+                print(f"❌ Read failed: {resp.status_code} - {resp.text}")
+                return
+
+            rows = resp.json()
+            if not rows:
+                break
+
+            updates = [u for u in await asyncio.gather(*(hash_row(client, row) for row in rows)) if u]
+
+            if updates and not dry_run:
+                # Upsert on the primary key only touches the columns in the payload
+                write = await client.post(
+                    images_url,
+                    headers={**headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+                    json=updates,
+                )
+                if write.status_code not in (200, 201, 204):
+                    print(f"❌ Write failed: {write.status_code} - {write.text}")
+                    return
+
+            total += len(rows)
+            hashed += len(updates)
+            last_id = rows[-1]["id"]
+            print(f"✅ {'Hashed' if dry_run else 'Updated'} {hashed}/{total} rows (last id {last_id})")
+
+    print(f"🎉 Backfill complete: {hashed} of {total} unhashed rows hashed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill images.phash")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.concurrency, args.dry_run))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Backfill images.question_context for rows analyzed before the column existed,
+or written by an older QUESTION_CONTEXT_VERSION.
+
+Reads analyzed rows in id order with keyset pagination and writes each batch
+back with a single PostgREST upsert.
+
+Usage:
+    python backfill_question_context.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import httpx
+from dotenv import load_dotenv
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from question_context import (
+    QUESTION_CONTEXT_VERSION,
+    build_question_context,
+    compact_question_context,
+)
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+
+async def backfill(batch_size: int, dry_run: bool):
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        print("❌ Supabase config missing")
+        return
+
+    images_url = f"{SUPABASE_URL}/rest/v1/images"
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Content-Type": "application/json",
+    }
+
+    last_id = None
+    total = 0
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        while True:
+            params = {
+                "select": "id,description,tags",
+                "tags": "not.is.null",
+                "or": f"(question_context_version.is.null,question_context_version.lt.{QUESTION_CONTEXT_VERSION})",
+                "order": "id.asc",
+                "limit": str(batch_size),
+            }
+            if last_id:
+                params["id"] = f"gt.{last_id}"
+
+            resp = await client.get(images_url, headers=headers, params=params)
+            if resp.status_code != 200:
+                print(f"❌ Read failed: {resp.status_code} - {resp.text}")
+                return
+
+            rows = resp.json()
+            if not rows:
+                break
+
+            updates = [
+                {
+                    "id": row["id"],
+                    "question_context": compact_question_context(
+                        build_question_context(row.get("tags"), row.get("description"))
+                    ),
+                    "question_context_version": QUESTION_CONTEXT_VERSION,
+                }
+                for row in rows
+            ]
+
+            if not dry_run:
+                # Upsert on the primary key only touches the columns in the payload
+                write = await client.post(
+                    images_url,
+                    headers={**headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+                    json=updates,
+                )
+                if write.status_code not in (200, 201, 204):
+                    print(f"❌ Write failed: {write.status_code} - {write.text}")
+                    return
+
+            total += len(rows)
+            last_id = rows[-1]["id"]
+            print(f"✅ {'Checked' if dry_run else 'Updated'} {total} rows (last id {last_id})")
+
+    print(f"🎉 Backfill complete: {total} rows at version {QUESTION_CONTEXT_VERSION}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill images.question_context")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.dry_run))
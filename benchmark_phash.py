@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark near-duplicate lookup in the BK-tree of app/image_dedup.py against a
+linear scan, at 100k hashes by default.
+
+Random 64-bit hashes are spread evenly, which is the worst case for a BK-tree
+(real libraries cluster), so these latencies are an upper bound. Each query is
+a stored hash with a few bits flipped, so every lookup has a match.
+
+Also prints the hash distance between a synthetic flashcard and re-encoded,
+resized and different copies of it, to sanity-check DEDUP_MAX_DISTANCE.
+
+Usage:
+    python benchmark_phash.py [--hashes 100000] [--queries 200]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from benchmark_resize import synthetic_flashcard
+from image_dedup import BKTree, dhash, hamming
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def time_queries(search, queries):
+    """Per-query latencies in microseconds"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def report(label, latencies):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<24}{statistics.mean(latencies):>12,.0f}{p99:>12,.0f}")
+
+
+def robustness():
+    card = synthetic_flashcard()
+    original = dhash(card)
+
+    def reencoded(image, fmt, **options):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, **options)
+        return Image.open(buffer)
+
+    other = synthetic_flashcard()
+    ImageDraw.Draw(other).rectangle((260, 60, 460, 220), fill='white', outline='black', width=4)
+    variants = {
+        "JPEG q40": reencoded(card, 'JPEG', quality=40),
+        "WebP q30": reencoded(card, 'WEBP', quality=30),
+        "resized 50%": card.resize((card.width // 2, card.height // 2), Image.Resampling.LANCZOS),
+        "brightened": card.point(lambda v: min(255, v + 20)),
+        "edited card": other,
+        "different card": synthetic_flashcard().transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+    }
+    print(f"{'variant':<24}{'bits':>6}")
+    for label, image in variants.items():
+        print(f"{label:<24}{hamming(original, dhash(image)):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BK-tree duplicate lookup")
+    parser.add_argument("--hashes", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    hashes = [rng.getrandbits(64) for _ in range(args.hashes)]
+
+    start = time.perf_counter()
+    tree = BKTree()
+    for index, value in enumerate(hashes):
+        tree.add(value, index)
+    print(f"🌳 Built BK-tree of {len(tree):,} hashes in {time.perf_counter() - start:.2f}s")
+
+    print(f"{'lookup':<24}{'mean µs':>12}{'p99 µs':>12}")
+    for distance in (2, 4, 8):
+        queries = [flip_bits(rng.choice(hashes), distance, rng) for _ in range(args.queries)]
+        report(f"BK-tree, within {distance}", time_queries(lambda q: tree.search(q, distance), queries))
+    queries = [flip_bits(rng.choice(hashes), 4, rng) for _ in range(args.queries)]
+    report("linear scan, within 4",
+           time_queries(lambda q: [v for v in hashes if hamming(q, v) <= 4], queries))
+
+    print()
+    robustness()
+
+
+if __name__ == "__main__":
+    main()
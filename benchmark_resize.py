@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark the upload resize path: full decode + single LANCZOS pass versus the
+JPEG draft()/reduce() fast path in app/image_processing.py.
+
+Reports images per second for each path and the SSIM of the fast output
+against the full-decode output (1.0 = identical). Uses synthetic 12-48 MP
+JPEGs unless photo paths are given.
+
+Then compares the byte-budget encoder (app/image_encoding.py) with plain JPEG
+quality 75 on each resized image plus a synthetic flashcard.
+
+Usage:
+    python benchmark_resize.py [photo.jpg ...] [--runs 3]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+import image_processing
+from image_encoding import encode_for_vision, ssim
+from image_processing import resize_image_for_vision_api
+
+SYNTHETIC_SIZES = {
+    "12 MP": (4000, 3000),
+    "24 MP": (6000, 4000),
+    "48 MP": (8000, 6000),
+}
+
+
+def synthetic_photo(size):
+    """A JPEG with photo-like content: smooth structure plus fine grain"""
+    width, height = size
+    base = Image.effect_mandelbrot((width // 8, height // 8), (-2.2, -1.2, 1.0, 1.2), 64)
+    base = base.resize(size, Image.Resampling.BICUBIC)
+    grain = Image.effect_noise(size, 24).filter(ImageFilter.GaussianBlur(1))
+    red = Image.blend(base, grain, 0.35)
+    green = Image.linear_gradient('L').resize(size)
+    blue = Image.blend(base.transpose(Image.Transpose.FLIP_LEFT_RIGHT), grain, 0.5)
+    buffer = io.BytesIO()
+    Image.merge('RGB', (red, green, blue)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def synthetic_flashcard(size=(512, 384)):
+    """Flat colours, shapes and text, like a pre-cropped flashcard quadrant"""
+    card = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(card)
+    draw.ellipse((40, 60, 200, 220), fill='red', outline='black', width=4)
+    draw.rectangle((260, 60, 460, 220), fill='royalblue', outline='black', width=4)
+    draw.polygon([(150, 360), (250, 250), (350, 360)], fill='gold', outline='black')
+    draw.text((60, 20), "RED CIRCLE  BLUE SQUARE", fill='black', font_size=28)
+    return card
+
+
+def compare_encoders(label, image):
+    jpeg = io.BytesIO()
+    image.save(jpeg, format='JPEG', quality=75, optimize=True)
+    start = time.perf_counter()
+    buffer, info = encode_for_vision(image)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12}{jpeg.tell():>10,}  {info['format']:<6}{info['quality'] or '-':>4}"
+          f"{info['bytes']:>10,}{info['bytes'] / jpeg.tell():>8.0%}{info['ssim']:>8.3f}{elapsed * 1000:>8.0f}")
+
+
+def time_resize(data, fast, runs):
+    best = None
+    output = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        # The output encoder is benchmarked separately; compare resize paths on equal JPEG output
+        output = resize_image_for_vision_api(io.BytesIO(data), fast=fast, encoder=False)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, Image.open(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upload image resizing")
+    parser.add_argument("photos", nargs="*", help="JPEG files to use instead of synthetic images")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per path; the best time is reported")
+    args = parser.parse_args()
+
+    if args.photos:
+        samples = {os.path.basename(path): open(path, "rb").read() for path in args.photos}
+    else:
+        print("🧪 Generating synthetic photos...")
+        samples = {label: synthetic_photo(size) for label, size in SYNTHETIC_SIZES.items()}
+
+    print(f"📐 Reducing gap: {image_processing.RESIZE_REDUCING_GAP}")
+    print(f"{'image':<12}{'full decode':>14}{'fast path':>14}{'speedup':>10}{'SSIM':>8}")
+    resized = {}
+    for label, data in samples.items():
+        # Silence the per-image resize logging while timing
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            slow_time, slow_image = time_resize(data, False, args.runs)
+            fast_time, fast_image = time_resize(data, True, args.runs)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        score = ssim(slow_image.convert('L'), fast_image.convert('L'))
+        print(f"{label:<12}{1 / slow_time:>10.1f} i/s{1 / fast_time:>10.1f} i/s"
+              f"{slow_time / fast_time:>9.1f}x{score:>8.3f}")
+        resized[label] = fast_image.convert('RGB')
+
+    resized["flashcard"] = synthetic_flashcard()
+    print()
+    print(f"🗜️ Encoder: target {image_processing.ENCODER_TARGET_BYTES:,} bytes, min SSIM {image_processing.ENCODER_MIN_SSIM}")
+    print(f"{'image':<12}{'JPEG q75':>10}  {'chosen':<6}{'q':>4}{'bytes':>10}{'ratio':>8}{'SSIM':>8}{'ms':>8}")
+    for label, image in resized.items():
+        compare_encoders(label, image)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+// Client-side search over loaded images, shared by the gallery and the
+// detailed view.
+//
+// Each image's description, names and tag values are split into lowercase
+// tokens once, when the image is added, into an inverted index (token -> ids
+// of the images containing it). A query is split the same way; each query
+// word matches every indexed token it is a substring of, and an image matches
+// when it matches all words, so a keypress costs a scan of the vocabulary and
+// a few set intersections rather than a re-serialization of every image.
+const SEARCH_DEBOUNCE_MS = 150;
+const TOKEN_SPLIT = /[^\p{L}\p{N}]+/u;
+
+function tokenize(text) {
+    return text.toLowerCase().split(TOKEN_SPLIT).filter(Boolean);
+}
+
+// Every string or number inside a tags value (keys are left out: they are the
+// same for every image and would match everything)
+function collectTagText(value, out) {
+    if (value == null) return out;
+    if (typeof value === 'string' || typeof value === 'number') {
+        out.push(String(value));
+    } else if (Array.isArray(value)) {
+        value.forEach(item => collectTagText(item, out));
+    } else if (typeof value === 'object') {
+        Object.values(value).forEach(item => collectTagText(item, out));
+    }
+    return out;
+}
+
+class ImageSearchIndex {
+    constructor(fields = ['description', 'image_name', 'source_name']) {
+        this.fields = fields;
+        this.postings = new Map();   // token -> Set of image ids
+        this.haystacks = new Map();  // image id -> lowercase searchable text
+        this.wordCache = new Map();  // query word -> {tokens, ids}, until the next add
+    }
+
+    add(images) {
+        images.forEach(image => {
+            if (this.haystacks.has(image.id)) return;
+            const parts = this.fields.map(field => image[field]).filter(value => value != null).map(String);
+            collectTagText(image.tags, parts);
+            const haystack = parts.join(' ').toLowerCase();
+            this.haystacks.set(image.id, haystack);
+            tokenize(haystack).forEach(token => {
+                let ids = this.postings.get(token);
+                if (!ids) this.postings.set(token, ids = new Set());
+                ids.add(image.id);
+            });
+        });
+        this.wordCache.clear();
+    }
+
+    // Drop an image, e.g. before re-adding it with a new analysis
+    remove(id) {
+        const haystack = this.haystacks.get(id);
+        if (haystack === undefined) return;
+        this.haystacks.delete(id);
+        tokenize(haystack).forEach(token => {
+            const ids = this.postings.get(token);
+            if (!ids) return;
+            ids.delete(id);
+            if (!ids.size) this.postings.delete(token);
+        });
+        this.wordCache.clear();
+    }
+
+    update(images) {
+        images.forEach(image => this.remove(image.id));
+        this.add(images);
+    }
+
+    // Ids of the images containing word anywhere inside one of their tokens.
+    // While a word is being typed each keystroke extends the previous one, so
+    // only the tokens that matched a cached substring of it are scanned again.
+    matchWord(word) {
+        let entry = this.wordCache.get(word);
+        if (!entry) {
+            let candidates = null;
+            for (const [cached, cachedEntry] of this.wordCache) {
+                if (word.includes(cached) && (!candidates || cachedEntry.tokens.length < candidates.length)) {
+                    candidates = cachedEntry.tokens;
+                }
+            }
+            const tokens = (candidates || [...this.postings.keys()]).filter(token => token.includes(word));
+            const ids = new Set();
+            tokens.forEach(token => this.postings.get(token).forEach(id => ids.add(id)));
+            this.wordCache.set(word, entry = { tokens, ids });
+        }
+        return entry.ids;
+    }
+
+    // Set of matching image ids, or null when the query is blank (no filtering)
+    search(query) {
+        const needle = query.trim().toLowerCase();
+        if (!needle) return null;
+        const words = [...new Set(tokenize(needle))];
+        if (!words.length) {
+            // Only punctuation: nothing to look up, fall back to a plain substring match
+            return new Set([...this.haystacks].filter(([, haystack]) => haystack.includes(needle)).map(([id]) => id));
+        }
+        // Intersect the posting lists, smallest first
+        const lists = words.map(word => this.matchWord(word)).sort((a, b) => a.size - b.size);
+        const [smallest, ...rest] = lists;
+        return new Set([...smallest].filter(id => rest.every(ids => ids.has(id))));
+    }
+}
+
+function debounce(fn, wait = SEARCH_DEBOUNCE_MS) {
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), wait);
+    };
+}
@@ -1,16 +1,222 @@
+// Used when /api/upload-config can't be read
+const DEFAULT_UPLOAD_CONFIG = {
+    max_side: 512,
+    max_short_side: null,
+    quality: 0.92,
+    resized_suffix: '.client-resized',
+    concurrency: 4,
+    resumable_threshold: 8 * 1024 * 1024,
+    resumable_chunk_size: 2 * 1024 * 1024
+};
+const RESUMABLE_MAX_RETRIES = 8;
+
+let uploadConfigPromise = null;
+function getUploadConfig() {
+    if (!uploadConfigPromise) {
+        uploadConfigPromise = fetch('/api/upload-config')
+            .then(res => res.ok ? res.json() : DEFAULT_UPLOAD_CONFIG)
+            .catch(() => DEFAULT_UPLOAD_CONFIG);
+    }
+    return uploadConfigPromise;
+}
+
+function formatBytes(bytes) {
+    if (bytes >= 1024 * 1024) return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+    return `${Math.max(1, Math.round(bytes / 1024))} KB`;
+}
+
+// Downscale an image to the largest size the server keeps of it, so the
+// original never has to be sent. Returns the file unchanged when the browser
+// can't decode it, it is already small enough, or the result isn't smaller.
+// The name carries config.resized_suffix so the server re-encodes the JPEG
+// with its own encoder instead of storing it as sent.
+async function preResize(file, config) {
+    if (!window.createImageBitmap) return file;
+    let bitmap;
+    try {
+        bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    } catch (err) {
+        return file;  // e.g. HEIC; the server handles it
+    }
+    const { width, height } = bitmap;
+    const scale = Math.min(
+        1,
+        config.max_side / Math.max(width, height),
+        config.max_short_side ? config.max_short_side / Math.min(width, height) : 1
+    );
+    if (scale >= 1) {
+        bitmap.close();
+        return file;
+    }
+    const targetWidth = Math.max(1, Math.floor(width * scale));
+    const targetHeight = Math.max(1, Math.floor(height * scale));
+
+    let resized = bitmap;
+    try {
+        // High-quality resampling where supported; drawImage below otherwise
+        resized = await createImageBitmap(bitmap, {
+            resizeWidth: targetWidth,
+            resizeHeight: targetHeight,
+            resizeQuality: 'high'
+        });
+    } catch (err) {
+        // Keep the full-size bitmap
+    }
+
+    const canvas = document.createElement('canvas');
+    canvas.width = targetWidth;
+    canvas.height = targetHeight;
+    const ctx = canvas.getContext('2d');
+    ctx.imageSmoothingQuality = 'high';
+    ctx.fillStyle = '#fff';  // JPEG has no alpha
+    ctx.fillRect(0, 0, targetWidth, targetHeight);
+    ctx.drawImage(resized, 0, 0, targetWidth, targetHeight);
+    bitmap.close();
+    if (resized !== bitmap) resized.close();
+
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', config.quality));
+    if (!blob || blob.size >= file.size) return file;
+    const stem = file.name.replace(/\.[^.]*$/, '');
+    return new File([blob], stem + config.resized_suffix + '.jpg', {
+        type: 'image/jpeg',
+        lastModified: file.lastModified
+    });
+}
+
+// POST one file to /upload with upload progress (fetch can't report it)
+function sendFile(file, onProgress) {
+    return new Promise((resolve, reject) => {
+        const formData = new FormData();
+        formData.append('file', file, file.name);
+        const xhr = new XMLHttpRequest();
+        xhr.open('POST', '/upload');
+        xhr.upload.onprogress = e => {
+            if (e.lengthComputable) onProgress(e.loaded / e.total);
+        };
+        xhr.onload = () => {
+            try {
+                resolve(JSON.parse(xhr.responseText));
+            } catch (err) {
+                reject(new Error(`HTTP ${xhr.status}`));
+            }
+        };
+        xhr.onerror = () => reject(new Error('Network error'));
+        xhr.send(formData);
+    });
+}
+
+// Send a file in chunks through a resumable session, so a dropped connection
+// resumes where it stopped instead of starting over
+async function uploadResumable(file, config, onProgress) {
+    const key = `upload-session:${file.name}:${file.size}:${file.lastModified}`;
+    let url = localStorage.getItem(key);
+    let offset = null;
+    let chunkSize = config.resumable_chunk_size;
+
+    // Pick up a session left by an earlier attempt (e.g. before a reload)
+    if (url) {
+        try {
+            const res = await fetch(url);
+            if (res.ok) {
+                offset = (await res.json()).offset;
+            }
+        } catch (err) {
+            // Checked again below when sending
+        }
+    }
+    if (offset === null) {
+        const params = new URLSearchParams({
+            filename: file.name,
+            size: file.size,
+            content_type: file.type || 'application/octet-stream'
+        });
+        const res = await fetch(`/upload/sessions?${params}`, { method: 'POST' });
+        const data = await res.json();
+        if (!res.ok) {
+            throw new Error(data.error || `HTTP ${res.status}`);
+        }
+        url = data.upload_url;
+        offset = data.offset;
+        chunkSize = data.chunk_size || chunkSize;
+        localStorage.setItem(key, url);
+    }
+
+    let retries = 0;
+    while (offset < file.size) {
+        let res;
+        try {
+            res = await fetch(`${url}?offset=${offset}`, {
+                method: 'PUT',
+                body: file.slice(offset, offset + chunkSize)
+            });
+        } catch (err) {
+            // Connection dropped: back off, then ask the server how much arrived
+            if (++retries > RESUMABLE_MAX_RETRIES) {
+                throw new Error(`Connection lost (${Math.round(offset / file.size * 100)}% sent)`);
+            }
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** retries, 30000)));
+            try {
+                const status = await fetch(url);
+                if (status.ok) {
+                    offset = (await status.json()).offset;
+                }
+            } catch (statusErr) {
+                // Still offline; the next PUT retries
+            }
+            continue;
+        }
+        const data = await res.json();
+        if (res.ok) {
+            offset = data.offset;
+            retries = 0;
+        } else if (res.status === 409 && data.offset !== undefined) {
+            // The server holds a different offset (an earlier attempt landed)
+            offset = data.offset;
+            await new Promise(resolve => setTimeout(resolve, 500));
+        } else {
+            localStorage.removeItem(key);
+            throw new Error(data.error || `HTTP ${res.status}`);
+        }
+        onProgress(offset / file.size);
+    }
+
+    const res = await fetch(`${url}/finalize`, { method: 'POST' });
+    localStorage.removeItem(key);
+    return await res.json();
+}
+
+async function uploadSheet(file) {
+    const formData = new FormData();
+    formData.append('file', file);
+    const res = await fetch('/upload/sheet', {
+        method: 'POST',
+        body: formData
+    });
+    const data = await res.json();
+    if (!data.results) {
+        throw new Error(data.error || `HTTP ${res.status}`);
+    }
+    const stored = data.results.filter(result => result.success).length;
+    if (stored !== data.results.length) {
+        return { success: false, error: `${stored} of ${data.results.length} cards stored` };
+    }
+    return { success: true, note: `${stored} cards` };
+}
+
 document.getElementById('uploadForm').addEventListener('submit', async function(e) {
     e.preventDefault();
     const fileInput = document.getElementById('fileInput');
     const feedback = document.getElementById('feedback');
-    
+
     if (!fileInput.files.length) {
         feedback.textContent = 'Please select one or more images.';
         return;
     }
 
     const files = Array.from(fileInput.files);
+    const sheetMode = document.getElementById('sheetMode').checked;
     const totalFiles = files.length;
-    
+
     feedback.innerHTML = `
         <div>Uploading ${totalFiles} file${totalFiles > 1 ? 's' : ''}...</div>
         <div id="progress">
@@ -20,56 +226,96 @@ document.getElementById('uploadForm').addEventListener('submit', async function(
         <div id="uploadResults"></div>
     `;
 
+    // One row per file: name, status and its own progress bar
+    const resultsEl = document.getElementById('uploadResults');
+    const rows = files.map(file => {
+        const row = document.createElement('div');
+        row.className = 'upload-row';
+        row.innerHTML = `
+            <div class="upload-row-head"><span class="upload-name"></span><span class="upload-status">Waiting</span></div>
+            <div class="upload-row-bar"><div></div></div>
+        `;
+        row.querySelector('.upload-name').textContent = file.name;
+        resultsEl.appendChild(row);
+        return row;
+    });
+    const fractions = files.map(() => 0);
+
     let completed = 0;
     let successful = 0;
     let failed = 0;
-    const results = [];
 
-    // Upload files sequentially to avoid overwhelming the server
-    for (let i = 0; i < files.length; i++) {
-        const file = files[i];
-        const formData = new FormData();
-        formData.append('file', file);
+    function updateProgress() {
+        const done = fractions.reduce((sum, fraction) => sum + fraction, 0);
+        document.getElementById('progressBar').style.width = `${(done / totalFiles) * 100}%`;
+        document.getElementById('progressText').textContent = `${completed} / ${totalFiles}`;
+    }
 
+    function setRow(index, status, fraction) {
+        rows[index].querySelector('.upload-status').textContent = status;
+        if (fraction !== undefined) {
+            fractions[index] = fraction;
+            rows[index].querySelector('.upload-row-bar div').style.width = `${fraction * 100}%`;
+        }
+        updateProgress();
+    }
+
+    const config = await getUploadConfig();
+
+    // Each file is downscaled in the browser to what the server keeps, then
+    // sent on its own; up to config.concurrency files are in flight at once.
+    // Sheets go uncut to /upload/sheet, which splits them into cards.
+    async function uploadFile(index) {
+        const original = files[index];
+        let result;
         try {
-            const res = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
-            const data = await res.json();
-            
-            completed++;
-            if (data.success) {
-                successful++;
-                results.push(`✅ ${file.name}: Success`);
+            if (sheetMode) {
+                setRow(index, 'Uploading sheet…', 0.1);
+                result = await uploadSheet(original);
             } else {
-                failed++;
-                results.push(`❌ ${file.name}: ${data.error || 'Unknown error'}`);
+                setRow(index, 'Resizing…');
+                const file = await preResize(original, config);
+                const sizeNote = file === original
+                    ? formatBytes(file.size)
+                    : `${formatBytes(original.size)} → ${formatBytes(file.size)}`;
+                const onProgress = fraction => setRow(index, `Uploading ${sizeNote} (${Math.round(fraction * 100)}%)`, fraction * 0.95);
+                onProgress(0);
+                result = file.size > config.resumable_threshold
+                    ? await uploadResumable(file, config, onProgress)
+                    : await sendFile(file, onProgress);
+                result.note = result.note || sizeNote;
             }
         } catch (err) {
-            completed++;
+            result = { success: false, error: err.message };
+        }
+
+        completed++;
+        if (result.success) {
+            successful++;
+            setRow(index, `✅ ${result.note || 'Success'}`, 1);
+        } else {
             failed++;
-            results.push(`❌ ${file.name}: ${err.message}`);
+            rows[index].classList.add('failed');
+            setRow(index, `❌ ${result.error || 'Unknown error'}`, 1);
         }
+    }
 
-        // Update progress
-        const progress = (completed / totalFiles) * 100;
-        document.getElementById('progressBar').style.width = `${progress}%`;
-        document.getElementById('progressText').textContent = `${completed} / ${totalFiles}`;
-        
-        // Update results
-        document.getElementById('uploadResults').innerHTML = results.map(result => 
-            `<div style="margin: 2px 0; font-size: 0.9rem;">${result}</div>`
-        ).join('');
+    let nextFile = 0;
+    async function runQueue() {
+        while (nextFile < files.length) {
+            await uploadFile(nextFile++);
+        }
     }
+    const workers = Math.max(1, Math.min(config.concurrency, files.length));
+    await Promise.all(Array.from({ length: workers }, runQueue));
 
     // Final summary
     const summaryColor = failed === 0 ? '#4caf50' : (successful === 0 ? '#f44336' : '#ff9800');
-    feedback.innerHTML += `
+    feedback.insertAdjacentHTML('beforeend', `
         <div style="margin-top: 15px; padding: 10px; background: ${summaryColor}; color: white; border-radius: 5px; font-weight: bold;">
             Summary: ${successful} successful, ${failed} failed out of ${totalFiles} total
         </div>
-    `;
+    `);
 
     // Reset form if all uploads were successful
     if (failed === 0) {
@@ -0,0 +1,76 @@
+-- Claim queue for uploaded-but-unanalyzed images
+-- Run this AFTER schema_update.sql
+--
+-- Lets several analysis workers (app/analysis_worker.py) pick up images whose
+-- analysis never completed without doing the same image twice. A claim is a
+-- lease: if a worker dies, the image becomes claimable again once the lease expires.
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS analysis_claimed_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS analysis_claimed_by TEXT,
+  ADD COLUMN IF NOT EXISTS analysis_claims INTEGER NOT NULL DEFAULT 0;
+
+-- Only unanalyzed rows are indexed, so the index stays tiny however large images grows.
+-- Also serves monitoring query #6 for the "No Analysis" / "Missing Tags" cases.
+CREATE INDEX IF NOT EXISTS idx_images_unanalyzed
+  ON images (created_at)
+  WHERE tags IS NULL;
+
+-- Claim up to claim_limit unanalyzed images for worker_id.
+-- FOR UPDATE SKIP LOCKED means concurrent callers never block on or return the same rows.
+CREATE OR REPLACE FUNCTION claim_unanalyzed_images(
+  claim_limit INT DEFAULT 10,
+  worker_id TEXT DEFAULT NULL,
+  lease_seconds INT DEFAULT 300,
+  max_claims INT DEFAULT 5,
+  min_age_seconds INT DEFAULT 120
+)
+RETURNS TABLE (
+  id UUID,
+  image_name TEXT,
+  image_url TEXT,
+  created_at TIMESTAMPTZ,
+  analysis_claims INTEGER
+)
+LANGUAGE SQL
+AS $$
+  WITH candidates AS (
+    SELECT i.id
+    FROM images i
+    WHERE i.tags IS NULL
+      -- Leave fresh uploads to the storage webhook that is still processing them
+      AND i.created_at < now() - make_interval(secs => min_age_seconds)
+      AND (i.analysis_claimed_at IS NULL
+           OR i.analysis_claimed_at < now() - make_interval(secs => lease_seconds))
+      AND i.analysis_claims < max_claims
+    ORDER BY i.created_at
+    LIMIT claim_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE images i
+  SET analysis_claimed_at = now(),
+      analysis_claimed_by = worker_id,
+      analysis_claims = i.analysis_claims + 1
+  FROM candidates c
+  WHERE i.id = c.id
+  RETURNING i.id, i.image_name, i.image_url, i.created_at, i.analysis_claims;
+$$;
+
+-- Give up a claim early (e.g. the analysis call failed) so another worker can retry
+CREATE OR REPLACE FUNCTION release_image_claim(
+  target_id UUID,
+  worker_id TEXT DEFAULT NULL
+)
+RETURNS BOOLEAN
+LANGUAGE SQL
+AS $$
+  WITH released AS (
+    UPDATE images
+    SET analysis_claimed_at = NULL,
+        analysis_claimed_by = NULL
+    WHERE id = target_id
+      AND (worker_id IS NULL OR analysis_claimed_by = worker_id)
+    RETURNING id
+  )
+  SELECT EXISTS (SELECT 1 FROM released);
+$$;
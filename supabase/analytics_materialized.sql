@@ -0,0 +1,196 @@
+-- Materialized analytics views with debounced concurrent refresh
+-- Run this AFTER enhanced_schema.sql
+--
+-- The dashboard used to run image_analytics, category_analytics,
+-- content_type_analytics and the monitoring queries as full scans on every load.
+-- These materialized versions are refreshed CONCURRENTLY (readers are never
+-- blocked) only when images changed, and at most once per debounce interval.
+-- The FastAPI app calls refresh_analytics_views() on a schedule and serves
+-- get_analytics_snapshot() with its freshness timestamp.
+
+-- Step 1: Materialized views (each needs a unique index for CONCURRENTLY)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_image_analytics AS
+SELECT
+  1 as id,
+  COUNT(*) as total_images,
+  COUNT(*) FILTER (WHERE tags IS NOT NULL) as analyzed_images,
+  COUNT(*) FILTER (WHERE embedding IS NOT NULL) as searchable_images,
+  ROUND(COUNT(*) FILTER (WHERE tags IS NOT NULL) * 100.0 / NULLIF(COUNT(*), 0), 2) as success_rate_percent,
+  AVG(confidence) FILTER (WHERE tags IS NOT NULL) as avg_confidence,
+  COALESCE(SUM(total_tokens), 0) as total_tokens_used
+FROM images;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_image_analytics_id ON mv_image_analytics (id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_category_analytics AS
+SELECT
+  COALESCE(tags->>'category', 'unknown') as category,
+  COUNT(*) as count
+FROM images
+WHERE tags IS NOT NULL
+GROUP BY COALESCE(tags->>'category', 'unknown');
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_category_analytics_category ON mv_category_analytics (category);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_content_type_analytics AS
+SELECT
+  COALESCE(tags->>'contentType', 'unknown') as content_type,
+  COUNT(*) as count
+FROM images
+WHERE tags IS NOT NULL
+GROUP BY COALESCE(tags->>'contentType', 'unknown');
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_content_type_analytics_type ON mv_content_type_analytics (content_type);
+
+-- Monitoring query #2 (hourly activity); kept for 7 days, filter to 24h when reading
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_upload_activity_hourly AS
+SELECT
+  DATE_TRUNC('hour', created_at) as hour,
+  COUNT(*) as uploads,
+  COUNT(*) FILTER (WHERE tags IS NOT NULL) as analyzed,
+  ROUND(COUNT(*) FILTER (WHERE tags IS NOT NULL) * 100.0 / COUNT(*), 1) as success_rate_percent
+FROM images
+WHERE created_at > NOW() - INTERVAL '7 days'
+GROUP BY DATE_TRUNC('hour', created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_upload_activity_hourly_hour ON mv_upload_activity_hourly (hour);
+
+-- Monitoring query #3 (content analysis breakdown)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_content_breakdown AS
+SELECT
+  COALESCE(tags->>'category', 'unknown') as category,
+  COALESCE(tags->>'contentType', 'unknown') as content_type,
+  COUNT(*) as count,
+  ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER (), 1) as percentage
+FROM images
+WHERE tags IS NOT NULL
+GROUP BY COALESCE(tags->>'category', 'unknown'), COALESCE(tags->>'contentType', 'unknown');
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_content_breakdown_key ON mv_content_breakdown (category, content_type);
+
+-- Step 2: Refresh bookkeeping
+-- Writes bump a sequence (non-transactional, never blocks) and the refresh records
+-- the sequence value it covered, so uploads never wait on a running refresh.
+CREATE SEQUENCE IF NOT EXISTS analytics_change_seq;
+
+CREATE TABLE IF NOT EXISTS analytics_refresh_state (
+  id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  refreshed_change BIGINT NOT NULL DEFAULT 0,
+  last_refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO analytics_refresh_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Step 3: Mark the views stale after writes to images that can change them (one
+-- nextval per statement): inserts, deletes and updates of the columns the views
+-- read. Other writes (claim-queue leases, analysis_updated_at, source_name,
+-- phash, pre_analysis) leave them fresh; keep this list in step with Step 1.
+CREATE OR REPLACE FUNCTION mark_analytics_dirty()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM nextval('analytics_change_seq');
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_images_analytics_dirty ON images;
+CREATE TRIGGER trg_images_analytics_dirty
+AFTER INSERT OR DELETE OR UPDATE OF tags, confidence, total_tokens, embedding, created_at ON images
+FOR EACH STATEMENT
+EXECUTE FUNCTION mark_analytics_dirty();
+
+-- Number of image writes so far (0 until the sequence is first used)
+CREATE OR REPLACE FUNCTION analytics_change_counter()
+RETURNS BIGINT
+LANGUAGE SQL
+STABLE
+AS $$
+  SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM analytics_change_seq;
+$$;
+
+CREATE OR REPLACE FUNCTION analytics_views_stale()
+RETURNS BOOLEAN
+LANGUAGE SQL
+STABLE
+AS $$
+  SELECT analytics_change_counter() > refreshed_change
+  FROM analytics_refresh_state WHERE id = 1;
+$$;
+
+-- Step 4: Debounced refresh. Returns true if the views were refreshed.
+-- Skips when nothing changed, when the last refresh is newer than min_interval,
+-- or when another session is already refreshing.
+-- REFRESH MATERIALIZED VIEW needs the view owner, and the app calls this as
+-- service_role, so it runs as its owner (set below to the views' owner) and
+-- only service_role may call it.
+CREATE OR REPLACE FUNCTION refresh_analytics_views(
+  min_interval INTERVAL DEFAULT INTERVAL '30 seconds',
+  force BOOLEAN DEFAULT false
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  state analytics_refresh_state%ROWTYPE;
+  covered_change BIGINT;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('refresh_analytics_views')) THEN
+    RETURN false;
+  END IF;
+
+  SELECT * INTO state FROM analytics_refresh_state WHERE id = 1;
+  covered_change := analytics_change_counter();
+
+  IF NOT force AND (covered_change <= state.refreshed_change
+                    OR state.last_refreshed_at > now() - min_interval) THEN
+    RETURN false;
+  END IF;
+
+  REFRESH MATERIALIZED VIEW CONCURRENTLY mv_image_analytics;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY mv_category_analytics;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY mv_content_type_analytics;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY mv_upload_activity_hourly;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY mv_content_breakdown;
+
+  -- Writes that happened during the refresh stay above covered_change and keep the views stale
+  UPDATE analytics_refresh_state
+  SET refreshed_change = covered_change, last_refreshed_at = now()
+  WHERE id = 1;
+  RETURN true;
+END;
+$$;
+
+DO $$
+BEGIN
+  EXECUTE format(
+    'ALTER FUNCTION refresh_analytics_views(INTERVAL, BOOLEAN) OWNER TO %I',
+    (SELECT matviewowner FROM pg_matviews
+     WHERE schemaname = 'public' AND matviewname = 'mv_image_analytics')
+  );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION refresh_analytics_views(INTERVAL, BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION refresh_analytics_views(INTERVAL, BOOLEAN) TO service_role;
+
+-- Step 5: One round trip for the dashboard
+CREATE OR REPLACE FUNCTION get_analytics_snapshot()
+RETURNS JSONB
+LANGUAGE SQL
+STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'refreshed_at', (SELECT last_refreshed_at FROM analytics_refresh_state WHERE id = 1),
+    'stale', analytics_views_stale(),
+    'overview', (SELECT to_jsonb(a) - 'id' FROM mv_image_analytics a),
+    'categories', COALESCE((SELECT jsonb_agg(c ORDER BY c.count DESC) FROM mv_category_analytics c), '[]'::jsonb),
+    'content_types', COALESCE((SELECT jsonb_agg(t ORDER BY t.count DESC) FROM mv_content_type_analytics t), '[]'::jsonb),
+    'content_breakdown', COALESCE((SELECT jsonb_agg(b ORDER BY b.count DESC) FROM mv_content_breakdown b), '[]'::jsonb),
+    'upload_activity', COALESCE((
+      SELECT jsonb_agg(u ORDER BY u.hour DESC)
+      FROM mv_upload_activity_hourly u
+      WHERE u.hour > NOW() - INTERVAL '24 hours'
+    ), '[]'::jsonb)
+  );
+$$;
+
+-- Optional: refresh from the database itself instead of (or as well as) the app
+-- SELECT cron.schedule('refresh-analytics', '* * * * *', $$SELECT refresh_analytics_views()$$);
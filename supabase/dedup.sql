@@ -0,0 +1,41 @@
+-- Perceptual-hash deduplication of uploads
+-- Run this AFTER upload_tracking.sql
+--
+-- The backend hashes every stored image (64-bit dHash, app/image_dedup.py) and
+-- checks it against an in-memory BK-tree of earlier hashes. Before the object
+-- reaches Storage it records the hash, and the image it nearly duplicates if
+-- any, here, keyed by the object name. The edge function copies both onto the
+-- images row and, for a duplicate that has already been analysed, copies that
+-- analysis instead of calling the Vision API.
+--
+-- Hashes are stored as signed BIGINT (the unsigned 64-bit value minus 2^64
+-- when the top bit is set). Run python backfill_phash.py once for existing rows.
+
+CREATE TABLE IF NOT EXISTS upload_hashes (
+  source_name TEXT PRIMARY KEY,
+  phash BIGINT NOT NULL,
+  -- The earlier image, by id when its row existed at upload time, otherwise by
+  -- the object name it was uploaded as
+  duplicate_of UUID,
+  duplicate_of_source TEXT,
+  duplicate_distance SMALLINT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS phash BIGINT,
+  ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES images(id) ON DELETE SET NULL;
+
+-- Loading the BK-tree reads (id, source_name, phash) for every hashed row
+CREATE INDEX IF NOT EXISTS idx_images_phash
+  ON images(id)
+  INCLUDE (source_name, phash)
+  WHERE phash IS NOT NULL;
+
+-- Finding copies of an image
+CREATE INDEX IF NOT EXISTS idx_images_duplicate_of
+  ON images(duplicate_of)
+  WHERE duplicate_of IS NOT NULL;
+
+-- Like upload_vision_plans, rows are only needed until the webhook has run:
+-- DELETE FROM upload_hashes WHERE created_at < now() - interval '7 days';
@@ -0,0 +1,41 @@
+-- Server-side pages for the detailed table view
+-- Run this AFTER schema_update.sql
+--
+-- GET /api/detailed returns one page of table rows at a time, sorted in
+-- Postgres by upload date, confidence or token usage, optionally filtered by
+-- category and a search query. Each sort has an index on (column, id) so a
+-- page is read in order from the index instead of sorting the whole table.
+-- NULLs (images without an analysis) sort as the lowest values: last when
+-- descending, first when ascending, which is the same index scanned backwards.
+
+CREATE INDEX IF NOT EXISTS idx_images_created_at_id
+  ON images(created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_images_confidence_id
+  ON images(confidence DESC NULLS LAST, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_images_total_tokens_id
+  ON images(total_tokens DESC NULLS LAST, id DESC);
+
+-- Category filter (tags->>category=eq.X)
+CREATE INDEX IF NOT EXISTS idx_images_tags_category
+  ON images((tags->>'category'));
+
+-- Lowercase text searched by the view: description, names and every string
+-- or number in the tags (not the keys, which every row shares)
+ALTER TABLE images ADD COLUMN IF NOT EXISTS search_text TEXT
+  GENERATED ALWAYS AS (
+    lower(
+      coalesce(description, '') || ' ' ||
+      coalesce(image_name, '') || ' ' ||
+      coalesce(source_name, '') || ' ' ||
+      coalesce(jsonb_path_query_array(tags, 'strict $.** ? (@.type() == "string" || @.type() == "number")')::text, '')
+    )
+  ) STORED;
+
+-- Each search word is a search_text=ilike.*word* filter; trigrams let
+-- Postgres answer those from the index
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_images_search_text_trgm
+  ON images USING GIN (search_text gin_trgm_ops);
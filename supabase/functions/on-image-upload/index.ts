@@ -35,7 +35,7 @@
       }
 
       // OpenAI Vision API function with two-tier approach
-      async function analyzeImageWithGPT(imageUrl: string, openaiApiKey: string) {
+      async function analyzeImageWithGPT(imageUrl: string, openaiApiKey: string, detail: string = "auto") {
         Logger.info("🔍 Starting OpenAI Vision analysis", { 
           imageUrl,
           urlLength: imageUrl.length,
@@ -129,7 +129,7 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
         // First attempt: Use GPT-4o (better for complex analysis)
         Logger.info("📤 First attempt with GPT-4o (initial analysis)...");
         
-        let result = await makeVisionRequest(imageUrl, openaiApiKey, prompt, "gpt-4o", 2000);
+        let result = await makeVisionRequest(imageUrl, openaiApiKey, prompt, "gpt-4o", 2000, detail);
         let attempt = 1;
         let confidence = 0.0;
         
@@ -178,7 +178,7 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
         // If confidence is below 80%, retry with GPT-4o as fallback
         if (confidence < 0.8) {
           Logger.info("🔄 Low confidence detected, retrying with gpt-4-turbo as fallback...");
-          result = await makeVisionRequest(imageUrl, openaiApiKey, prompt, "gpt-4-turbo", 1000);
+          result = await makeVisionRequest(imageUrl, openaiApiKey, prompt, "gpt-4-turbo", 1000, detail);
           attempt = 2;
           
           // Update confidence from second attempt
@@ -230,11 +230,12 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
       }
 
       // Helper function to make vision API requests
-      async function makeVisionRequest(imageUrl: string, openaiApiKey: string, prompt: string, model: string, maxTokens: number) {
+      async function makeVisionRequest(imageUrl: string, openaiApiKey: string, prompt: string, model: string, maxTokens: number, detail: string = "auto") {
         // 🔍 DETAILED REQUEST DEBUGGING
         Logger.info("🚀 Preparing OpenAI Vision API request", {
           model,
           maxTokens,
+          detail,
           imageUrl: imageUrl,
           imageUrlLength: imageUrl.length,
           isDataUrl: imageUrl.startsWith('data:'),
@@ -258,7 +259,7 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
               role: "user",
               content: [
                 { type: "text", text: prompt },
-                { type: "image_url", image_url: { url: imageUrl } }
+                { type: "image_url", image_url: { url: imageUrl, detail } }
               ]
             }
           ],
@@ -493,6 +494,314 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
         return data.data[0].embedding;
       }
 
+      // Normalized question context, stored once so the question generator does not
+      // re-walk the camelCase tags on every request.
+      // Keep in sync with QUESTION_CONTEXT_VERSION / QUESTION_CONTEXT_FIELDS in app/question_context.py
+      const QUESTION_CONTEXT_VERSION = 1;
+      const QUESTION_CONTEXT_FIELDS: Record<string, [string, any]> = {
+        colors: ["colors", []],
+        shapes: ["shapes", []],
+        letters: ["letters", []],
+        numbers: ["numbers", []],
+        words: ["words", []],
+        objects: ["objects", []],
+        people: ["people", []],
+        animals: ["animals", []],
+        shape_colors: ["shapeColors", []],
+        shape_contents: ["shapeContents", []],
+        nested_elements: ["nestedElements", []],
+        text_color: ["textColor", ""],
+        text_vs_semantic_mismatch: ["textVsSemanticMismatch", ""],
+        text_location: ["textLocation", ""],
+        object_colors: ["objectColors", []],
+        object_positions: ["objectPositions", []],
+        items_inside_shapes: ["itemsInsideShapes", []],
+        overlapping_items: ["overlappingItems", []],
+        relative_positions: ["relativePositions", []],
+        color_word_mismatches: ["colorWordMismatches", []],
+        highlighted_elements: ["highlightedElements", []],
+        background_color: ["backgroundColor", "white"],
+        has_colored_background: ["hasColoredBackground", "false"],
+        total_items: ["totalItems", "0"],
+        letter_count: ["letterCount", "0"],
+        number_count: ["numberCount", "0"],
+        object_count: ["objectCount", "0"],
+        shape_count: ["shapeCount", "0"],
+        category: ["category", "mixed"],
+        question_types: ["questionTypes", []]
+      };
+
+      // Compact form: only fields that differ from their defaults are stored
+      function buildQuestionContext(tags: any) {
+        const context: Record<string, any> = {};
+        if (!tags || typeof tags !== 'object') return context;
+
+        for (const [key, [tagKey, defaultValue]] of Object.entries(QUESTION_CONTEXT_FIELDS)) {
+          const value = tags[tagKey];
+          if (!value) continue;
+          if (Array.isArray(defaultValue)) {
+            if (Array.isArray(value) && value.length > 0) context[key] = value;
+          } else if (value !== defaultValue) {
+            context[key] = value;
+          }
+        }
+        return context;
+      }
+
+      // 🧹 Tell the backend which images rows were just written so it drops them from its
+      // caches (POST /internal/invalidate in app/main.py). Needs BACKEND_URL and the same
+      // INVALIDATE_SECRET as the backend; failures are only logged, the backend's cache
+      // TTLs bound how stale it gets
+      async function notifyBackend(imageIds: string[], requestId: string) {
+        const backendUrl = Deno.env.get("BACKEND_URL");
+        const secret = Deno.env.get("INVALIDATE_SECRET");
+        if (!backendUrl || !secret) return;
+        try {
+          const response = await fetch(`${backendUrl.replace(/\/+$/, "")}/internal/invalidate`, {
+            method: "POST",
+            headers: {
+              "Authorization": `Bearer ${secret}`,
+              "Content-Type": "application/json",
+            },
+            body: JSON.stringify({ image_ids: imageIds }),
+            signal: AbortSignal.timeout(5000),
+          });
+          if (!response.ok) {
+            Logger.warning(`🧹 Cache invalidation returned ${response.status} [${requestId}]`, { imageIds });
+          }
+        } catch (notifyError) {
+          Logger.warning(`🧹 Cache invalidation failed [${requestId}]`, { imageIds, error: notifyError.message });
+        }
+      }
+
+      // 🔐 Reanalysis requests spend OpenAI credit, so they must carry REANALYZE_SECRET
+      // (sent by app/analysis_worker.py as X-Reanalyze-Secret); the anon key alone is not
+      // enough. Both sides are hashed first so the comparison takes the same time whatever
+      // the input
+      async function reanalyzeAuthorized(req: Request): Promise<boolean> {
+        const secret = Deno.env.get("REANALYZE_SECRET");
+        const given = req.headers.get("x-reanalyze-secret");
+        if (!secret || !given) return false;
+        const encoder = new TextEncoder();
+        const [a, b] = await Promise.all([
+          crypto.subtle.digest("SHA-256", encoder.encode(given)),
+          crypto.subtle.digest("SHA-256", encoder.encode(secret)),
+        ]);
+        const left = new Uint8Array(a);
+        const right = new Uint8Array(b);
+        let diff = 0;
+        for (let i = 0; i < left.length; i++) diff |= left[i] ^ right[i];
+        return diff === 0;
+      }
+
+      // Run Vision analysis + embedding for an existing images row and store the results.
+      // Shared by the upload webhook and reanalysis requests from the claim queue worker.
+      // 🫥 Blank card (see supabase/pre_analysis.sql): the backend's local measurements
+      // are all there is to say, so write them as the analysis without calling the Vision API
+      async function storeBlankAnalysis(supabase: any, uuid: string, preAnalysis: any, requestId: string) {
+        const background = preAnalysis.background_color || "white";
+        const tags = {
+          colors: preAnalysis.colors || [background],
+          shapes: [], letters: [], numbers: [], words: [], objects: [], people: [], animals: [],
+          backgroundColor: background,
+          hasColoredBackground: String(background !== "white"),
+          totalItems: 0, letterCount: 0, numberCount: 0, objectCount: 0, shapeCount: 0,
+          category: "blank",
+          questionTypes: []
+        };
+        const { error: updateError } = await supabase
+          .from("images")
+          .update({
+            description: `Blank card with a ${background} background`,
+            confidence: 1.0,
+            tags: tags,
+            question_context: buildQuestionContext(tags),
+            question_context_version: QUESTION_CONTEXT_VERSION,
+            prompt_tokens: 0,
+            completion_tokens: 0,
+            total_tokens: 0,
+            analysis_attempts: 0
+          })
+          .eq("id", uuid);
+
+        if (updateError) {
+          throw new Error(`Database update error: ${updateError.message}`);
+        }
+        Logger.success(`🫥 Blank card, Vision analysis skipped [${requestId}]`, {
+          background,
+          foregroundRatio: preAnalysis.foreground_ratio
+        });
+      }
+
+      // ♊ Near-duplicate of an analysed image: reuse its analysis instead of calling
+      // the Vision API. Returns false when the earlier image has no analysis yet.
+      async function copyDuplicateAnalysis(supabase: any, uuid: string, uploadHash: any, requestId: string): Promise<boolean> {
+        let query = supabase
+          .from("images")
+          .select("id, description, confidence, tags, question_context, question_context_version, embedding")
+          .not("description", "is", null)
+          .limit(1);
+        query = uploadHash.duplicate_of
+          ? query.eq("id", uploadHash.duplicate_of)
+          : query.eq("source_name", uploadHash.duplicate_of_source);
+        const { data: originals, error } = await query;
+
+        if (error || !originals || originals.length === 0) {
+          Logger.info(`♊ Earlier copy not analysed yet, analysing this one [${requestId}]`, {
+            duplicateOf: uploadHash.duplicate_of || uploadHash.duplicate_of_source,
+            error
+          });
+          return false;
+        }
+
+        const original = originals[0];
+        const { error: updateError } = await supabase
+          .from("images")
+          .update({
+            description: original.description,
+            confidence: original.confidence,
+            tags: original.tags,
+            question_context: original.question_context,
+            question_context_version: original.question_context_version,
+            embedding: original.embedding,
+            duplicate_of: original.id,
+            prompt_tokens: 0,
+            completion_tokens: 0,
+            total_tokens: 0,
+            analysis_attempts: 0
+          })
+          .eq("id", uuid);
+
+        if (updateError) {
+          throw new Error(`Database update error: ${updateError.message}`);
+        }
+        Logger.success(`♊ Copied analysis from ${original.id} [${requestId}]`, {
+          distance: uploadHash.duplicate_distance
+        });
+        return true;
+      }
+
+      async function analyzeAndStore(supabase: any, uuid: string, imageUrlForAI: string, openaiApiKey: string, requestId: string, visionDetail: string = "auto") {
+        const visionResponse = await analyzeImageWithGPT(imageUrlForAI, openaiApiKey, visionDetail);
+        Logger.success(`📊 Vision analysis complete [${requestId}]`);
+
+        const gptContent = visionResponse.choices[0]?.message?.content;
+        if (!gptContent) {
+          throw new Error("No content in GPT response");
+        }
+
+        console.log("📝 GPT response content:", gptContent);
+
+        // Parse the JSON response using helper function
+        const analysisData = await parseGPTResponse(gptContent);
+        
+        const description = analysisData.description;
+        const confidence = analysisData.confidence || 0.0;
+        const tags = analysisData.tags;
+        
+        // Extract token usage and analysis metadata
+        const tokenUsage = visionResponse.tokenUsage || {};
+        const promptTokens = tokenUsage.promptTokens || 0;
+        const completionTokens = tokenUsage.completionTokens || 0;
+        const totalTokens = tokenUsage.totalTokens || 0;
+        const attempts = visionResponse.analysisMetadata?.attempts || 1;
+
+        console.log("🏷️ Parsed analysis:", {
+          description: description?.substring(0, 100) + "...",
+          confidence: confidence,
+          attempts: attempts,
+          promptTokens,
+          completionTokens,
+          totalTokens,
+          tagKeys: Object.keys(tags || {})
+        });
+
+        // 🚨 HIGH TOKEN USAGE ALERT
+        if (promptTokens > 5000) {
+          Logger.error("🚨 HIGH TOKEN USAGE DETECTED!", {
+            promptTokens,
+            totalTokens,
+            imageUrl: imageUrlForAI,
+            isDataUrl: imageUrlForAI.startsWith('data:'),
+            urlLength: imageUrlForAI.length,
+            requestId,
+            message: "This indicates possible base64 encoding or other issue"
+          });
+        } else if (promptTokens > 2000) {
+          Logger.warning("⚠️ Elevated token usage", {
+            promptTokens,
+            totalTokens,
+            imageUrl: imageUrlForAI,
+            requestId
+          });
+        } else {
+          Logger.success("✅ Normal token usage", {
+            promptTokens,
+            totalTokens,
+            requestId
+          });
+        }
+
+        // Create embedding text from description and simplified tags structure
+        const tagsData = analysisData.tags || {};
+        const embeddingText = `${description}. 
+        Confidence: ${confidence}. 
+        Objects: ${Array.isArray(tagsData.objects) ? tagsData.objects.join(', ') : ''}. 
+        Colors: ${Array.isArray(tagsData.colors) ? tagsData.colors.join(', ') : ''}. 
+        Shapes: ${Array.isArray(tagsData.shapes) ? tagsData.shapes.join(', ') : ''}. 
+        Letters: ${Array.isArray(tagsData.letters) ? tagsData.letters.join(', ') : ''}. 
+        Numbers: ${Array.isArray(tagsData.numbers) ? tagsData.numbers.join(', ') : ''}. 
+        Words: ${Array.isArray(tagsData.words) ? tagsData.words.join(', ') : ''}. 
+        People: ${Array.isArray(tagsData.people) ? tagsData.people.join(', ') : ''}. 
+        Animals: ${Array.isArray(tagsData.animals) ? tagsData.animals.join(', ') : ''}. 
+        Category: ${tagsData.category || ''}. 
+        Relationships: ${Array.isArray(tagsData.relationships) ? tagsData.relationships.join(', ') : ''}. 
+        Background: ${tagsData.backgroundColor || ''}`.trim();
+        console.log("📄 Embedding text prepared:", embeddingText.substring(0, 150) + "...");
+        
+        // Generate embedding
+        const embedding = await generateEmbedding(embeddingText, openaiApiKey);
+
+        // Update the record with AI-generated data
+        console.log("💾 Updating record with AI data...");
+        const { error: updateError } = await supabase
+          .from("images")
+          .update({
+            description: description,
+            confidence: confidence,
+            tags: tags,
+            question_context: buildQuestionContext(tags),
+            question_context_version: QUESTION_CONTEXT_VERSION,
+            embedding: embedding,
+            prompt_tokens: promptTokens,
+            completion_tokens: completionTokens,
+            total_tokens: totalTokens,
+            analysis_attempts: attempts
+          })
+          .eq("id", uuid);
+
+        if (updateError) {
+          console.error("❌ Database update error:", updateError);
+          throw new Error(`Database update error: ${updateError.message}`);
+        }
+        console.log("✅ AI analysis complete and saved to database");
+
+        // Keep the raw model output out of the hot images row (see raw_analysis_split.sql)
+        const { error: rawError } = await supabase
+          .from("image_analysis_raw")
+          .upsert({
+            image_id: uuid,
+            model: visionResponse.model,
+            content: gptContent,
+            usage: visionResponse.usage || null,
+            analysis_metadata: visionResponse.analysisMetadata || null
+          });
+
+        if (rawError) {
+          console.error("⚠️ Raw analysis insert error:", rawError);
+        }
+      }
+
       serve(async (req) => {
         const functionStart = Date.now();
         const requestId = crypto.randomUUID().substring(0, 8); // Short ID for this request
@@ -531,6 +840,13 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
             return new Response(JSON.stringify({ error: "No file info", payload: body }), { status: 400 });
           }
 
+          // Display derivatives (thumbnails, previews) are stored next to each upload
+          // by the backend; they are not separate images and are never analysed
+          if (record.name.startsWith("derivatives/")) {
+            Logger.info(`⏭️ Skipping derivative ${record.name} [${requestId}]`);
+            return new Response(JSON.stringify({ success: true, skipped: true, derivative: true }), { status: 200 });
+          }
+
           if (!openaiApiKey) {
             Logger.error(`❌ Missing OpenAI API key [${requestId}]`);
             return new Response(JSON.stringify({ error: "Missing OpenAI API key" }), { status: 500 });
@@ -540,6 +856,43 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
           const supabase = createClient(supabaseUrl, supabaseKey);
           Logger.success(`✅ Supabase client initialized [${requestId}]`);
 
+          // 🔁 REANALYSIS: the claim queue worker re-runs analysis for an existing row
+          // instead of a storage webhook (see supabase/analysis_queue.sql)
+          if (body.reanalyze && body.image_id) {
+            if (!(await reanalyzeAuthorized(req))) {
+              Logger.error(`❌ Unauthorized reanalysis request [${requestId}]`, { imageId: body.image_id });
+              return new Response(JSON.stringify({ error: "Unauthorized" }), { status: 401 });
+            }
+            const { data: rows, error: fetchError } = await supabase
+              .from("images")
+              .select("id, image_url, vision_detail, pre_analysis")
+              .eq("id", body.image_id)
+              .limit(1);
+
+            if (fetchError || !rows || rows.length === 0) {
+              Logger.error(`❌ Reanalysis target not found [${requestId}]`, { imageId: body.image_id, error: fetchError });
+              return new Response(JSON.stringify({ error: "Image not found" }), { status: 404 });
+            }
+
+            try {
+              if (rows[0].pre_analysis?.vision_action === "skip") {
+                await storeBlankAnalysis(supabase, rows[0].id, rows[0].pre_analysis, requestId);
+              } else {
+                await analyzeAndStore(supabase, rows[0].id, rows[0].image_url, openaiApiKey, requestId, rows[0].vision_detail || "auto");
+              }
+            } catch (aiError) {
+              Logger.error(`❌ Reanalysis failed [${requestId}]`, aiError);
+              return new Response(JSON.stringify({ error: aiError.message }), { status: 502 });
+            }
+            await notifyBackend([rows[0].id], requestId);
+
+            Logger.success(`🎉 Reanalysis completed [${requestId}]`, {
+              id: rows[0].id,
+              duration_ms: Date.now() - functionStart
+            });
+            return new Response(JSON.stringify({ success: true, id: rows[0].id, reanalyzed: true }), { status: 200 });
+          }
+
           // 🛡️ DEDUPLICATION: Check if this file has already been processed
           Logger.info(`🔍 Checking for existing record [${requestId}]`, { fileName: record.name });
           const { data: existingImages, error: checkError } = await supabase
@@ -705,6 +1058,36 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
             return new Response(JSON.stringify({ error: "Image URL test failed" }), { status: 500 });
           }
 
+          // Resize plan the backend recorded for this upload (see supabase/vision_budget.sql)
+          const { data: visionPlan } = await supabase
+            .from("upload_vision_plans")
+            .select("detail, predicted_image_tokens")
+            .eq("source_name", record.name)
+            .maybeSingle();
+          const visionDetail = visionPlan?.detail || "auto";
+
+          // Perceptual hash and near-duplicate the backend found for this upload (see supabase/dedup.sql).
+          // phash is read as text: a 64-bit value does not survive a JS number
+          const { data: uploadHash } = await supabase
+            .from("upload_hashes")
+            .select("phash::text, duplicate_of, duplicate_of_source, duplicate_distance")
+            .eq("source_name", record.name)
+            .maybeSingle();
+
+          // Local pre-analysis: palette, background, item count and blank-card verdict (see supabase/pre_analysis.sql)
+          const { data: preAnalysis } = await supabase
+            .from("upload_pre_analysis")
+            .select("pre_analysis, vision_action")
+            .eq("source_name", record.name)
+            .maybeSingle();
+
+          // Sheet and grid position when this is a card split by /upload/sheet (see supabase/sheets.sql)
+          const { data: sheetCard } = await supabase
+            .from("upload_sheet_cards")
+            .select("sheet_id, sheet_position")
+            .eq("source_name", record.name)
+            .maybeSingle();
+
           // Insert basic record first
           Logger.info("💾 Inserting basic record to database...");
           
@@ -712,6 +1095,13 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
             id: uuid,
             image_name: newName,
             image_url: publicUrl, // Store the permanent public URL
+            source_name: record.name, // Uploaded object name, used by /api/uploads/{job_id}
+            vision_detail: visionPlan?.detail ?? null,
+            predicted_image_tokens: visionPlan?.predicted_image_tokens ?? null,
+            sheet_id: sheetCard?.sheet_id ?? null,
+            sheet_position: sheetCard?.sheet_position ?? null,
+            phash: uploadHash?.phash ?? null,
+            pre_analysis: preAnalysis?.pre_analysis ?? null,
             created_at: new Date().toISOString(),
           });
           
@@ -720,6 +1110,7 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
             return new Response(JSON.stringify({ error: insertError.message, details: insertError }), { status: 500 });
           }
           Logger.success("✅ Basic record inserted successfully");
+          await notifyBackend([uuid], requestId);
 
           Logger.info(`🤖 Starting AI analysis [${requestId}]...`);
 
@@ -733,117 +1124,24 @@ IMPORTANT: Return ONLY the JSON object, no markdown formatting, no code blocks.
             requestId
           });
 
-          // Analyze image with OpenAI Vision
+          // Analyze image with OpenAI Vision, unless it repeats an image already analysed
+          // or the pre-analysis found it blank
           try {
-            const visionResponse = await analyzeImageWithGPT(imageUrlForAI, openaiApiKey);
-            Logger.success(`📊 Vision analysis complete [${requestId}]`);
-
-            const gptContent = visionResponse.choices[0]?.message?.content;
-            if (!gptContent) {
-              throw new Error("No content in GPT response");
+            const copied = (uploadHash?.duplicate_of || uploadHash?.duplicate_of_source)
+              ? await copyDuplicateAnalysis(supabase, uuid, uploadHash, requestId)
+              : false;
+            if (!copied && preAnalysis?.vision_action === "skip") {
+              await storeBlankAnalysis(supabase, uuid, preAnalysis.pre_analysis, requestId);
+            } else if (!copied) {
+              await analyzeAndStore(supabase, uuid, imageUrlForAI, openaiApiKey, requestId, visionDetail);
             }
-
-            console.log("📝 GPT response content:", gptContent);
-
-            // Parse the JSON response using helper function
-            const analysisData = await parseGPTResponse(gptContent);
-            
-            const description = analysisData.description;
-            const confidence = analysisData.confidence || 0.0;
-            const tags = analysisData.tags;
-            
-            // Extract token usage and analysis metadata
-            const tokenUsage = visionResponse.tokenUsage || {};
-            const promptTokens = tokenUsage.promptTokens || 0;
-            const completionTokens = tokenUsage.completionTokens || 0;
-            const totalTokens = tokenUsage.totalTokens || 0;
-            const attempts = visionResponse.analysisMetadata?.attempts || 1;
-
-            console.log("🏷️ Parsed analysis:", {
-              description: description?.substring(0, 100) + "...",
-              confidence: confidence,
-              attempts: attempts,
-              promptTokens,
-              completionTokens,
-              totalTokens,
-              tagKeys: Object.keys(tags || {})
-            });
-
-            // 🚨 HIGH TOKEN USAGE ALERT
-            if (promptTokens > 5000) {
-              Logger.error("🚨 HIGH TOKEN USAGE DETECTED!", {
-                promptTokens,
-                totalTokens,
-                imageUrl: imageUrlForAI,
-                isDataUrl: imageUrlForAI.startsWith('data:'),
-                urlLength: imageUrlForAI.length,
-                requestId,
-                message: "This indicates possible base64 encoding or other issue"
-              });
-            } else if (promptTokens > 2000) {
-              Logger.warning("⚠️ Elevated token usage", {
-                promptTokens,
-                totalTokens,
-                imageUrl: imageUrlForAI,
-                requestId
-              });
-            } else {
-              Logger.success("✅ Normal token usage", {
-                promptTokens,
-                totalTokens,
-                requestId
-              });
-            }
-
-            // Create embedding text from description and simplified tags structure
-            const tagsData = analysisData.tags || {};
-            const embeddingText = `${description}. 
-            Confidence: ${confidence}. 
-            Objects: ${Array.isArray(tagsData.objects) ? tagsData.objects.join(', ') : ''}. 
-            Colors: ${Array.isArray(tagsData.colors) ? tagsData.colors.join(', ') : ''}. 
-            Shapes: ${Array.isArray(tagsData.shapes) ? tagsData.shapes.join(', ') : ''}. 
-            Letters: ${Array.isArray(tagsData.letters) ? tagsData.letters.join(', ') : ''}. 
-            Numbers: ${Array.isArray(tagsData.numbers) ? tagsData.numbers.join(', ') : ''}. 
-            Words: ${Array.isArray(tagsData.words) ? tagsData.words.join(', ') : ''}. 
-            People: ${Array.isArray(tagsData.people) ? tagsData.people.join(', ') : ''}. 
-            Animals: ${Array.isArray(tagsData.animals) ? tagsData.animals.join(', ') : ''}. 
-            Category: ${tagsData.category || ''}. 
-            Relationships: ${Array.isArray(tagsData.relationships) ? tagsData.relationships.join(', ') : ''}. 
-            Background: ${tagsData.backgroundColor || ''}`.trim();
-            console.log("📄 Embedding text prepared:", embeddingText.substring(0, 150) + "...");
-            
-            // Generate embedding
-            const embedding = await generateEmbedding(embeddingText, openaiApiKey);
-
-            // Update the record with AI-generated data
-            console.log("💾 Updating record with AI data...");
-            const { error: updateError } = await supabase
-              .from("images")
-              .update({
-                description: description,
-                confidence: confidence,
-                tags: tags,
-                raw_json: visionResponse,
-                embedding: embedding,
-                prompt_tokens: promptTokens,
-                completion_tokens: completionTokens,
-                total_tokens: totalTokens,
-                analysis_attempts: attempts
-              })
-              .eq("id", uuid);
-
-            if (updateError) {
-              console.error("❌ Database update error:", updateError);
-              // Don't fail the whole function, basic record is already inserted
-            } else {
-              console.log("✅ AI analysis complete and saved to database");
-            }
-
           } catch (aiError) {
             console.error("❌ AI processing error:", aiError);
             console.error("Stack trace:", aiError.stack);
             // Don't fail the whole function, basic record is already inserted
           }
+          // Also after a failed analysis: it may have written attempt counts or errors
+          await notifyBackend([uuid], requestId);
 
           const functionDuration = Date.now() - functionStart;
           Logger.success(`🎉 Function completed successfully [${requestId}]`, { 
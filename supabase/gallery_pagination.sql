@@ -0,0 +1,12 @@
+-- Keyset pagination for the gallery
+--
+-- GET /api/images?limit=N returns images newest first, ordered by
+-- (created_at, id), and hands back the last row as the cursor for the next
+-- page. With this index every page is a short range scan, however deep into
+-- the library it starts, instead of an OFFSET that re-reads every row before it.
+-- Pages after the first filter on
+--   created_at <= :c AND (created_at < :c OR (created_at = :c AND id < :id))
+-- (PostgREST has no row comparison); the first condition is the index bound.
+
+CREATE INDEX IF NOT EXISTS idx_images_created_at_id
+  ON images(created_at DESC, id DESC);
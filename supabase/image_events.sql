@@ -0,0 +1,65 @@
+-- Live analysis events for GET /api/events
+-- Run this AFTER schema_update.sql
+--
+-- The app pushes image changes to open galleries over Server-Sent Events. It
+-- hears about them in one of two ways (see app/image_events.py):
+--   * DATABASE_URL set: LISTEN image_events. The triggers below NOTIFY with the
+--     image id when a row is inserted or its analysis is written; the
+--     notification is delivered when the writing transaction commits.
+--   * otherwise: a single poll of analysis_updated_at every
+--     IMAGE_EVENTS_POLL_INTERVAL seconds, shared by every open gallery and
+--     only running while one is open.
+-- analysis_updated_at only moves when something the gallery shows changes, so
+-- claim-queue bookkeeping (analysis_claimed_at, ...) produces no events.
+
+ALTER TABLE images ADD COLUMN IF NOT EXISTS analysis_updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS idx_images_analysis_updated_at
+  ON images(analysis_updated_at);
+
+CREATE OR REPLACE FUNCTION touch_image_analysis_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.analysis_updated_at := now();
+  RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION notify_image_event()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM pg_notify('image_events', json_build_object(
+    'id', NEW.id,
+    'analyzed', NEW.tags IS NOT NULL
+  )::text);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS images_touch_analysis_updated_at ON images;
+CREATE TRIGGER images_touch_analysis_updated_at
+  BEFORE UPDATE OF description, tags, confidence ON images
+  FOR EACH ROW
+  WHEN (OLD.description IS DISTINCT FROM NEW.description
+        OR OLD.tags IS DISTINCT FROM NEW.tags
+        OR OLD.confidence IS DISTINCT FROM NEW.confidence)
+  EXECUTE FUNCTION touch_image_analysis_updated_at();
+
+DROP TRIGGER IF EXISTS images_notify_insert ON images;
+CREATE TRIGGER images_notify_insert
+  AFTER INSERT ON images
+  FOR EACH ROW
+  EXECUTE FUNCTION notify_image_event();
+
+DROP TRIGGER IF EXISTS images_notify_analysis ON images;
+CREATE TRIGGER images_notify_analysis
+  AFTER UPDATE OF description, tags, confidence ON images
+  FOR EACH ROW
+  WHEN (OLD.description IS DISTINCT FROM NEW.description
+        OR OLD.tags IS DISTINCT FROM NEW.tags
+        OR OLD.confidence IS DISTINCT FROM NEW.confidence)
+  EXECUTE FUNCTION notify_image_event();
@@ -0,0 +1,139 @@
+-- Normalized image tags for fast facet counts
+-- Run this AFTER schema_update.sql
+--
+-- image_tags holds one row per (image, tag) and is kept in sync with images.tags
+-- by a trigger, so facet counts no longer unnest the tags JSONB of every row.
+-- The primary key leads with (tag_type, tag_value), which lets facet counts be
+-- answered with an index-only scan.
+
+CREATE TABLE IF NOT EXISTS image_tags (
+  image_id UUID NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+  tag_type TEXT NOT NULL,
+  tag_value TEXT NOT NULL,
+  PRIMARY KEY (tag_type, tag_value, image_id)
+);
+
+-- Used when an image's tags are rewritten or the image is deleted
+CREATE INDEX IF NOT EXISTS idx_image_tags_image_id ON image_tags (image_id);
+
+-- Flatten the analysis tags into (tag_type, tag_value) pairs
+CREATE OR REPLACE FUNCTION extract_image_tags(tags JSONB)
+RETURNS TABLE (tag_type TEXT, tag_value TEXT)
+LANGUAGE SQL
+IMMUTABLE
+AS $$
+  SELECT DISTINCT t.tag_type, trim(t.tag_value)
+  FROM (
+    SELECT a.tag_type, jsonb_array_elements_text(
+             CASE WHEN jsonb_typeof(tags->a.tag_key) = 'array' THEN tags->a.tag_key ELSE '[]'::jsonb END
+           ) AS tag_value
+    FROM (VALUES
+      ('color', 'colors'),
+      ('shape', 'shapes'),
+      ('letter', 'letters'),
+      ('number', 'numbers'),
+      ('word', 'words'),
+      ('object', 'objects'),
+      ('people', 'people'),
+      ('animal', 'animals')
+    ) AS a(tag_type, tag_key)
+
+    UNION ALL
+
+    SELECT s.tag_type, tags->>s.tag_key
+    FROM (VALUES
+      ('category', 'category'),
+      ('mood', 'mood'),
+      ('setting', 'setting')
+    ) AS s(tag_type, tag_key)
+    WHERE jsonb_typeof(tags->s.tag_key) = 'string'
+  ) t
+  WHERE t.tag_value IS NOT NULL AND trim(t.tag_value) <> '';
+$$;
+
+-- Keep image_tags in sync whenever the analysis is written
+CREATE OR REPLACE FUNCTION sync_image_tags()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    DELETE FROM image_tags WHERE image_id = NEW.id;
+  END IF;
+
+  IF NEW.tags IS NOT NULL THEN
+    INSERT INTO image_tags (image_id, tag_type, tag_value)
+    SELECT NEW.id, e.tag_type, e.tag_value
+    FROM extract_image_tags(NEW.tags) e
+    ON CONFLICT DO NOTHING;
+  END IF;
+
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_images_sync_tags ON images;
+CREATE TRIGGER trg_images_sync_tags
+AFTER INSERT OR UPDATE OF tags ON images
+FOR EACH ROW
+EXECUTE FUNCTION sync_image_tags();
+
+-- Backfill existing analyses
+INSERT INTO image_tags (image_id, tag_type, tag_value)
+SELECT i.id, e.tag_type, e.tag_value
+FROM images i
+CROSS JOIN LATERAL extract_image_tags(i.tags) e
+WHERE i.tags IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+-- Refresh the visibility map so facet counts can use index-only scans right away.
+-- VACUUM cannot run inside a transaction block; run it on its own in the SQL editor.
+-- VACUUM ANALYZE image_tags;
+
+-- Facet counts, optionally restricted to some tag types (used by /api/facets)
+CREATE OR REPLACE FUNCTION image_tag_facets(
+  facet_types TEXT[] DEFAULT NULL,
+  limit_per_type INT DEFAULT 50
+)
+RETURNS TABLE (
+  tag_type TEXT,
+  tag_value TEXT,
+  frequency BIGINT
+)
+LANGUAGE SQL
+STABLE
+AS $$
+  SELECT tag_type, tag_value, frequency
+  FROM (
+    SELECT
+      tag_type,
+      tag_value,
+      COUNT(*) AS frequency,
+      ROW_NUMBER() OVER (PARTITION BY tag_type ORDER BY COUNT(*) DESC, tag_value) AS rank
+    FROM image_tags
+    WHERE facet_types IS NULL OR tag_type = ANY(facet_types)
+    GROUP BY tag_type, tag_value
+  ) ranked
+  WHERE rank <= limit_per_type
+  ORDER BY tag_type, frequency DESC, tag_value;
+$$;
+
+-- Popular tag views now read the normalized table instead of unnesting every row
+CREATE OR REPLACE VIEW popular_tags AS
+SELECT
+  tag_type,
+  tag_value,
+  COUNT(*) as frequency
+FROM image_tags
+GROUP BY tag_type, tag_value
+ORDER BY tag_type, frequency DESC;
+
+CREATE OR REPLACE VIEW popular_educational_tags AS
+SELECT
+  tag_type,
+  tag_value,
+  COUNT(*) as frequency
+FROM image_tags
+WHERE tag_type IN ('color', 'object', 'shape', 'letter', 'number', 'category', 'people', 'animal')
+GROUP BY tag_type, tag_value
+ORDER BY tag_type, frequency DESC;
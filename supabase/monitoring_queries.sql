@@ -86,6 +86,8 @@ SELECT
 
 -- 6. Failed Processing Detection
 -- Images uploaded but not analyzed (potential issues)
+-- The tags IS NULL part is served by idx_images_unanalyzed (analysis_queue.sql);
+-- app/analysis_worker.py picks these up through claim_unanalyzed_images()
 SELECT 
   id,
   image_name,
@@ -164,3 +166,19 @@ GROUP BY
   END,
   tags->>'textLanguage'
 ORDER BY count DESC;
+
+-- 11. Predicted vs Actual Vision Tokens (requires vision_budget.sql)
+-- prompt_tokens includes the text prompt, so the gap per detail mode is roughly
+-- constant; a growing gap means the tile model no longer matches billing
+SELECT 
+  vision_detail,
+  COUNT(*) as images,
+  ROUND(AVG(predicted_image_tokens)) as avg_predicted_image_tokens,
+  ROUND(AVG(prompt_tokens)) as avg_prompt_tokens,
+  ROUND(AVG(prompt_tokens - predicted_image_tokens)) as avg_gap
+FROM images 
+WHERE predicted_image_tokens IS NOT NULL
+  AND prompt_tokens IS NOT NULL
+  AND created_at > NOW() - INTERVAL '7 days'
+GROUP BY vision_detail
+ORDER BY vision_detail;
@@ -0,0 +1,22 @@
+-- Local pre-analysis of uploads (palette, background, item count, blank cards)
+-- Run this AFTER upload_tracking.sql
+--
+-- The backend measures each resized upload with Pillow (app/pre_analysis.py)
+-- and records the result here, keyed by the object name, before the object
+-- reaches Storage. The edge function copies it onto images.pre_analysis and
+-- follows vision_action: 'skip' (blank card) writes a minimal analysis from the
+-- measurements without calling the Vision API. 'low' is already applied to the
+-- upload's vision plan (upload_vision_plans.detail).
+
+CREATE TABLE IF NOT EXISTS upload_pre_analysis (
+  source_name TEXT PRIMARY KEY,
+  pre_analysis JSONB NOT NULL,
+  vision_action TEXT CHECK (vision_action IN ('skip', 'low')),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS pre_analysis JSONB;
+
+-- Like upload_vision_plans, rows are only needed until the webhook has run:
+-- DELETE FROM upload_pre_analysis WHERE created_at < now() - interval '7 days';
@@ -0,0 +1,16 @@
+-- Persisted, normalized question context
+-- Run this AFTER schema_update.sql, then run backfill_question_context.py
+--
+-- question_context holds the snake_case view of the tags that QuestionGenerator
+-- consumes, with default-valued fields omitted. question_context_version records
+-- which normalizer wrote it (see app/question_context.py) so rows can be
+-- back-filled after the shape changes.
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS question_context JSONB,
+  ADD COLUMN IF NOT EXISTS question_context_version SMALLINT;
+
+-- Lets the backfill find stale analyzed rows without scanning the whole table
+CREATE INDEX IF NOT EXISTS idx_images_question_context_version
+  ON images (question_context_version, id)
+  WHERE tags IS NOT NULL;
@@ -0,0 +1,51 @@
+-- Move raw OpenAI responses out of the hot images table
+-- Run this AFTER schema_update.sql (and after the edge function has been redeployed)
+--
+-- The edge function used to store the entire Vision API response in images.raw_json,
+-- which bloated every row read by the gallery, the analytics views and the
+-- monitoring queries. Raw responses now live in image_analysis_raw, trimmed to the
+-- model output and token usage, and the images row only keeps the parsed fields.
+
+-- Step 1: Cold table for raw analysis responses (one row per image)
+CREATE TABLE IF NOT EXISTS image_analysis_raw (
+  image_id UUID PRIMARY KEY REFERENCES images(id) ON DELETE CASCADE,
+  model TEXT,
+  content TEXT,
+  usage JSONB,
+  analysis_metadata JSONB,
+  created_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Large TOASTed values are compressed with lz4 where available (PG14+)
+DO $$
+BEGIN
+  ALTER TABLE image_analysis_raw ALTER COLUMN content SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+  RAISE NOTICE 'lz4 compression not available, keeping default pglz';
+END $$;
+
+-- Step 2: Copy existing responses across, trimmed to content + usage
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'images' AND column_name = 'raw_json') THEN
+    INSERT INTO image_analysis_raw (image_id, model, content, usage, analysis_metadata, created_at)
+    SELECT
+      id,
+      raw_json->>'model',
+      raw_json->'choices'->0->'message'->>'content',
+      raw_json->'usage',
+      raw_json->'analysisMetadata',
+      created_at
+    FROM images
+    WHERE raw_json IS NOT NULL
+    ON CONFLICT (image_id) DO NOTHING;
+
+    -- Step 3: Drop the column from the hot table
+    ALTER TABLE images DROP COLUMN raw_json;
+    RAISE NOTICE 'Moved raw_json into image_analysis_raw';
+  END IF;
+END $$;
+
+-- Step 4: Rewrite the table so sequential scans stop reading dead TOAST pointers.
+-- VACUUM cannot run inside a transaction block; run it on its own in the SQL editor.
+-- VACUUM FULL ANALYZE images;
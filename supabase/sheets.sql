@@ -0,0 +1,29 @@
+-- Flashcard sheets split into cards on upload
+-- Run this AFTER upload_tracking.sql
+--
+-- POST /upload/sheet splits one scanned sheet into rows x cols cards and
+-- uploads each card as its own object. Before the cards reach Storage the
+-- backend records which sheet and grid position each object name came from;
+-- the edge function copies that onto the card's images row, so cards from the
+-- same sheet can be grouped and shown in their original order.
+
+CREATE TABLE IF NOT EXISTS upload_sheet_cards (
+  source_name TEXT PRIMARY KEY,
+  sheet_id UUID NOT NULL,
+  sheet_position SMALLINT NOT NULL CHECK (sheet_position >= 0),
+  sheet_rows SMALLINT NOT NULL CHECK (sheet_rows > 0),
+  sheet_cols SMALLINT NOT NULL CHECK (sheet_cols > 0),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS sheet_id UUID,
+  ADD COLUMN IF NOT EXISTS sheet_position SMALLINT;
+
+-- Cards of one sheet, in reading order
+CREATE INDEX IF NOT EXISTS idx_images_sheet
+  ON images(sheet_id, sheet_position)
+  WHERE sheet_id IS NOT NULL;
+
+-- Like upload_vision_plans, rows are only needed until the webhook has run:
+-- DELETE FROM upload_sheet_cards WHERE created_at < now() - interval '7 days';
@@ -0,0 +1,13 @@
+-- Track which uploaded object each images row came from
+-- Run this AFTER schema_update.sql
+--
+-- The edge function renames uploads to <uuid>.<ext> before inserting the row,
+-- so the name the backend uploaded is otherwise lost. Asynchronous uploads
+-- (app/upload_jobs.py) look the row up by source_name to report analysis status.
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS source_name TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_images_source_name
+  ON images (source_name)
+  WHERE source_name IS NOT NULL;
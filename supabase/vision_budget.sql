@@ -0,0 +1,26 @@
+-- Token-budget resize plans for Vision analysis
+-- Run this AFTER upload_tracking.sql
+--
+-- The backend plans each upload's output size and detail mode from a token
+-- budget (app/vision_budget.py) and records the plan here, keyed by the object
+-- name it uploads, before the object reaches Storage. The edge function reads it
+-- when the upload webhook fires, sends the planned detail to the Vision API and
+-- copies the prediction onto the images row.
+
+CREATE TABLE IF NOT EXISTS upload_vision_plans (
+  source_name TEXT PRIMARY KEY,
+  width INTEGER NOT NULL,
+  height INTEGER NOT NULL,
+  detail TEXT NOT NULL CHECK (detail IN ('low', 'high')),
+  tiles INTEGER NOT NULL,
+  predicted_image_tokens INTEGER NOT NULL,
+  token_budget INTEGER NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE images
+  ADD COLUMN IF NOT EXISTS vision_detail TEXT,
+  ADD COLUMN IF NOT EXISTS predicted_image_tokens INTEGER;
+
+-- Plans are only needed until the webhook has run; prune old ones periodically:
+-- DELETE FROM upload_vision_plans WHERE created_at < now() - interval '7 days';
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# Checks for the analysis claim queue (supabase/analysis_queue.sql) against a
+# real Postgres. Point TEST_DATABASE_URL at a scratch database, e.g.
+#     TEST_DATABASE_URL=postgresql://postgres@localhost/postgres python test_analysis_queue.py
+# Everything is created in a throwaway schema that is dropped afterwards.
+import asyncio
+import os
+import unittest
+import uuid
+from datetime import timedelta
+
+import asyncpg
+
+QUEUE_SQL = os.path.join(os.path.dirname(__file__), 'supabase', 'analysis_queue.sql')
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# The columns of images the queue reads (see images_table.sql, schema_update.sql)
+IMAGES_TABLE = """
+CREATE TABLE images (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  image_name TEXT,
+  image_url TEXT,
+  tags JSONB,
+  created_at TIMESTAMPTZ DEFAULT now()
+)
+"""
+
+
+class QueueDatabase:
+    """Connections whose search_path is a fresh schema holding images and the queue functions"""
+
+    def __init__(self):
+        self.schema = f"analysis_queue_test_{uuid.uuid4().hex[:8]}"
+        self.connections = []
+
+    async def connect(self) -> asyncpg.Connection:
+        connection = await asyncpg.connect(TEST_DATABASE_URL, server_settings={"search_path": self.schema})
+        self.connections.append(connection)
+        return connection
+
+    async def __aenter__(self):
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await admin.execute(f"CREATE SCHEMA {self.schema}")
+        await admin.close()
+        connection = await self.connect()
+        await connection.execute(IMAGES_TABLE)
+        with open(QUEUE_SQL) as f:
+            await connection.execute(f.read())
+        return self
+
+    async def __aexit__(self, *exc):
+        for connection in self.connections:
+            await connection.close()
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await admin.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        await admin.close()
+
+
+def run(test):
+    """Run an async test body against a fresh queue schema"""
+    if not TEST_DATABASE_URL:
+        raise unittest.SkipTest("TEST_DATABASE_URL is not set")
+
+    async def main():
+        async with QueueDatabase() as db:
+            await test(db)
+
+    asyncio.run(main())
+
+
+async def add_images(connection, count: int, age: timedelta = timedelta(hours=1), analyzed: bool = False):
+    return [row["id"] for row in await connection.fetch(
+        "INSERT INTO images (image_name, tags, created_at) "
+        "SELECT 'img' || g || '.png', $2::jsonb, now() - $3::interval FROM generate_series(1, $1) g RETURNING id",
+        count, '{"category": "shapes"}' if analyzed else None, age
+    )]
+
+
+async def claim(connection, worker: str, limit: int = 10, **options):
+    args = ", ".join(f"{name} => ${i + 3}" for i, name in enumerate(options))
+    rows = await connection.fetch(
+        f"SELECT * FROM claim_unanalyzed_images(claim_limit => $1, worker_id => $2{', ' + args if args else ''})",
+        limit, worker, *options.values()
+    )
+    return {row["id"] for row in rows}
+
+
+def test_concurrent_claimers_get_disjoint_rows():
+    async def body(db):
+        setup = await db.connect()
+        ids = set(await add_images(setup, 20))
+        await add_images(setup, 3, analyzed=True)
+        await add_images(setup, 3, age=timedelta(0))  # still with the upload webhook
+
+        # A claim held open in a transaction is skipped, not waited on
+        holder = await db.connect()
+        transaction = holder.transaction()
+        await transaction.start()
+        held = await claim(holder, "holder", limit=5)
+        try:
+            other = await asyncio.wait_for(claim(await db.connect(), "other", limit=20), 5)
+        except asyncio.TimeoutError:
+            raise AssertionError("claim blocked on rows locked by another claimer")
+        await transaction.commit()
+        assert len(held) == 5 and len(other) == 15
+        assert not held & other and held | other == ids
+
+        # Many workers at once over fresh rows: every row goes to exactly one
+        fresh = set(await add_images(setup, 40))
+        workers = [await db.connect() for _ in range(8)]
+        claims = await asyncio.gather(*(claim(w, f"w{i}", limit=5) for i, w in enumerate(workers)))
+        assert sum(len(c) for c in claims) == len(fresh) == len(set().union(*claims))
+        assert set().union(*claims) == fresh
+
+    run(body)
+
+
+def test_expired_lease_is_reclaimed():
+    async def body(db):
+        connection = await db.connect()
+        image_id, = await add_images(connection, 1)
+        assert await claim(connection, "first", lease_seconds=300) == {image_id}
+        # A live lease is not handed out again
+        assert await claim(connection, "second", lease_seconds=300) == set()
+
+        await connection.execute(
+            "UPDATE images SET analysis_claimed_at = now() - interval '10 minutes' WHERE id = $1", image_id
+        )
+        assert await claim(connection, "second", lease_seconds=300) == {image_id}
+        row = await connection.fetchrow(
+            "SELECT analysis_claimed_by, analysis_claims FROM images WHERE id = $1", image_id
+        )
+        assert (row["analysis_claimed_by"], row["analysis_claims"]) == ("second", 2)
+
+        # Images that keep failing are given up after max_claims
+        await connection.execute(
+            "UPDATE images SET analysis_claimed_at = now() - interval '10 minutes' WHERE id = $1", image_id
+        )
+        assert await claim(connection, "third", lease_seconds=300, max_claims=2) == set()
+
+    run(body)
+
+
+def test_release_frees_the_row():
+    async def body(db):
+        connection = await db.connect()
+        image_id, = await add_images(connection, 1)
+        assert await claim(connection, "owner") == {image_id}
+
+        # Only the claiming worker (or anyone, with no worker_id) may release it
+        assert await connection.fetchval("SELECT release_image_claim($1, 'intruder')", image_id) is False
+        assert await claim(connection, "other") == set()
+        assert await connection.fetchval("SELECT release_image_claim($1, 'owner')", image_id) is True
+        assert await connection.fetchval(
+            "SELECT analysis_claimed_at IS NULL AND analysis_claimed_by IS NULL FROM images WHERE id = $1", image_id
+        )
+        assert await claim(connection, "other") == {image_id}
+        assert await connection.fetchval("SELECT release_image_claim($1)", image_id) is True
+
+    run(body)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            try:
+                test()
+            except unittest.SkipTest as e:
+                print(f"⏭️ {name}: {e}")
+                continue
+            print(f"✅ {name}")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Checks for near-duplicate hashing and the BK-tree (app/image_dedup.py)
+import random
+import sys
+import os
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from PIL import Image, ImageDraw
+
+from image_dedup import BKTree, dhash, from_signed, hamming, to_signed
+
+
+def near(value: int, bits: int, rng: random.Random) -> int:
+    """value with `bits` random bits flipped"""
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def build(rng: random.Random, count: int = 3000):
+    hashes = []
+    for _ in range(count):
+        # Clusters of near-duplicates among unrelated hashes, like real uploads
+        if hashes and rng.random() < 0.3:
+            hashes.append(near(rng.choice(hashes), rng.randint(0, 6), rng))
+        else:
+            hashes.append(rng.getrandbits(64))
+    tree = BKTree()
+    for index, value in enumerate(hashes):
+        tree.add(value, index)
+    return tree, hashes
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(7)
+    tree, hashes = build(rng)
+    assert len(tree) == len(hashes)
+    queries = [near(rng.choice(hashes), rng.randint(0, 8), rng) for _ in range(150)]
+    queries += [rng.getrandbits(64) for _ in range(50)]
+    for query in queries:
+        for radius in (0, 2, 4, 10):
+            found = tree.search(query, radius)
+            expected = sorted(
+                (hamming(query, value), index) for index, value in enumerate(hashes)
+                if hamming(query, value) <= radius
+            )
+            assert sorted(found) == expected, (query, radius)
+            # Nearest first, and every reported distance is real and within radius
+            assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+            assert all(distance == hamming(query, hashes[index]) <= radius for distance, index in found)
+
+
+def test_exact_duplicates_share_a_node():
+    tree = BKTree()
+    tree.add(42, "a")
+    tree.add(42, "b")
+    tree.add(43, "c")
+    assert sorted(tree.search(42, 0)) == [(0, "a"), (0, "b")]
+    assert tree.search(42, 1)[-1] == (1, "c")
+    assert len(tree) == 3
+    assert BKTree().search(42, 64) == []
+
+
+def test_dhash_survives_resaving():
+    image = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((50, 50, 200, 250), fill=(200, 20, 20))
+    draw.ellipse((220, 60, 380, 220), fill=(20, 40, 200))
+    resized = image.resize((200, 150), Image.Resampling.LANCZOS)
+    other = Image.new("RGB", (400, 300), "white")
+    ImageDraw.Draw(other).polygon([(200, 20), (380, 280), (20, 280)], fill=(20, 160, 40))
+    assert hamming(dhash(image), dhash(resized)) <= 4
+    assert hamming(dhash(image), dhash(other)) > 4
+
+
+def test_signed_round_trip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert from_signed(signed) == value
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
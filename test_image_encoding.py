@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Checks for the byte-budget Vision encoder (app/image_encoding.py)
+import io
+import sys
+import os
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from PIL import Image, ImageDraw, features
+
+import image_processing
+from image_encoding import CONTENT_TYPES, EXTENSIONS, encode_for_vision, ssim
+
+
+def flashcard() -> Image.Image:
+    """Few flat colours, like the cards the app is used for"""
+    image = Image.new("RGB", (384, 256), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, 160, 200), fill=(220, 30, 30))
+    draw.ellipse((200, 60, 340, 200), fill=(30, 60, 200))
+    draw.text((80, 210), "RED", fill="black")
+    return image
+
+
+def photo() -> Image.Image:
+    """Smooth gradients plus deterministic noise, so lossy formats have work to do"""
+    width, height = 256, 192
+    seed = 12345
+    pixels = bytearray()
+    for y in range(height):
+        for x in range(width):
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            noise = (seed >> 16) % 24
+            pixels += bytes(((x + noise) % 256, (y + noise) % 256, ((x + y) // 2 + noise) % 256))
+    return Image.frombytes("RGB", (width, height), bytes(pixels))
+
+
+def decoded_ssim(image: Image.Image, buffer: io.BytesIO) -> float:
+    with Image.open(io.BytesIO(buffer.getvalue())) as decoded:
+        return ssim(image.convert("L"), decoded.convert("L"))
+
+
+def check_result(image, buffer, info, min_ssim, target_bytes):
+    assert info["bytes"] == buffer.getbuffer().nbytes
+    assert info["content_type"] == CONTENT_TYPES[info["format"]]
+    assert info["extension"] == EXTENSIONS[info["format"]]
+    assert info["within_target"] == (info["bytes"] <= target_bytes)
+    with Image.open(io.BytesIO(buffer.getvalue())) as decoded:
+        assert decoded.format == info["format"]
+        assert decoded.size == image.size
+    if info["ssim"] is not None:
+        assert decoded_ssim(image, buffer) >= min_ssim
+
+
+def test_flat_card_meets_budget_and_ssim():
+    image = flashcard()
+    buffer, info = encode_for_vision(image, min_ssim=0.95, target_bytes=100 * 1024)
+    check_result(image, buffer, info, 0.95, 100 * 1024)
+    assert info["within_target"]
+    assert info["ssim"] >= 0.95
+
+
+def test_photo_meets_ssim_floor():
+    image = photo()
+    for min_ssim in (0.9, 0.95):
+        buffer, info = encode_for_vision(image, min_ssim=min_ssim, target_bytes=100 * 1024)
+        check_result(image, buffer, info, min_ssim, 100 * 1024)
+        assert info["ssim"] is not None and info["ssim"] >= min_ssim
+
+
+def test_smallest_candidate_wins():
+    image = photo()
+    formats = ["JPEG", "PNG"] + (["WEBP"] if features.check("webp") else [])
+    single = {fmt: encode_for_vision(image, formats=[fmt], min_ssim=0.95)[1] for fmt in formats}
+    _, info = encode_for_vision(image, formats=formats, min_ssim=0.95)
+    passing = [result["bytes"] for result in single.values() if result["ssim"] is not None]
+    assert info["bytes"] == min(passing)
+
+
+def test_over_budget_still_returns_smallest():
+    image = photo()
+    buffer, info = encode_for_vision(image, min_ssim=0.95, target_bytes=100)
+    check_result(image, buffer, info, 0.95, 100)
+    assert not info["within_target"]
+
+
+def test_format_fallback_order():
+    image = photo()
+    # Only the listed formats are tried...
+    _, info = encode_for_vision(image, formats=["PNG"], min_ssim=0.9)
+    assert info["format"] == "PNG"
+    # ...formats the Vision API can't take are ignored...
+    _, info = encode_for_vision(image, formats=["AVIF", "JPEG"], min_ssim=0.9)
+    assert info["format"] == "JPEG" and info["quality"] is not None
+    # ...and when nothing reaches the SSIM floor, JPEG at the fallback quality
+    buffer, info = encode_for_vision(image, min_ssim=1.01, fallback_quality=60)
+    assert (info["format"], info["quality"], info["ssim"]) == ("JPEG", 60, None)
+    check_result(image, buffer, info, 1.01, info["bytes"])
+    _, info = encode_for_vision(image, formats=["AVIF"], fallback_quality=60)
+    assert (info["format"], info["quality"]) == ("JPEG", 60)
+
+
+def test_browser_resized_upload_is_reencoded():
+    # What the upload page sends: a JPEG already within the target box, well
+    # under the pass-through byte limit
+    upload = io.BytesIO()
+    flashcard().save(upload, format="JPEG", quality=92)
+    encodes = []
+
+    def counting_encoder(*args, **kwargs):
+        encodes.append(args)
+        return encode_for_vision(*args, **kwargs)
+
+    original_encoder = image_processing.encode_for_vision
+    image_processing.encode_for_vision = counting_encoder
+    try:
+        prepared = image_processing.prepare_image_upload(upload, "card.jpg", derivatives={})
+        assert prepared["body"] is upload and not encodes  # an ordinary small JPEG passes through
+
+        prepared = image_processing.prepare_image_upload(
+            upload, "card" + image_processing.CLIENT_RESIZED_SUFFIX + ".jpg", derivatives={}
+        )
+    finally:
+        image_processing.encode_for_vision = original_encoder
+    assert prepared["body"] is not upload and len(encodes) == 1
+    assert prepared["body"].getbuffer().nbytes < upload.getbuffer().nbytes
+    assert prepared["content_type"] == CONTENT_TYPES[image_processing.detect_format(prepared["body"])]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Checks for the image-data caches and their invalidation (app/invalidation.py)
+import sys
+import os
+import time
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from invalidation import CacheRegistry, ImageDataCache
+
+A, B, C = "image-a", "image-b", "image-c"
+
+
+def test_version_and_etag_change_on_invalidate():
+    caches = CacheRegistry()
+    tag, etag = caches.tag, caches.etag("images", 50, None)
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert caches.etag("images", 50, None) == etag  # stable while nothing changes
+    assert caches.etag("images", 20, None) != etag
+
+    result = caches.invalidate([A])
+    assert result["version"] == caches.tag != tag
+    assert caches.etag("images", 50, None) != etag
+    caches.invalidate()
+    assert len({tag, result["version"], caches.tag}) == 3
+
+
+def test_etags_differ_between_processes():
+    assert CacheRegistry().etag("images") != CacheRegistry().etag("images")
+
+
+def test_invalidate_evicts_only_affected_entries():
+    caches = CacheRegistry()
+    rows = caches.cache("rows", ttl=60)
+    pages = caches.cache("pages", ttl=60)
+    rows.set(A, {"id": A}, [A])
+    rows.set(B, {"id": B}, [B])
+    pages.set("first", [A, B], [A, B])
+    pages.set("second", [C], [C])
+
+    result = caches.invalidate([A])
+    assert result["evicted"] == {"rows": 1, "pages": 1}
+    assert rows.get(A) is None and rows.get(B) == {"id": B}
+    assert pages.get("first") is None and pages.get("second") == [C]
+
+    result = caches.invalidate()
+    assert result["evicted"] == {"rows": 1, "pages": 1}
+    assert rows.get(B) is None and pages.get("second") is None
+
+
+def test_ttl_lru_and_disabled():
+    cache = ImageDataCache("rows", ttl=0.05, max_entries=2)
+    cache.set(A, 1, [A])
+    cache.set(B, 2, [B])
+    assert cache.get(A) == 1  # A is now the most recent
+    cache.set(C, 3, [C])
+    assert cache.get(B) is None and cache.get(A) == 1 and cache.get(C) == 3
+    time.sleep(0.06)
+    assert cache.get(A) is None and cache.get(C) is None
+    assert cache.stats()["entries"] == 0
+    # Dropped entries leave nothing behind in the per-image index
+    assert cache.evict_images([A, B, C]) == 0
+
+    disabled = ImageDataCache("off", ttl=0)
+    disabled.set(A, 1, [A])
+    assert disabled.get(A) is None
+
+
+def test_replacing_an_entry_retags_it():
+    cache = ImageDataCache("pages", ttl=60)
+    cache.set("first", [A, B], [A, B])
+    cache.set("first", [C], [C])
+    assert cache.evict_images([A]) == 0
+    assert cache.evict_images([C]) == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Checks for resumable chunked upload sessions (app/upload_sessions.py)
+import asyncio
+import os
+import sys
+import tempfile
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from upload_sessions import SessionError, UploadSessionManager
+
+DATA = bytes(range(256)) * 40  # 10,240 bytes
+
+
+async def chunks(*parts: bytes, fail_after: bool = False):
+    for part in parts:
+        yield part
+    if fail_after:
+        raise ConnectionError("client went away")
+
+
+def manager() -> UploadSessionManager:
+    return UploadSessionManager(tempfile.mkdtemp(prefix="upload-sessions-"), max_bytes=len(DATA) * 2)
+
+
+def expect_error(status_code: int, call, *args):
+    """Run call (sync or async) and return the SessionError it must raise"""
+    try:
+        result = call(*args)
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+    except SessionError as e:
+        assert e.status_code == status_code, (e.status_code, str(e))
+        return e
+    raise AssertionError(f"{call.__name__}{args} did not raise SessionError({status_code})")
+
+
+def test_create_validates_size():
+    sessions = manager()
+    expect_error(400, sessions.create, "a.png", "image/png", 0, {})
+    expect_error(413, sessions.create, "a.png", "image/png", len(DATA) * 2 + 1, {})
+    session = sessions.create("a.png", "image/png", len(DATA), {"detail": "low"})
+    assert sessions.get(session["upload_id"])["offset"] == 0
+    assert "settings" not in sessions.public(session)
+
+
+def test_offset_mismatch_is_409_with_current_offset():
+    sessions = manager()
+    upload_id = sessions.create("a.png", "image/png", len(DATA), {})["upload_id"]
+    asyncio.run(sessions.write(upload_id, 0, chunks(DATA[:1000])))
+    error = expect_error(409, sessions.write, upload_id, 0, chunks(DATA[:1000]))
+    assert error.offset == 1000
+    error = expect_error(409, sessions.write, upload_id, 5000, chunks(DATA[5000:6000]))
+    assert error.offset == 1000
+    assert sessions.get(upload_id)["offset"] == 1000
+
+
+def test_broken_stream_keeps_received_bytes():
+    sessions = manager()
+    upload_id = sessions.create("a.png", "image/png", len(DATA), {})["upload_id"]
+    try:
+        asyncio.run(sessions.write(upload_id, 0, chunks(DATA[:3000], DATA[3000:4000], fail_after=True)))
+    except ConnectionError:
+        pass
+    assert sessions.get(upload_id)["offset"] == 4000
+    session = asyncio.run(sessions.write(upload_id, 4000, chunks(DATA[4000:])))
+    assert session["offset"] == len(DATA)
+
+
+def test_chunk_past_declared_size_is_rejected():
+    sessions = manager()
+    upload_id = sessions.create("a.png", "image/png", len(DATA), {})["upload_id"]
+    asyncio.run(sessions.write(upload_id, 0, chunks(DATA[:10000])))
+    error = expect_error(413, sessions.write, upload_id, 10000, chunks(DATA[10000:] + b"extra"))
+    assert error.offset == 10000
+    # Nothing of the oversized chunk was written
+    assert sessions.get(upload_id)["offset"] == 10000
+
+
+def test_finalize_checks_final_length():
+    sessions = manager()
+    upload_id = sessions.create("a.png", "image/png", len(DATA), {})["upload_id"]
+    asyncio.run(sessions.write(upload_id, 0, chunks(DATA[:-1])))
+    error = expect_error(409, sessions.finalize, upload_id)
+    assert error.offset == len(DATA) - 1
+
+    asyncio.run(sessions.write(upload_id, len(DATA) - 1, chunks(DATA[-1:])))
+    session = asyncio.run(sessions.finalize(upload_id))
+    with open(session["spool_path"], "rb") as f:
+        assert f.read() == DATA
+    os.remove(session["spool_path"])
+    # The session is gone once claimed
+    expect_error(404, sessions.get, upload_id)
+    expect_error(404, sessions.finalize, upload_id)
+
+
+def test_unknown_or_malformed_ids_are_404():
+    sessions = manager()
+    for upload_id in ("0" * 32, "../../etc/passwd", ""):
+        expect_error(404, sessions.get, upload_id)
+        expect_error(404, sessions.write, upload_id, 0, chunks(b"x"))
+
+
+def test_metrics():
+    sessions = manager()
+    session = sessions.create("a.png", "image/png", len(DATA), {})
+    asyncio.run(sessions.write(session["upload_id"], 0, chunks(DATA)))
+    finalized = asyncio.run(sessions.finalize(session["upload_id"]))
+    sessions.record_result(finalized, True)
+    sessions.record_result(finalized, False)
+    abandoned = sessions.create("b.png", "image/png", 10, {})
+    sessions.abort(abandoned["upload_id"])
+    stats = sessions.stats()
+    assert (stats["completed"], stats["failed"], stats["abandoned"]) == (1, 1, 1)
+    assert stats["transfer_overhead"] == 1.0
+    assert stats["success_rate"] == round(1 / 3, 4)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Checks for the Vision token-budget resize planner (app/vision_budget.py)
+import sys
+import os
+
+# Add the app directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from vision_budget import (
+    BASE_TOKENS,
+    TOKENS_PER_TILE,
+    VISION_PRESETS,
+    plan_vision_resize,
+    resolve_vision_settings,
+    vision_image_tokens,
+    vision_resize_bounds,
+)
+
+SIZES = [(4000, 3000), (3000, 4000), (2000, 1000), (1024, 1024), (6000, 500), (500, 6000), (800, 600), (300, 200), (1, 1)]
+BUDGETS = [BASE_TOKENS + n * TOKENS_PER_TILE for n in (1, 2, 4, 6, 16)] + [600, 1000]
+
+
+def test_tile_counts():
+    """Token counts follow OpenAI's published tiling"""
+    assert vision_image_tokens(4000, 3000, "low") == (85, 0)
+    # 1024x1024 -> shortest side 768 -> 2x2 tiles
+    assert vision_image_tokens(1024, 1024) == (85 + 4 * 170, 4)
+    # 2048x4096 -> fit in 2048 (1024x2048) -> shortest side 768 (768x1536) -> 2x3 tiles
+    assert vision_image_tokens(2048, 4096) == (85 + 6 * 170, 6)
+    assert vision_image_tokens(512, 512) == (85 + 170, 1)
+    assert vision_image_tokens(513, 512) == (85 + 2 * 170, 2)
+
+
+def test_economy_is_the_classic_single_tile():
+    plan = plan_vision_resize((4000, 3000), BASE_TOKENS, "low")
+    assert (plan["width"], plan["height"]) == (512, 384)
+    assert plan["detail"] == "low"
+    assert plan["predicted_image_tokens"] == BASE_TOKENS
+
+
+def test_budget_fills_whole_tiles():
+    plan = plan_vision_resize((2000, 1000), BASE_TOKENS + 2 * TOKENS_PER_TILE, "auto")
+    assert (plan["width"], plan["height"]) == (1024, 512)
+    assert plan["detail"] == "high"
+    assert plan["tiles"] == 2
+    assert plan["predicted_image_tokens"] == BASE_TOKENS + 2 * TOKENS_PER_TILE
+
+
+def test_plans_stay_within_budget_and_never_upscale():
+    for size in SIZES:
+        for budget in BUDGETS:
+            for detail in ("auto", "high", "low"):
+                plan = plan_vision_resize(size, budget, detail)
+                assert plan["predicted_image_tokens"] <= budget, (size, budget, detail, plan)
+                assert plan["width"] <= max(size[0], 1) and plan["height"] <= max(size[1], 1), (size, budget, plan)
+                assert (plan["predicted_image_tokens"], plan["tiles"]) == vision_image_tokens(
+                    plan["width"], plan["height"], plan["detail"]
+                )
+                long_side, short_side = vision_resize_bounds(budget, detail)
+                assert max(plan["width"], plan["height"]) <= long_side, (size, budget, detail, plan)
+                if short_side is not None:
+                    assert min(plan["width"], plan["height"]) <= short_side, (size, budget, detail, plan)
+
+
+def test_auto_uses_low_detail_for_a_single_tile():
+    plan = plan_vision_resize((300, 200), BASE_TOKENS + 6 * TOKENS_PER_TILE, "auto")
+    assert (plan["width"], plan["height"], plan["detail"]) == (300, 200, "low")
+    assert plan_vision_resize((300, 200), BASE_TOKENS + 6 * TOKENS_PER_TILE, "high")["detail"] == "high"
+
+
+def test_resolve_vision_settings():
+    assert resolve_vision_settings(None, None, None) == (VISION_PRESETS["economy"]["token_budget"], "low")
+    assert resolve_vision_settings("detailed", None, None) == (VISION_PRESETS["detailed"]["token_budget"], "high")
+    assert resolve_vision_settings("standard", 1000, "low") == (1000, "low")
+    assert resolve_vision_settings(None, None, None, default_preset="standard")[1] == "auto"
+
+
+def test_resolve_vision_settings_rejects_bad_input():
+    for args in (("huge", None, None), (None, None, "medium"), (None, BASE_TOKENS - 1, None), (None, 0, None)):
+        try:
+            resolve_vision_settings(*args)
+        except ValueError:
+            continue
+        raise AssertionError(f"resolve_vision_settings{args} did not raise")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")